@@ -2,7 +2,9 @@
 from django.contrib import admin
 from django.core.exceptions import ValidationError
 from django.forms import ModelForm
+from .datasets import CROSS_REFERENCE, release_dataset
 from .models import PDFUpload, ExcelUpload, CrossReference
+from .utils import point_at_current_upload, rebuild_freight_coverage_reports
 import os
 
 class PDFUploadForm(ModelForm):
@@ -58,6 +60,16 @@ class PDFUploadAdmin(admin.ModelAdmin):
     has_extracted_data.boolean = True
     has_extracted_data.short_description = 'Data Extracted'
     
+    def delete_queryset(self, request, queryset):
+        file_types = set(queryset.values_list('file_type', flat=True))
+        periods = list(queryset.filter(
+            file_type__in=['stock_point_file', 'ex_work_file', 'freight_file']
+        ).values_list('month', 'year'))
+        super().delete_queryset(request, queryset)
+        for file_type in file_types:
+            point_at_current_upload(file_type)
+        rebuild_freight_coverage_reports(periods)
+    
     def get_readonly_fields(self, request, obj=None):
         if obj:  # editing an existing object
             return self.readonly_fields + ['extracted_data']
@@ -98,22 +110,30 @@ class ExcelUploadAdmin(admin.ModelAdmin):
     total_mappings.short_description = 'Total Mappings'
     
     def activate_selected(self, request, queryset):
-        # Deactivate all other files of the same type first
-        for obj in queryset:
-            ExcelUpload.objects.filter(file_type=obj.file_type).update(is_active=False)
-            obj.is_active = True
-            obj.save()
-        self.message_user(request, f"Activated {queryset.count()} files and deactivated others of the same type.")
-    activate_selected.short_description = "Activate selected files (deactivates others)"
+        # One active file per type: the most recently uploaded of the selection wins
+        activated = []
+        for file_type in queryset.order_by().values_list('file_type', flat=True).distinct():
+            obj = queryset.filter(file_type=file_type).order_by('-uploaded_at').first()
+            obj.activate()
+            activated.append(str(obj))
+        self.message_user(request, f"Activated {', '.join(activated)} and deactivated others of the same type.")
+    activate_selected.short_description = "Activate selected file (deactivates others)"
     
     def deactivate_selected(self, request, queryset):
+        upload_ids = list(queryset.values_list('id', flat=True))
         queryset.update(is_active=False)
-        self.message_user(request, f"Deactivated {queryset.count()} files.")
+        release_dataset(CROSS_REFERENCE, upload_ids)
+        self.message_user(request, f"Deactivated {len(upload_ids)} files.")
     deactivate_selected.short_description = "Deactivate selected files"
     
+    def delete_queryset(self, request, queryset):
+        upload_ids = list(queryset.values_list('id', flat=True))
+        super().delete_queryset(request, queryset)
+        release_dataset(CROSS_REFERENCE, upload_ids)
+    
     def get_readonly_fields(self, request, obj=None):
-        if obj:  # editing an existing object
-            return self.readonly_fields + ['extracted_data']
+        if obj:  # editing an existing object: its file is a published version
+            return self.readonly_fields + ['file', 'extracted_data']
         return self.readonly_fields
 
 @admin.register(CrossReference)
@@ -123,6 +143,17 @@ class CrossReferenceAdmin(admin.ModelAdmin):
     search_fields = ['gail_grade', 'competitor_name', 'competitor_grade', 'location']
     readonly_fields = ['created_at']
     
+    # Rows belong to an upload, which is an immutable version (as_of queries and diffs read it):
+    # mappings change by uploading a new file
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
     def get_queryset(self, request):
         # Show only cross-references from active uploads by default
         qs = super().get_queryset(request)
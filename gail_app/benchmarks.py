@@ -0,0 +1,331 @@
+"""
+Synthetic benchmarks for the extraction and query paths.
+
+Run with: python manage.py benchmark <name> [--rows N]
+"""
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+import pandas as pd
+from openpyxl import Workbook
+
+from .responses import clear_rendered_payloads
+from .utils import extract_cross_reference, extract_freight
+
+
+def measure(func, *args, **kwargs):
+    """
+    Return (result, seconds, peak traced memory in MB) for func.
+
+    func runs twice: once for the wall time and once under tracemalloc, whose
+    tracing overhead would otherwise dominate the timing. Extraction logging is
+    silenced so it does not skew either run.
+    """
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def write_freight_workbook(path, rows, sheets=1):
+    """
+    Write a synthetic freight workbook laid out like the SAP condition export.
+    """
+    workbook = Workbook(write_only=True)
+    valid_from = date(2025, 2, 1)
+    valid_to = valid_from + timedelta(days=27)
+    for sheet_index in range(sheets):
+        sheet = workbook.create_sheet(f"Plant {sheet_index + 1}")
+        sheet.append(["No", "CnTy", "Condition Type", "PL Number", "City", "Amount",
+                      "Unit", "Per", "UoM", "Valid From", "Valid To"])
+        sheet.append(["", "", "", "", "", "", "", "", "", "", ""])
+        for row in range(rows):
+            sheet.append([row + 1, "ZFRT", "Freight", f"PL{sheet_index:02d}", f"CITY {row:06d}",
+                          1000 + row % 2500, "INR", 1, "MT", valid_from, valid_to])
+    workbook.save(path)
+
+
+def legacy_extract_freight_excel(file_path):
+    """
+    The previous whole-sheet read + iterrows() parser, kept as the benchmark baseline.
+    """
+    data = pd.read_excel(file_path)
+    data.columns = [
+        "No", "CnTy", "Condition_Type", "PL_Number", "City", "Amount",
+        "Unit", "Per", "UoM", "Valid_From", "Valid_To"
+    ]
+    data = data.iloc[1:].reset_index(drop=True)
+    data = data.dropna(subset=["City", "Amount", "Unit", "Per", "UoM", "Valid_From", "Valid_To"]).reset_index(drop=True)
+    return {
+        row["City"]: {
+            "Amount": row["Amount"],
+            "Unit": row["Unit"],
+            "Per": row["Per"],
+            "UoM": row["UoM"],
+            "Valid_From": row["Valid_From"],
+            "Valid_To": row["Valid_To"],
+        }
+        for _, row in data.iterrows()
+    }
+
+
+def bench_freight_excel(rows=100_000):
+    """
+    Compare the legacy and column-pruned Excel freight parsers on a synthetic workbook.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'freight.xlsx')
+        write_freight_workbook(path, rows)
+
+        legacy, seconds, peak = measure(legacy_extract_freight_excel, path)
+        results.append({'parser': 'legacy (read_excel + iterrows)', 'rows': rows,
+                        'cities': len(legacy), 'seconds': round(seconds, 3), 'peak_mb': round(peak, 1)})
+
+        current, seconds, peak = measure(extract_freight, path)
+        results.append({'parser': 'column-pruned (extract_freight)', 'rows': rows,
+                        'cities': len(current), 'seconds': round(seconds, 3), 'peak_mb': round(peak, 1)})
+
+        multi_path = os.path.join(tmp_dir, 'freight_multi.xlsx')
+        write_freight_workbook(multi_path, rows // 4, sheets=4)
+        current, seconds, peak = measure(extract_freight, multi_path, sheet_name=None)
+        results.append({'parser': 'column-pruned, 4 sheets', 'rows': rows,
+                        'cities': len(current), 'seconds': round(seconds, 3), 'peak_mb': round(peak, 1)})
+    return results
+
+
+def write_cross_reference_workbook(path, rows, seed=0):
+    """
+    Write a synthetic cross-reference workbook: GAIL grade in column B, seven
+    competitors in E-K, plus properties and remarks columns the parser must skip.
+    """
+    rnd = random.Random(seed)
+    competitors = ["Reliance", "HPL", "IOCL", "BCPL", "OPAL", "HMEL", "Sabic"]
+    cells = ["", None, "No equivalent", "(blank)", "N/A", "nan"]
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Cross Reference")
+    sheet.append(["S.No", "GAIL Grade", "MFI", "Density"] + competitors + ["Application", "Remarks"])
+    for row in range(rows):
+        values = []
+        for _ in competitors:
+            roll = rnd.random()
+            if roll < 0.3:
+                values.append(rnd.choice(cells))
+            elif roll < 0.45:
+                delimiter = rnd.choice([", ", ";", " | ", "\n", "/"])
+                values.append(delimiter.join(f"{rnd.choice('HRLM')}{rnd.randint(100, 999)}MA" for _ in range(rnd.randint(2, 3))))
+            else:
+                values.append(f"{rnd.choice('HRLM')}{rnd.randint(100, 999)}MA")
+        sheet.append([row + 1, f"B{rnd.randint(10, 99)}A{rnd.randint(0, row // 10 + 50):05d}", 0.3, 0.95] + values
+                     + ["Film", "Synthetic row"])
+    workbook.save(path)
+
+
+def legacy_extract_cross_reference(file_path):
+    """
+    The previous full-sheet read + iterrows() cross-reference parser, kept as the
+    benchmark baseline (debug output removed).
+    """
+    df = pd.read_excel(file_path)
+    df.columns = df.columns.astype(str).str.strip()
+    df = df.dropna(how='all')
+    cross_reference_data = {"companies": [], "mappings": {},
+                            "metadata": {"total_companies": 0, "total_mappings": 0, "file_format": 'excel'}}
+    if df.empty or len(df.columns) < 5:
+        return cross_reference_data
+    gail_column = df.columns[1]
+    competitor_columns = [col.strip() for col in df.columns[4:11].tolist() if col.strip()]
+    cross_reference_data["companies"] = competitor_columns
+    cross_reference_data["metadata"]["total_companies"] = len(competitor_columns)
+    mappings_count = 0
+    for _, row in df.iterrows():
+        gail_grade = str(row[gail_column]).strip()
+        if pd.isna(row[gail_column]) or not gail_grade or gail_grade.lower() in ['nan', 'null', '', 'gail grade']:
+            continue
+        if gail_grade not in cross_reference_data["mappings"]:
+            cross_reference_data["mappings"][gail_grade] = {}
+        for competitor in competitor_columns:
+            competitor_grade = str(row[competitor]).strip()
+            if (pd.isna(row[competitor]) or not competitor_grade or
+                    competitor_grade.lower() in ['nan', 'null', '', 'no equivalent', '(blank)']):
+                continue
+            for delimiter in [',', ';', '|', '\n', '/']:
+                if delimiter in competitor_grade:
+                    competitor_grades = [grade.strip() for grade in competitor_grade.split(delimiter)]
+                    break
+            else:
+                competitor_grades = [competitor_grade]
+            competitor_grades = [
+                grade for grade in competitor_grades
+                if grade and grade.lower() not in ['nan', 'null', '', 'no equivalent', 'n/a', '(blank)']
+            ]
+            if competitor_grades:
+                cross_reference_data["mappings"][gail_grade][competitor] = competitor_grades
+                mappings_count += len(competitor_grades)
+    cross_reference_data["metadata"]["total_mappings"] = mappings_count
+    return cross_reference_data
+
+
+def bench_cross_reference(rows=50_000):
+    """
+    Compare the legacy and vectorized cross-reference parsers on a synthetic workbook.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'cross_reference.xlsx')
+        write_cross_reference_workbook(path, rows)
+
+        legacy, seconds, peak = measure(legacy_extract_cross_reference, path)
+        results.append({'parser': 'legacy (read_excel + iterrows)', 'rows': rows,
+                        'mappings': legacy['metadata']['total_mappings'], 'seconds': round(seconds, 3), 'peak_mb': round(peak, 1)})
+
+        current, seconds, peak = measure(extract_cross_reference, path)
+        results.append({'parser': 'vectorized (extract_cross_reference)', 'rows': rows,
+                        'mappings': current['metadata']['total_mappings'], 'seconds': round(seconds, 3), 'peak_mb': round(peak, 1),
+                        'same_output': current == legacy})
+    return results
+
+
+def pricing_document(locations, products=8, seed=0):
+    """
+    Build the extracted data of a synthetic stock point file: one item per location.
+    """
+    rnd = random.Random(seed)
+    return {'data': [
+        {'id': index + 1, 'sap_code': f"S{index:06d}", 'location': f"CITY {index:06d}",
+         'products': [{'product_code': f"G{product:03d}", 'price': rnd.randint(90000, 120000)} for product in range(products)]}
+        for index in range(locations)
+    ]}
+
+
+def freight_document(locations):
+    """
+    Build the extracted data of a synthetic freight file covering every other location.
+    """
+    return {
+        f"CITY {index:06d}": {'Amount': 1000.0 + index % 2500, 'Unit': 'INR', 'Per': 1, 'UoM': 'MT',
+                              'Valid_From': '2025-02-01', 'Valid_To': '2025-02-28'}
+        for index in range(0, locations, 2)
+    }
+
+
+# Longest a measured request may take before its process is killed
+RESPONSE_MEASURE_TIMEOUT = 600
+
+
+def measure_response(view, params, connection_results):
+    """
+    Call a view and read its whole response body, reporting to connection_results the
+    time to the first byte, the total time and the peak RSS growth in MB, or the error
+    the view raised.
+
+    Runs in a forked process, whose peak RSS starts at the parent's current RSS. The
+    rendered payload store is emptied first, so a buffered response is really rendered.
+    """
+    from django.test import RequestFactory
+    
+    try:
+        clear_rendered_payloads()
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            started = time.perf_counter()
+            response = view(RequestFactory().get('/', params))
+            if response.streaming:
+                chunks = iter(response.streaming_content)
+            else:
+                # DRF responses are rendered lazily; payload store responses are bytes already
+                if hasattr(response, 'render'):
+                    response.render()
+                chunks = iter([response.content])
+            size = len(next(chunks))
+            first_byte = time.perf_counter() - started
+            size += sum(len(chunk) for chunk in chunks)
+            elapsed = time.perf_counter() - started
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+        connection_results.send({'bytes': size, 'ttfb_ms': round(first_byte * 1000, 1),
+                                 'seconds': round(elapsed, 3), 'peak_rss_mb': round(peak / 1024, 1)})
+    except Exception as e:
+        connection_results.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        connection_results.close()
+
+
+def measure_response_in_process(context, view, params, timeout=RESPONSE_MEASURE_TIMEOUT):
+    """
+    Run measure_response in a new process of a multiprocessing context.
+
+    Returns:
+        dict: The measurements, or {'error': ...} if the view failed, the process died
+            or it did not report within timeout seconds
+    """
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=measure_response, args=(view, params, sender))
+    process.start()
+    # Only the child holds the sending end now, so its exit shows up as EOF
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            process.terminate()
+            return {'error': f"no result within {timeout}s"}
+        return receiver.recv()
+    except EOFError:
+        process.join()
+        return {'error': f"measuring process exited with code {process.exitcode}"}
+    finally:
+        process.join()
+        receiver.close()
+
+
+def bench_streaming(rows=10_000):
+    """
+    Compare buffered and streamed responses of the large export endpoints for a
+    synthetic period with rows locations, in a throwaway test database. Linux only:
+    each request runs in a forked process so that its peak RSS is its own.
+    """
+    from django.db import connection
+    from .models import PDFUpload
+    from .views import get_file_data, get_freight_data  # Import here to avoid circular imports
+    
+    results = []
+    old_name = connection.settings_dict['NAME']
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            PDFUpload.objects.create(file='pdfs/stock_point.pdf', file_type='stock_point_file', month='february',
+                                     year=2025, extracted_data=pricing_document(rows))
+            PDFUpload.objects.create(file='pdfs/freight.pdf', file_type='freight_file', month='february',
+                                     year=2025, extracted_data=freight_document(rows))
+        
+        context = multiprocessing.get_context('fork')
+        for endpoint, view, params in [
+            ('get_file_data', get_file_data, {'file_type': 'stock_point_file', 'month': 'february', 'year': 2025}),
+            ('get_freight_data', get_freight_data, {'month': 'february', 'year': 2025}),
+        ]:
+            for mode in ['buffered', 'streamed']:
+                result = measure_response_in_process(context, view, dict(params, stream=str(mode == 'streamed').lower()))
+                results.append({'endpoint': endpoint, 'mode': mode, 'locations': rows, **result})
+    finally:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    return results
+
+
+BENCHMARKS = {
+    'cross_reference': bench_cross_reference,
+    'freight_excel': bench_freight_excel,
+    'streaming': bench_streaming,
+}
@@ -0,0 +1,410 @@
+"""
+Process-local snapshots of the cross-reference mappings.
+
+The active mappings change about once a month, so each worker keeps them in
+memory as an immutable CrossReferenceSnapshot and rebuilds it only when the
+cross-reference dataset version changes (see datasets.py). Historical uploads,
+asked for with as_of, get snapshots of their own in the same LRU cache.
+Catalog endpoints read from the snapshot instead of running DISTINCT queries
+per request, and user-typed grades are resolved against its trigram index of
+the grade catalog.
+"""
+import bisect
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
+
+from django.conf import settings
+
+from .datasets import CROSS_REFERENCE, get_dataset_state
+from .utils import cross_reference_keys, load_archived_cross_references, normalize_key
+
+# A fuzzy (non-substring) grade match needs at least this trigram similarity
+FUZZY_GRADE_MIN_SIMILARITY = 0.5
+GRADE_SUGGESTIONS = 5
+
+# exact: the grade matched a catalog grade as typed; grade_keys/grades: the catalog
+# grades it resolved to, best first; suggestions: ranked catalog grades to offer the user
+GradeResolution = namedtuple('GradeResolution', ['exact', 'grade_keys', 'grades', 'suggestions'])
+
+
+def trigrams(key):
+    """Set of the 3-character substrings of a lookup key"""
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+class CrossReferenceSnapshot:
+    """Immutable view of one upload's cross-reference mappings at one dataset version"""
+    
+    __slots__ = ('version', 'upload_id', 'gail_grades', 'product_codes', 'mappings', 'grade_names', 'grade_keys', 'trigram_index', 'reverse_mappings')
+    
+    def __init__(self, version, rows, upload_id=None):
+        """
+        Args:
+            version: The dataset version the rows were read at
+            rows: (gail_grade, gail_grade_key, competitor_name, competitor_grade, is_valid) tuples
+            upload_id: The ExcelUpload the rows belong to
+        """
+        gail_grades = set()
+        product_codes = set()
+        grade_names = {}  # gail_grade_key -> gail_grade as first seen
+        mappings = {}  # gail_grade_key -> {competitor_name: [valid competitor grades]}
+        reverse_mappings = {}  # competitor_grade_key -> [(competitor_name, competitor_grade, gail_grade)]
+        
+        for gail_grade, gail_grade_key, competitor_name, competitor_grade, is_valid in rows:
+            gail_grades.add(gail_grade)
+            grade_names.setdefault(gail_grade_key, gail_grade)
+            competitors = mappings.setdefault(gail_grade_key, {})
+            if not is_valid:
+                continue
+            product_codes.add(gail_grade)
+            grades = competitors.setdefault(competitor_name, [])
+            if competitor_grade not in grades:
+                grades.append(competitor_grade)
+                reverse_mappings.setdefault(normalize_key(competitor_grade), []).append(
+                    (competitor_name, competitor_grade, gail_grade)
+                )
+        
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'upload_id', upload_id)
+        object.__setattr__(self, 'gail_grades', tuple(sorted(gail_grades)))
+        object.__setattr__(self, 'product_codes', tuple(sorted(product_codes)))
+        object.__setattr__(self, 'mappings', MappingProxyType({
+            gail_grade_key: MappingProxyType({
+                competitor_name: tuple(grades) for competitor_name, grades in competitors.items()
+            })
+            for gail_grade_key, competitors in mappings.items()
+        }))
+        
+        # Trigram -> grade keys containing it, for fuzzy resolution; sorted keys for short prefixes
+        trigram_index = {}
+        for gail_grade_key in grade_names:
+            for trigram in trigrams(gail_grade_key):
+                trigram_index.setdefault(trigram, []).append(gail_grade_key)
+        object.__setattr__(self, 'grade_names', MappingProxyType(grade_names))
+        object.__setattr__(self, 'grade_keys', tuple(sorted(grade_names)))
+        object.__setattr__(self, 'trigram_index', MappingProxyType({
+            trigram: tuple(keys) for trigram, keys in trigram_index.items()
+        }))
+        object.__setattr__(self, 'reverse_mappings', MappingProxyType({
+            competitor_grade_key: tuple(equivalents) for competitor_grade_key, equivalents in reverse_mappings.items()
+        }))
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('CrossReferenceSnapshot is immutable')
+    
+    def has_grade(self, grade):
+        """Whether the grade has any active cross-reference rows, valid or not"""
+        return normalize_key(grade) in self.mappings
+    
+    def competitor_mappings(self, grade):
+        """
+        Get the valid competitor mappings of a GAIL grade.
+
+        Returns:
+            Mapping: competitor name -> tuple of competitor grades, empty if the grade is unknown
+        """
+        return self.mappings.get(normalize_key(grade), MappingProxyType({}))
+    
+    def competitors_for_grade(self, grade):
+        """
+        Get the competitors with a valid mapping for a GAIL grade.
+
+        Returns:
+            list: Competitor names, sorted
+        """
+        return sorted(self.mappings.get(normalize_key(grade), ()))
+    
+    def competitors_for_grades(self, grade_keys):
+        """Competitor names with a valid mapping for any of the grade keys, sorted"""
+        competitors = set()
+        for grade_key in grade_keys:
+            competitors.update(self.mappings.get(grade_key, ()))
+        return sorted(competitors)
+    
+    def competitor_grades(self, grade_keys, competitor=None):
+        """
+        Get the valid competitor grades of the given GAIL grade keys, merged per competitor.
+
+        Args:
+            grade_keys: GAIL grade keys, e.g. GradeResolution.grade_keys
+            competitor: Only this competitor (matched on its normalized name)
+
+        Returns:
+            dict: competitor name -> list of competitor grades
+        """
+        competitor_key = normalize_key(competitor)
+        merged = {}
+        for grade_key in grade_keys:
+            for competitor_name, grades in self.mappings.get(grade_key, {}).items():
+                if competitor_key is not None and normalize_key(competitor_name) != competitor_key:
+                    continue
+                merged.setdefault(competitor_name, []).extend(grades)
+        return merged
+    
+    def gail_equivalents(self, competitor_grade, competitor=None):
+        """
+        Reverse lookup: the GAIL grades a competitor grade is mapped to.
+
+        Args:
+            competitor_grade: The competitor's grade as typed by the user
+            competitor: Only this competitor (matched on its normalized name)
+
+        Returns:
+            list: (competitor_name, competitor_grade, gail_grade) tuples
+        """
+        equivalents = self.reverse_mappings.get(normalize_key(competitor_grade), ())
+        if competitor is None:
+            return list(equivalents)
+        competitor_key = normalize_key(competitor)
+        return [equivalent for equivalent in equivalents if normalize_key(equivalent[0]) == competitor_key]
+    
+    def _rank_grades(self, grade_key):
+        """
+        Rank catalog grade keys against a lookup key.
+
+        Returns:
+            list: (grade key, is substring, similarity) tuples, best first
+        """
+        if len(grade_key) < 3:
+            # Too short for trigrams: prefix range of the sorted keys
+            start = bisect.bisect_left(self.grade_keys, grade_key)
+            end = bisect.bisect_left(self.grade_keys, grade_key + '\U0010ffff')
+            return [(key, True, len(grade_key) / len(key)) for key in self.grade_keys[start:end]]
+        
+        query_trigrams = trigrams(grade_key)
+        shared = {}
+        for trigram in query_trigrams:
+            for key in self.trigram_index.get(trigram, ()):
+                shared[key] = shared.get(key, 0) + 1
+        
+        ranked = []
+        for key, count in shared.items():
+            # Dice coefficient over the two trigram sets
+            similarity = 2 * count / (len(query_trigrams) + len(trigrams(key)))
+            is_substring = count == len(query_trigrams) and grade_key in key
+            ranked.append((key, is_substring, similarity))
+        ranked.sort(key=lambda match: (not match[1], -match[2], match[0]))
+        return ranked
+    
+    def resolve_grade(self, grade, suggestions=GRADE_SUGGESTIONS):
+        """
+        Resolve a user-typed GAIL grade to catalog grades in one step.
+
+        An exact (case- and whitespace-insensitive) match wins if that grade has valid
+        mappings. Otherwise the grade resolves to every catalog grade with valid mappings
+        containing it, or failing that to the most similar one by trigram similarity, if
+        similar enough.
+
+        Args:
+            grade: The grade as typed by the user
+            suggestions: Number of ranked suggestions to return when not exact
+
+        Returns:
+            GradeResolution: The resolved grades and suggestions
+        """
+        grade_key = normalize_key(grade) or ''
+        if self.mappings.get(grade_key):
+            return GradeResolution(True, (grade_key,), (self.grade_names[grade_key],), ())
+        if not grade_key:
+            return GradeResolution(False, (), (), ())
+        
+        # Grades whose rows are all invalid have nothing to resolve to
+        ranked = [match for match in self._rank_grades(grade_key) if self.mappings[match[0]]]
+        grade_keys = tuple(key for key, is_substring, _ in ranked if is_substring)
+        if not grade_keys and ranked and ranked[0][2] >= FUZZY_GRADE_MIN_SIMILARITY:
+            grade_keys = (ranked[0][0],)
+        
+        return GradeResolution(
+            False,
+            grade_keys,
+            tuple(self.grade_names[key] for key in grade_keys),
+            tuple(self.grade_names[key] for key, _, _ in ranked[:suggestions])
+        )
+
+
+class InvalidAsOf(ValueError):
+    """An as_of value that names no cross-reference upload"""
+
+
+def resolve_cross_reference_upload(as_of=None):
+    """
+    Resolve an as_of value to the cross-reference upload it names.
+
+    Args:
+        as_of: An ExcelUpload id, a YYYY-MM-DD date (the latest upload on or before
+               that day), or None for the active upload
+
+    Returns:
+        int: The ExcelUpload id, None if as_of is None and no upload is active
+
+    Raises:
+        InvalidAsOf: If as_of is malformed or names no cross-reference upload
+    """
+    version, active_id, _ = get_dataset_state(CROSS_REFERENCE)
+    if as_of is None or str(as_of).strip() == '':
+        return active_id
+    
+    as_of = str(as_of).strip()
+    if as_of.isdigit():
+        upload_id = int(as_of)
+        # An upload with a cached snapshot is known to exist
+        if (upload_id, version) not in _snapshots:
+            upload_id = _upload_as_of(None, upload_id, version)
+    else:
+        try:
+            as_of_date = datetime.strptime(as_of, '%Y-%m-%d').date()
+        except ValueError:
+            raise InvalidAsOf(f"as_of must be an upload id or a YYYY-MM-DD date, got {as_of!r}")
+        upload_id = _upload_as_of(as_of_date, None, version)
+    
+    if upload_id is None:
+        raise InvalidAsOf(f"No cross-reference upload found as of {as_of}")
+    return upload_id
+
+
+@lru_cache(maxsize=256)
+def _upload_as_of(as_of_date, upload_id, version):
+    # version only keys the cache: uploads and deletions bump it
+    from .models import ExcelUpload  # Import here to avoid circular imports
+    
+    uploads = ExcelUpload.objects.filter(file_type='cross_reference')
+    if upload_id is not None:
+        return uploads.filter(id=upload_id).values_list('id', flat=True).first()
+    return uploads.filter(
+        uploaded_at__date__lte=as_of_date
+    ).order_by('-uploaded_at').values_list('id', flat=True).first()
+
+
+# Snapshots of recently used uploads, the active one included: (upload id, dataset version) -> snapshot
+_snapshots = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_cross_reference_snapshot(upload_id=None):
+    """
+    Get this worker's snapshot of an upload's cross-reference mappings, building it if needed.
+
+    Snapshots are cached per (upload, dataset version) with LRU eviction, keeping up to
+    CROSS_REFERENCE_SNAPSHOT_CACHE_SIZE of them, so historical versions cost the same as
+    the active one once built.
+
+    Args:
+        upload_id: The ExcelUpload to read, e.g. from resolve_cross_reference_upload(); None for the active one
+
+    Returns:
+        CrossReferenceSnapshot: The snapshot
+    """
+    from .models import CrossReference, CrossReferenceArchive  # Import here to avoid circular imports
+    
+    version, active_id, _ = get_dataset_state(CROSS_REFERENCE)
+    if upload_id is None:
+        upload_id = active_id
+    key = (upload_id, version)
+    
+    with _lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is not None:
+            _snapshots.move_to_end(key)
+            return snapshot
+    
+    # Built outside the lock, so requests for other snapshots are not held up by the rows query.
+    # The state is read before the rows: a change landing in between only causes one more rebuild
+    rows = CrossReference.objects.filter(
+        excel_upload_id=upload_id
+    ).order_by('id').values_list('gail_grade', 'gail_grade_key', 'competitor_name', 'competitor_grade', 'is_valid')
+    if not upload_id:
+        rows = ()
+    elif CrossReferenceArchive.objects.filter(excel_upload_id=upload_id).exists():
+        # Compacted upload: read on demand from its archive
+        rows = [
+            (gail_grade, keys['gail_grade_key'], competitor_name, competitor_grade, keys['is_valid'])
+            for gail_grade, competitor_name, competitor_grade, _ in load_archived_cross_references(upload_id)
+            for keys in [cross_reference_keys(gail_grade, competitor_name, competitor_grade)]
+        ]
+    else:
+        rows = rows.iterator(chunk_size=5000)
+    snapshot = CrossReferenceSnapshot(version, rows, upload_id)
+    print(f"Cross-reference snapshot of upload {upload_id} v{version} built: {len(snapshot.mappings)} grades.")
+    
+    with _lock:
+        # Two requests may have built the same snapshot: keep the first one stored
+        stored = _snapshots.get(key)
+        if stored is not None:
+            _snapshots.move_to_end(key)
+            return stored
+        
+        # Built from a version another request has already moved past: serve it, don't store it
+        if any(cached_key[1] > version for cached_key in _snapshots):
+            return snapshot
+        
+        # Snapshots of older dataset versions can no longer be asked for
+        for stale_key in [cached_key for cached_key in _snapshots if cached_key[1] != version]:
+            del _snapshots[stale_key]
+        _snapshots[key] = snapshot
+        while len(_snapshots) > getattr(settings, 'CROSS_REFERENCE_SNAPSHOT_CACHE_SIZE', 8):
+            _snapshots.popitem(last=False)
+        return snapshot
+
+
+def _upload_mappings(upload_id):
+    """(gail_grade, competitor_name) -> frozenset of competitor grades, for one upload"""
+    from .models import CrossReference  # Import here to avoid circular imports
+    
+    rows = CrossReference.objects.filter(
+        excel_upload_id=upload_id
+    ).values_list('gail_grade', 'competitor_name', 'competitor_grade', 'location').iterator(chunk_size=5000)
+    grouped = {}
+    for gail_grade, competitor_name, competitor_grade, _ in rows:
+        grouped.setdefault((gail_grade, competitor_name), set()).add(competitor_grade)
+    if not grouped:
+        # Compacted upload: read on demand from its archive
+        for gail_grade, competitor_name, competitor_grade, _ in load_archived_cross_references(upload_id):
+            grouped.setdefault((gail_grade, competitor_name), set()).add(competitor_grade)
+    return {pair: frozenset(grades) for pair, grades in grouped.items()}
+
+
+@lru_cache(maxsize=32)
+def _diff_uploads(from_upload_id, to_upload_id, version):
+    # version only keys the cache: any cross-reference change (e.g. a re-upload) bumps it
+    old = _upload_mappings(from_upload_id)
+    new = _upload_mappings(to_upload_id)
+    
+    changes = {}
+    counts = {'added': 0, 'removed': 0, 'changed': 0}
+    for pair in new.keys() - old.keys():
+        changes[pair] = {'status': 'added', 'added_grades': sorted(new[pair]), 'removed_grades': []}
+    for pair in old.keys() - new.keys():
+        changes[pair] = {'status': 'removed', 'added_grades': [], 'removed_grades': sorted(old[pair])}
+    for pair in old.keys() & new.keys():
+        if old[pair] != new[pair]:
+            changes[pair] = {
+                'status': 'changed',
+                'added_grades': sorted(new[pair] - old[pair]),
+                'removed_grades': sorted(old[pair] - new[pair])
+            }
+    for change in changes.values():
+        counts[change['status']] += 1
+    counts['unchanged'] = len(old.keys() & new.keys()) - counts['changed']
+    # Sorted once here, not on every request served from the cache
+    return MappingProxyType(dict(sorted(changes.items()))), MappingProxyType(counts)
+
+
+def diff_cross_reference_uploads(from_upload_id, to_upload_id):
+    """
+    Compare the mappings of two cross-reference uploads per (GAIL grade, competitor).
+
+    Each upload's rows are grouped into hashed sets of competitor grades and the two
+    are compared with set operations; results are cached per dataset version.
+
+    Args:
+        from_upload_id: The older ExcelUpload id
+        to_upload_id: The newer ExcelUpload id
+
+    Returns:
+        tuple: ({(gail_grade, competitor_name): {'status', 'added_grades', 'removed_grades'}}
+                sorted by GAIL grade and competitor, {'added', 'removed', 'changed', 'unchanged'} mapping counts)
+    """
+    return _diff_uploads(from_upload_id, to_upload_id, get_dataset_state(CROSS_REFERENCE).version)
@@ -0,0 +1,125 @@
+"""
+Version counters and active-version pointers for datasets that each worker caches in memory.
+
+Each dataset has one DatasetVersion row: a change counter and, for versioned
+datasets such as the cross-reference uploads or the current pricing files, a
+pointer (target_id) to the active version. Writers call bump_dataset_version() whenever a dataset changes,
+or switch_dataset() to move the pointer; both take a single row update in one
+transaction. Readers resolve get_dataset_state() once per request and compare
+its version with the version their cache was built from, so a request in flight
+keeps using the version it started with.
+
+The state read is itself cached per worker for DATASET_VERSION_TTL seconds, so
+a request normally costs no SQL at all and other workers see a change within the
+TTL. Changes made by this worker invalidate its cached state immediately.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+CROSS_REFERENCE = 'cross_reference'
+
+# PDF file types whose current (most recent extracted) upload is kept as a dataset pointer,
+# keyed by the file type itself
+CURRENT_UPLOAD_FILE_TYPES = ['stock_point_file', 'ex_work_file', 'freight_file']
+
+# version: change counter, 0 if the dataset never changed; target_id: id of the active version, if any;
+# updated_at: time of the last change, None if the dataset never changed
+DatasetState = namedtuple('DatasetState', ['version', 'target_id', 'updated_at'])
+
+_checked_states = {}  # key -> (DatasetState, monotonic time it was read)
+_lock = threading.Lock()
+
+
+def _forget_state(key):
+    with _lock:
+        _checked_states.pop(key, None)
+
+
+def _update_dataset(key, **changes):
+    from .models import DatasetVersion  # Import here to avoid circular imports
+    
+    with transaction.atomic():
+        DatasetVersion.objects.get_or_create(key=key)
+        DatasetVersion.objects.filter(key=key).update(version=F('version') + 1, updated_at=timezone.now(), **changes)
+    
+    # Forget now and again once committed, so a read racing the enclosing transaction is not kept
+    _forget_state(key)
+    transaction.on_commit(lambda: _forget_state(key))
+
+
+def bump_dataset_version(key):
+    """
+    Record a change to a dataset, invalidating every worker's cache of it.
+
+    Args:
+        key: The dataset key, e.g. CROSS_REFERENCE
+    """
+    _update_dataset(key)
+
+
+def switch_dataset(key, target_id):
+    """
+    Atomically point a dataset at another active version (None for no active version).
+
+    Args:
+        key: The dataset key, e.g. CROSS_REFERENCE
+        target_id: Id of the version to activate, e.g. an ExcelUpload id
+    """
+    _update_dataset(key, target_id=target_id)
+
+
+def release_dataset(key, target_ids):
+    """
+    Clear the active-version pointer if it points at one of the given versions, e.g. ones being deleted.
+
+    Args:
+        key: The dataset key, e.g. CROSS_REFERENCE
+        target_ids: Ids of the versions going away
+    """
+    from .models import DatasetVersion  # Import here to avoid circular imports
+    
+    if DatasetVersion.objects.filter(key=key, target_id__in=list(target_ids)).exists():
+        switch_dataset(key, None)
+    else:
+        bump_dataset_version(key)
+
+
+def get_dataset_state(key, fresh=False):
+    """
+    Get the current version, active-version pointer and change time of a dataset, re-reading them at most once per DATASET_VERSION_TTL.
+
+    Args:
+        key: The dataset key, e.g. CROSS_REFERENCE
+        fresh: Skip the per-worker cache, e.g. when about to write
+
+    Returns:
+        DatasetState: The dataset's version, target_id and updated_at
+    """
+    from .models import DatasetVersion  # Import here to avoid circular imports
+    
+    now = time.monotonic()
+    checked = _checked_states.get(key)
+    if not fresh and checked and now - checked[1] < getattr(settings, 'DATASET_VERSION_TTL', 1.0):
+        return checked[0]
+    
+    row = DatasetVersion.objects.filter(key=key).values_list('version', 'target_id', 'updated_at').first()
+    state = DatasetState(*row) if row else DatasetState(0, None, None)
+    with _lock:
+        _checked_states[key] = (state, now)
+    return state
+
+
+def get_dataset_version(key):
+    """The current version of a dataset, see get_dataset_state()"""
+    return get_dataset_state(key).version
+
+
+def get_active_version_id(key):
+    """The id of the dataset's active version, or None, see get_dataset_state()"""
+    return get_dataset_state(key).target_id
@@ -0,0 +1,181 @@
+"""
+Location records of pricing uploads, as get_file_data serves them.
+
+When a stock point or ex-work upload is extracted (or gets freight merged in), each of
+its enriched location records is stored as a PricingLocation row (see
+save_derived_data). Requests filter those rows on their indexes: by location prefix
+and freight, and by product code and price through the PriceEntry index. They are
+paged with keyset cursors over the record position, so a page of 25 locations never
+reads the rest of the file, or read in chunks for streamed responses.
+
+Uploads whose derived data is not stored (see the rebuild_derived_data command) have
+their records derived in memory for the request, and filtered and paged the same way
+by page_records.
+"""
+import base64
+import json
+
+from .search import InvalidCursor
+from .utils import MAX_CHARACTER, normalize_key
+
+DEFAULT_FILE_DATA_LIMIT = 25
+MAX_FILE_DATA_LIMIT = 1000
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps([position]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        int: Position of the last location record of the previous page
+    """
+    try:
+        position, = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(position)
+    except (ValueError, TypeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+
+
+def filter_locations(upload_id, filters):
+    """
+    The PricingLocation rows of a pricing upload matching the filters.
+
+    Args:
+        upload_id: The PDFUpload
+        filters: location_prefix, product_code, min_price, max_price and has_freight; None values are ignored.
+            The price range applies to the product_code's price, or to any product's price without one.
+
+    Returns:
+        QuerySet: The matching rows, unordered
+    """
+    from .models import PriceEntry, PricingLocation  # Import here to avoid circular imports
+
+    locations = PricingLocation.objects.filter(pdf_upload_id=upload_id)
+    if filters.get('location_prefix'):
+        prefix = normalize_key(filters['location_prefix'])
+        locations = locations.filter(location_key__gte=prefix, location_key__lt=prefix + MAX_CHARACTER)
+    if filters.get('has_freight') is not None:
+        locations = locations.filter(has_freight=filters['has_freight'])
+
+    # Product and price filters select the locations through the PriceEntry index
+    price_entries = PriceEntry.objects.filter(pdf_upload_id=upload_id)
+    if filters.get('product_code'):
+        price_entries = price_entries.filter(product_code_key=normalize_key(filters['product_code']))
+    if filters.get('min_price') is not None:
+        price_entries = price_entries.filter(price__gte=filters['min_price'])
+    if filters.get('max_price') is not None:
+        price_entries = price_entries.filter(price__lte=filters['max_price'])
+    if filters.get('product_code') or filters.get('min_price') is not None or filters.get('max_price') is not None:
+        locations = locations.filter(position__in=price_entries.values('item_index'))
+    return locations
+
+
+def select_fields(record, fields):
+    return {key: record[key] for key in fields if key in record} if fields else record
+
+
+def query_location_records(upload_id, filters, cursor=None, limit=None, fields=None):
+    """
+    Filter and page the location records of a pricing upload, in file order.
+
+    Args:
+        upload_id: The PDFUpload
+        filters: See filter_locations
+        cursor: next_cursor of the previous page, if any
+        limit: Page size, None for every matching record
+        fields: Record keys to keep, None for whole records
+
+    Returns:
+        tuple: (records, next_cursor or None)
+    """
+    locations = filter_locations(upload_id, filters)
+    if cursor:
+        locations = locations.filter(position__gt=decode_cursor(cursor))
+    rows = locations.order_by('position').values_list('position', 'record')
+    rows = list(rows if limit is None else rows[:limit + 1])
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][0])
+
+    return [select_fields(record, fields) for position, record in rows], next_cursor
+
+
+def iter_location_records(upload_id, filters, cursor=None, fields=None):
+    """
+    Every location record of a pricing upload matching the filters, in file order,
+    read from the database in chunks as the generator is consumed.
+
+    Args:
+        upload_id: The PDFUpload
+        filters: See filter_locations
+        cursor: next_cursor of a previous page, to continue after it
+        fields: Record keys to keep, None for whole records
+
+    Returns:
+        generator: The records
+
+    Raises:
+        InvalidCursor: Right away rather than once the records are consumed
+    """
+    locations = filter_locations(upload_id, filters)
+    if cursor:
+        locations = locations.filter(position__gt=decode_cursor(cursor))
+    records = locations.order_by('position').values_list('record', flat=True)
+    return (select_fields(record, fields) for record in records.iterator(chunk_size=2000))
+
+
+def _product_matches(product, filters):
+    if filters.get('product_code') and normalize_key(str(product.get('product_code') or '')) != normalize_key(filters['product_code']):
+        return False
+    try:
+        price = float(product.get('price'))
+    except (ValueError, TypeError):
+        price = None
+    if filters.get('min_price') is not None and (price is None or price < filters['min_price']):
+        return False
+    if filters.get('max_price') is not None and (price is None or price > filters['max_price']):
+        return False
+    return True
+
+
+def record_matches(record, filters):
+    """Whether an enriched location record matches the filters of filter_locations"""
+    if filters.get('location_prefix'):
+        location_key = normalize_key(record.get('location') or record.get('location_grade') or '')
+        if not location_key.startswith(normalize_key(filters['location_prefix'])):
+            return False
+    if filters.get('has_freight') is not None and record['freight_status']['has_freight'] != filters['has_freight']:
+        return False
+    if filters.get('product_code') or filters.get('min_price') is not None or filters.get('max_price') is not None:
+        return any(_product_matches(product, filters) for product in record.get('products', []))
+    return True
+
+
+def page_records(records, filters, cursor=None, limit=None, fields=None):
+    """
+    Filter and page enriched location records held in memory, as query_location_records
+    does with the stored rows.
+
+    Args:
+        records: The records, in file order
+        filters, cursor, limit, fields: See query_location_records
+
+    Returns:
+        tuple: (records, next_cursor or None)
+    """
+    after = decode_cursor(cursor) if cursor else -1
+    matching = [
+        (position, record) for position, record in enumerate(records)
+        if position > after and record_matches(record, filters)
+    ]
+
+    next_cursor = None
+    if limit is not None and len(matching) > limit:
+        matching = matching[:limit]
+        next_cursor = encode_cursor(matching[-1][0])
+
+    return [select_fields(record, fields) for position, record in matching], next_cursor
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from gail_app.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Run one of the synthetic benchmarks in gail_app.benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS))
+        parser.add_argument('--rows', type=int, help="Size of the synthetic dataset")
+
+    def handle(self, *args, **options):
+        kwargs = {'rows': options['rows']} if options['rows'] else {}
+        for result in BENCHMARKS[options['name']](**kwargs):
+            self.stdout.write(", ".join(f"{key}={value}" for key, value in result.items()))
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gail_app.datasets import CROSS_REFERENCE, get_dataset_state
+from gail_app.models import CrossReferenceArchive, ExcelUpload
+from gail_app.utils import archive_cross_references, restore_cross_references
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the CrossReference rows of old inactive cross-reference uploads into compressed archives, "
+        "keeping the active upload and the most recent ones hot"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=getattr(settings, 'CROSS_REFERENCE_HOT_VERSIONS', 2),
+                            help="Most recent inactive uploads to keep hot, besides the active one")
+        parser.add_argument('--restore', type=int, metavar='UPLOAD_ID',
+                            help="Restore this upload's archived rows instead of compacting")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the uploads that would be archived")
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            upload = ExcelUpload.objects.filter(id=options['restore'], cross_reference_archive__isnull=False).first()
+            if not upload:
+                raise CommandError(f"Upload {options['restore']} has no archived cross-references")
+            restored = restore_cross_references(upload)
+            self.stdout.write(f"Restored {restored} cross-reference rows of upload {upload.id}.")
+            return
+        
+        active_id = get_dataset_state(CROSS_REFERENCE, fresh=True).target_id
+        inactive_uploads = ExcelUpload.objects.filter(
+            file_type='cross_reference',
+            cross_reference_archive__isnull=True
+        ).exclude(id=active_id).order_by('-uploaded_at')
+        cold_uploads = list(inactive_uploads[max(options['keep'], 0):])
+        
+        archived_rows = 0
+        for upload in cold_uploads:
+            if options['dry_run']:
+                self.stdout.write(f"Would archive upload {upload.id} ({upload.cross_references.count()} rows).")
+                continue
+            archived_rows += archive_cross_references(upload)
+        
+        if not options['dry_run']:
+            archive_count = CrossReferenceArchive.objects.count()
+            self.stdout.write(
+                f"Archived {archived_rows} cross-reference rows of {len(cold_uploads)} uploads "
+                f"({archive_count} uploads archived in total)."
+            )
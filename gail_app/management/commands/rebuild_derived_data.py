@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from gail_app.datasets import CURRENT_UPLOAD_FILE_TYPES, bump_dataset_version
+from gail_app.models import PDFUpload
+from gail_app.utils import PRICING_FILE_TYPES, save_derived_data, save_price_entries
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the price entries and derived data (get_file_data enrichment) of uploads that have none, "
+        "e.g. uploads ingested before they existed or whose ingest failed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild every upload, not only those without derived data")
+
+    def handle(self, *args, **options):
+        uploads = PDFUpload.objects.filter(extracted_data__isnull=False).order_by('uploaded_at')
+        if not options['all']:
+            uploads = uploads.filter(derived_data__isnull=True)
+        
+        rebuilt = 0
+        failed = []
+        file_types = set()
+        for upload in uploads:
+            try:
+                if upload.file_type in PRICING_FILE_TYPES:
+                    save_price_entries(upload)
+                save_derived_data(upload)
+                rebuilt += 1
+            except Exception as e:
+                self.stderr.write(f"Error rebuilding derived data of upload {upload.pk}: {e}")
+                failed.append(upload.pk)
+            file_types.add(upload.file_type)
+        
+        # Stored responses, ETags and worker caches were built from the old rows
+        for file_type in file_types & set(CURRENT_UPLOAD_FILE_TYPES):
+            bump_dataset_version(file_type)
+        self.stdout.write(f"Rebuilt derived data for {rebuilt} uploads.")
+        if failed:
+            self.stdout.write(f"Failed uploads: {failed}")
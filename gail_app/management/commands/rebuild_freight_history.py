@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from gail_app.datasets import bump_dataset_version
+from gail_app.models import PDFUpload
+from gail_app.utils import save_freight_history
+
+
+class Command(BaseCommand):
+    help = "Rebuild the FreightRate history from the extracted data of every freight upload"
+
+    def handle(self, *args, **options):
+        freight_files = PDFUpload.objects.filter(file_type='freight_file', extracted_data__isnull=False).order_by('uploaded_at')
+        skipped = []
+        try:
+            for freight_file in freight_files:
+                if save_freight_history(freight_file) is None:
+                    skipped.append(freight_file.pk)
+        finally:
+            # Stored freight-data responses, ETags and worker caches were built from the old history
+            bump_dataset_version('freight_file')
+        self.stdout.write(f"Rebuilt freight history for {freight_files.count() - len(skipped)} freight uploads.")
+        if skipped:
+            self.stdout.write(f"Skipped uploads without freight data: {skipped}")
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gail_app', '0006_alter_excelupload_file_alter_pdfupload_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FreightRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destination', models.CharField(max_length=255)),
+                ('destination_key', models.CharField(max_length=255)),
+                ('amount', models.FloatField()),
+                ('valid_from', models.DateField()),
+                ('valid_to', models.DateField()),
+                ('details', models.JSONField()),
+                ('pdf_upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='freight_rates', to='gail_app.pdfupload')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['destination_key', 'valid_from', 'valid_to'], name='gail_app_fr_destina_5d19b5_idx'), models.Index(fields=['valid_from', 'valid_to'], name='gail_app_fr_valid_f_31b65a_idx')],
+            },
+        ),
+    ]
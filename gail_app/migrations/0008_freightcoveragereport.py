@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gail_app', '0007_freightrate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FreightCoverageReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.CharField(choices=[('january', 'january'), ('february', 'february'), ('march', 'march'), ('april', 'april'), ('may', 'may'), ('june', 'june'), ('july', 'july'), ('august', 'august'), ('september', 'september'), ('october', 'october'), ('november', 'november'), ('december', 'december')], max_length=64)),
+                ('year', models.PositiveIntegerField()),
+                ('total_locations', models.PositiveIntegerField(default=0)),
+                ('locations_with_freight', models.PositiveIntegerField(default=0)),
+                ('locations_without_freight', models.PositiveIntegerField(default=0)),
+                ('coverage_percentage', models.FloatField(default=0)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+                ('freight_upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='freight_coverage_reports', to='gail_app.pdfupload')),
+            ],
+            options={
+                'unique_together': {('month', 'year')},
+            },
+        ),
+        migrations.CreateModel(
+            name='FreightCoverageLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=255)),
+                ('has_freight', models.BooleanField(default=False)),
+                ('freight_amount', models.FloatField(blank=True, null=True)),
+                ('freight_details', models.JSONField(blank=True, null=True)),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='locations', to='gail_app.freightcoveragereport')),
+            ],
+            options={
+                'ordering': ['location'],
+                'indexes': [models.Index(fields=['report', 'has_freight', 'location'], name='gail_app_fr_report__74f5f6_idx')],
+            },
+        ),
+    ]
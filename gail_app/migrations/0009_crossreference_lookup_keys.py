@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:16
+
+from django.db import migrations, models
+
+
+def backfill_lookup_keys(apps, schema_editor):
+    from gail_app.utils import cross_reference_keys
+
+    CrossReference = apps.get_model('gail_app', 'CrossReference')
+    batch = []
+    for row in CrossReference.objects.all().iterator(chunk_size=2000):
+        for field, value in cross_reference_keys(row.gail_grade, row.competitor_name, row.competitor_grade).items():
+            setattr(row, field, value)
+        batch.append(row)
+        if len(batch) >= 2000:
+            CrossReference.objects.bulk_update(batch, ['gail_grade_key', 'competitor_key', 'competitor_grade_key', 'is_valid'])
+            batch = []
+    if batch:
+        CrossReference.objects.bulk_update(batch, ['gail_grade_key', 'competitor_key', 'competitor_grade_key', 'is_valid'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gail_app', '0008_freightcoveragereport'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='crossreference',
+            name='gail_app_cr_gail_gr_ef2039_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='crossreference',
+            name='gail_app_cr_competi_b52c15_idx',
+        ),
+        migrations.AddField(
+            model_name='crossreference',
+            name='competitor_grade_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='crossreference',
+            name='competitor_key',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='crossreference',
+            name='gail_grade_key',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='crossreference',
+            name='is_valid',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(backfill_lookup_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='crossreference',
+            index=models.Index(fields=['gail_grade_key', 'competitor_key', 'is_valid', 'excel_upload'], name='crossref_grade_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='crossreference',
+            index=models.Index(fields=['competitor_key', 'competitor_grade_key', 'is_valid', 'excel_upload'], name='crossref_competitor_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Full-text search index over CrossReference (SQLite FTS5 only; see gail_app/search.py)
+
+from django.db import migrations
+
+CREATE_SEARCH_INDEX = [
+    """
+    CREATE VIRTUAL TABLE gail_app_crossreference_fts USING fts5(
+        gail_grade, competitor_name, competitor_grade, location,
+        content='gail_app_crossreference', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER gail_app_crossreference_fts_insert AFTER INSERT ON gail_app_crossreference BEGIN
+        INSERT INTO gail_app_crossreference_fts(rowid, gail_grade, competitor_name, competitor_grade, location)
+        VALUES (new.id, new.gail_grade, new.competitor_name, new.competitor_grade, new.location);
+    END
+    """,
+    """
+    CREATE TRIGGER gail_app_crossreference_fts_delete AFTER DELETE ON gail_app_crossreference BEGIN
+        INSERT INTO gail_app_crossreference_fts(gail_app_crossreference_fts, rowid, gail_grade, competitor_name, competitor_grade, location)
+        VALUES ('delete', old.id, old.gail_grade, old.competitor_name, old.competitor_grade, old.location);
+    END
+    """,
+    """
+    CREATE TRIGGER gail_app_crossreference_fts_update AFTER UPDATE OF gail_grade, competitor_name, competitor_grade, location ON gail_app_crossreference BEGIN
+        INSERT INTO gail_app_crossreference_fts(gail_app_crossreference_fts, rowid, gail_grade, competitor_name, competitor_grade, location)
+        VALUES ('delete', old.id, old.gail_grade, old.competitor_name, old.competitor_grade, old.location);
+        INSERT INTO gail_app_crossreference_fts(rowid, gail_grade, competitor_name, competitor_grade, location)
+        VALUES (new.id, new.gail_grade, new.competitor_name, new.competitor_grade, new.location);
+    END
+    """,
+    "INSERT INTO gail_app_crossreference_fts(gail_app_crossreference_fts) VALUES ('rebuild')",
+]
+
+DROP_SEARCH_INDEX = [
+    "DROP TRIGGER IF EXISTS gail_app_crossreference_fts_insert",
+    "DROP TRIGGER IF EXISTS gail_app_crossreference_fts_delete",
+    "DROP TRIGGER IF EXISTS gail_app_crossreference_fts_update",
+    "DROP TABLE IF EXISTS gail_app_crossreference_fts",
+]
+
+
+def fts5_trigram_available(connection):
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(value, tokenize='trigram')")
+            cursor.execute("DROP TABLE temp.fts5_probe")
+        except Exception:
+            return False
+    return True
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or not fts5_trigram_available(connection):
+        print("FTS5 trigram tokenizer unavailable: cross-reference search will use icontains filters.")
+        return
+    for statement in CREATE_SEARCH_INDEX:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SEARCH_INDEX:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gail_app', '0010_datasetversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:25
+
+from django.db import migrations, models
+
+
+def point_at_active_cross_reference(apps, schema_editor):
+    # The most recent file flagged active becomes the active version; older flags are cleared
+    ExcelUpload = apps.get_model('gail_app', 'ExcelUpload')
+    DatasetVersion = apps.get_model('gail_app', 'DatasetVersion')
+    active = ExcelUpload.objects.filter(file_type='cross_reference', is_active=True).order_by('-uploaded_at').first()
+    if active:
+        ExcelUpload.objects.filter(file_type='cross_reference', is_active=True).exclude(pk=active.pk).update(is_active=False)
+    dataset, _ = DatasetVersion.objects.get_or_create(key='cross_reference')
+    dataset.target_id = active.pk if active else None
+    dataset.version += 1
+    dataset.save()
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gail_app', '0011_crossreference_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='crossreference',
+            name='crossref_grade_lookup_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='crossreference',
+            name='crossref_competitor_idx',
+        ),
+        migrations.AddField(
+            model_name='datasetversion',
+            name='target_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='crossreference',
+            index=models.Index(fields=['excel_upload', 'gail_grade_key', 'competitor_key', 'is_valid'], name='crossref_grade_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='crossreference',
+            index=models.Index(fields=['excel_upload', 'competitor_key', 'competitor_grade_key', 'is_valid'], name='crossref_competitor_idx'),
+        ),
+        migrations.RunPython(point_at_active_cross_reference, migrations.RunPython.noop),
+    ]
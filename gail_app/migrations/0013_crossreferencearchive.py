@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gail_app', '0012_datasetversion_target'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrossReferenceArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('excel_upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cross_reference_archive', to='gail_app.excelupload')),
+            ],
+        ),
+    ]
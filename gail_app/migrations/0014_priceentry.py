@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_price_entries(apps, schema_editor):
+    from gail_app.utils import PRICING_FILE_TYPES, normalize_key
+
+    PDFUpload = apps.get_model('gail_app', 'PDFUpload')
+    PriceEntry = apps.get_model('gail_app', 'PriceEntry')
+
+    def number_or_none(value):
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            return None
+
+    for upload in PDFUpload.objects.filter(file_type__in=PRICING_FILE_TYPES, extracted_data__isnull=False).iterator():
+        pricing_data = upload.extracted_data
+        if not isinstance(pricing_data, dict) or 'error' in pricing_data:
+            continue
+        price_entries = []
+        for item_index, item in enumerate(pricing_data.get('data', [])):
+            location = item.get('location') or item.get('location_grade') or ''
+            for product_index, product in enumerate(item.get('products', [])):
+                product_code = str(product.get('product_code') or '')
+                price_entries.append(PriceEntry(
+                    pdf_upload_id=upload.id,
+                    file_type=upload.file_type,
+                    month=upload.month,
+                    year=upload.year,
+                    item_index=item_index,
+                    product_index=product_index,
+                    sap_code=item.get('sap_code'),
+                    location=location,
+                    location_key=normalize_key(location),
+                    product_code=product_code,
+                    product_code_key=normalize_key(product_code),
+                    price=number_or_none(product.get('price')),
+                    freight_amount=number_or_none(item.get('freight_amount'))
+                ))
+        PriceEntry.objects.bulk_create(price_entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gail_app', '0013_crossreferencearchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_type', models.CharField(choices=[('stock_point_file', 'STOCK POINT FILE'), ('freight_file', 'FREIGHT FILE'), ('ex_work_file', 'EX WORK FILE'), ('competitor_file', 'CROSS REFERENC FILE')], max_length=64)),
+                ('month', models.CharField(choices=[('january', 'january'), ('february', 'february'), ('march', 'march'), ('april', 'april'), ('may', 'may'), ('june', 'june'), ('july', 'july'), ('august', 'august'), ('september', 'september'), ('october', 'october'), ('november', 'november'), ('december', 'december')], max_length=64)),
+                ('year', models.PositiveIntegerField()),
+                ('item_index', models.PositiveIntegerField()),
+                ('product_index', models.PositiveIntegerField()),
+                ('sap_code', models.CharField(blank=True, max_length=64, null=True)),
+                ('location', models.CharField(max_length=255)),
+                ('location_key', models.CharField(max_length=255)),
+                ('product_code', models.CharField(max_length=100)),
+                ('product_code_key', models.CharField(max_length=100)),
+                ('price', models.FloatField(blank=True, null=True)),
+                ('freight_amount', models.FloatField(blank=True, null=True)),
+                ('pdf_upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_entries', to='gail_app.pdfupload')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pdf_upload', 'location_key', 'product_code_key'], name='price_location_idx'), models.Index(fields=['pdf_upload', 'product_code_key', 'price'], name='price_product_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_price_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:35
+
+from django.db import migrations
+
+
+def point_at_current_uploads(apps, schema_editor):
+    # The most recent extracted upload of each pricing/freight file type becomes its current version
+    PDFUpload = apps.get_model('gail_app', 'PDFUpload')
+    DatasetVersion = apps.get_model('gail_app', 'DatasetVersion')
+    for file_type in ['stock_point_file', 'ex_work_file', 'freight_file']:
+        current = PDFUpload.objects.filter(file_type=file_type, extracted_data__isnull=False).order_by('-uploaded_at').first()
+        dataset, _ = DatasetVersion.objects.get_or_create(key=file_type)
+        dataset.target_id = current.pk if current else None
+        dataset.version += 1
+        dataset.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gail_app', '0014_priceentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(point_at_current_uploads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:39
+
+from django.db import migrations, models
+
+
+def backfill_derived_data(apps, schema_editor):
+    from gail_app.utils import derive_file_data
+
+    PDFUpload = apps.get_model('gail_app', 'PDFUpload')
+    for upload in PDFUpload.objects.filter(extracted_data__isnull=False).iterator():
+        try:
+            derived_data = derive_file_data(upload.file_type, upload.extracted_data)
+        except Exception as e:
+            # Left empty: get_file_data derives it on the fly
+            print(f"Could not derive data of upload {upload.pk}: {e}")
+            continue
+        PDFUpload.objects.filter(pk=upload.pk).update(derived_data=derived_data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gail_app', '0015_current_upload_pointers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfupload',
+            name='derived_data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_derived_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_location_records(apps, schema_editor):
+    # The enriched location records of derived documents become PricingLocation rows
+    from gail_app.utils import normalize_key
+
+    PDFUpload = apps.get_model('gail_app', 'PDFUpload')
+    PricingLocation = apps.get_model('gail_app', 'PricingLocation')
+    for upload in PDFUpload.objects.filter(derived_data__has_key='document').iterator():
+        derived_data = upload.derived_data
+        location_records = derived_data['document'].get('data') or []
+        PricingLocation.objects.bulk_create([
+            PricingLocation(
+                pdf_upload_id=upload.pk,
+                position=position,
+                location_key=normalize_key(record.get('location') or record.get('location_grade') or ''),
+                has_freight=record['freight_status']['has_freight'],
+                record=record
+            )
+            for position, record in enumerate(location_records)
+        ], batch_size=1000)
+        derived_data['document']['data'] = None
+        PDFUpload.objects.filter(pk=upload.pk).update(derived_data=derived_data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gail_app', '0016_pdfupload_derived_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricingLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('location_key', models.CharField(max_length=255)),
+                ('has_freight', models.BooleanField(default=False)),
+                ('record', models.JSONField()),
+                ('pdf_upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pricing_locations', to='gail_app.pdfupload')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pdf_upload', 'location_key'], name='pricing_location_key_idx')],
+                'unique_together': {('pdf_upload', 'position')},
+            },
+        ),
+        migrations.RunPython(move_location_records, migrations.RunPython.noop),
+    ]
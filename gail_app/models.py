@@ -1,9 +1,10 @@
 
 from datetime import date
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 import os
-from .utils import get_stock_json, add_freight, extract_freight, extract_cross_reference, save_cross_reference_to_db, FILE_TYPE_MAPPING, MONTH_MAPPING
+from .datasets import CROSS_REFERENCE, CURRENT_UPLOAD_FILE_TYPES, bump_dataset_version, get_dataset_state, release_dataset, switch_dataset
+from .utils import get_stock_json, add_freight, extract_freight, extract_cross_reference, save_cross_reference_to_db, cross_reference_keys, restore_cross_references, save_freight_history, rebuild_freight_coverage_reports, save_price_entries, save_derived_data, point_at_current_upload, FILE_TYPE_MAPPING, MONTH_MAPPING, PRICING_FILE_TYPES
 
 def validate_pdf_file(value):
     """Validate that uploaded file is a PDF"""
@@ -20,11 +21,30 @@ def validate_excel_file(value):
 class PDFUpload(models.Model):
     file = models.FileField(upload_to='pdfs/', validators=[validate_pdf_file])
     extracted_data = models.JSONField(blank=True, null=True)  # Store the extracted data as JSON
+    derived_data = models.JSONField(blank=True, null=True)  # get_file_data enrichment of extracted_data, computed at ingest
     uploaded_at = models.DateTimeField(auto_now_add=True)  # Timestamp for the upload
     file_type = models.CharField(max_length=64, choices=FILE_TYPE_MAPPING.items(), blank=True, null=False)
     month = models.CharField(max_length=64, choices=MONTH_MAPPING.items(), blank=True, null=False)
     year = models.PositiveIntegerField(blank=True, default=date.today().year)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields():
+            # As loaded, so that save() can tell whether the current upload of the type may have moved
+            instance._loaded_pointer_fields = instance._pointer_fields()
+        return instance
+    
+    def _pointer_fields(self):
+        """The fields the file type's current-upload pointer and its period responses depend on"""
+        return {
+            'file': self.file.name,
+            'file_type': self.file_type,
+            'month': self.month,
+            'year': self.year,
+            'has_data': self.extracted_data is not None
+        }
+
     def clean(self):
         """Additional validation"""
         super().clean()
@@ -39,6 +59,7 @@ class PDFUpload(models.Model):
         is_new = self.pk is None
         add_freight_flag = kwargs.pop('add_freight_flag', False)
         update_fields = kwargs.get('update_fields')
+        loaded_pointer_fields = None if is_new else getattr(self, '_loaded_pointer_fields', None)
         
         # Call the parent save method first
         super().save(*args, **kwargs)
@@ -56,9 +77,25 @@ class PDFUpload(models.Model):
                     PDFUpload.objects.filter(pk=self.pk).update(extracted_data=self.extracted_data)
                     # Refresh the instance
                     self.refresh_from_db()
+                    
+                    # Keep the freight rate history in step with the freight file
+                    if self.file_type == "freight_file":
+                        save_freight_history(self)
             except Exception as e:
                 print(f"Error extracting data from {self.file.path}: {e}")
 
+        # Keep the price facts and the derived data in step with the file: extraction, merged freight and admin edits
+        if self.extracted_data and update_fields is None:
+            try:
+                if self.file_type in PRICING_FILE_TYPES:
+                    save_price_entries(self)
+                save_derived_data(self)
+            except Exception as e:
+                print(f"Error saving price entries and derived data of {self}: {e}")
+                # Whichever step failed, the stored derived data no longer matches the file
+                PDFUpload.objects.filter(pk=self.pk).update(derived_data=None)
+                self.derived_data = None
+
         # Check for the presence of all file types of the same month and year
         # Only do this for new uploads, not when updating extracted_data
         if is_new and not add_freight_flag and update_fields != ['extracted_data']:
@@ -68,6 +105,29 @@ class PDFUpload(models.Model):
                 ex_work_files = same_month_year_files.filter(file_type='ex_work_file')
                 if ex_work_files.exists():
                     add_freight(same_month_year_files)
+        
+        # Materialize the period's freight coverage when one of its freight or pricing files is added or edited
+        if self.file_type in ('stock_point_file', 'ex_work_file', 'freight_file') and not add_freight_flag and update_fields is None:
+            rebuild_freight_coverage_reports([(self.month, self.year)])
+        
+        # Keep the current-upload pointer of the file type (and the workers' caches) in step
+        pointer_fields = self._pointer_fields()
+        if pointer_fields != loaded_pointer_fields:
+            # A new upload, or another file, type or period: the current upload may have moved
+            point_at_current_upload(self.file_type)
+            if loaded_pointer_fields and loaded_pointer_fields['file_type'] != self.file_type:
+                point_at_current_upload(loaded_pointer_fields['file_type'])
+        elif self.file_type in CURRENT_UPLOAD_FILE_TYPES and (update_fields is None or {'extracted_data', 'derived_data'} & set(update_fields)):
+            # Same upload, new data: what the workers built from it must be rebuilt
+            bump_dataset_version(self.file_type)
+        self._loaded_pointer_fields = pointer_fields
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        point_at_current_upload(self.file_type)
+        if self.file_type in ('stock_point_file', 'ex_work_file', 'freight_file'):
+            rebuild_freight_coverage_reports([(self.month, self.year)])
+        return result
 
     def __str__(self):
         return f"{self.file_type} - {self.month}/{self.year}"
@@ -103,10 +163,14 @@ class ExcelUpload(models.Model):
         # Check if this is a new object
         is_new = self.pk is None
         
+        # Uploads are immutable versions (as_of queries and diffs read them): a new file is a new upload
+        if not is_new and self.file and not self.file._committed:
+            raise ValidationError({'file': 'The file of an existing upload cannot be replaced; upload it as a new file.'})
+        
         # Call the parent save method first
         super().save(*args, **kwargs)
         
-        # Perform data extraction after the record is saved (only for new objects)
+        # Perform data extraction after the record is saved
         if is_new and self.file and not self.extracted_data:
             try:
                 if self.file_type == "cross_reference":
@@ -117,15 +181,46 @@ class ExcelUpload(models.Model):
                         ExcelUpload.objects.filter(pk=self.pk).update(extracted_data=self.extracted_data)
                         # Refresh the instance
                         self.refresh_from_db()
-                    
-                        # If this is a new active cross-reference file, deactivate others
-                        if self.is_active:
-                            ExcelUpload.objects.filter(file_type='cross_reference', is_active=True).exclude(id=self.id).update(is_active=False)
                         
                         # Save cross-reference data to database for faster querying
-                        save_cross_reference_to_db(self)
+                        self.ingest_report = save_cross_reference_to_db(self)
             except Exception as e:
                 print(f"Error extracting data from {self.file.path}: {e}")
+        
+        if self.file_type == "cross_reference":
+            active_id = get_dataset_state(CROSS_REFERENCE, fresh=True).target_id
+            if self.is_active and self.extracted_data and active_id != self.pk:
+                # A new active cross-reference file replaces the active one, now that its rows are in
+                self.activate()
+            elif not self.is_active and active_id == self.pk:
+                switch_dataset(CROSS_REFERENCE, None)
+            else:
+                # A new inactive version, or the flags changed: invalidate the workers' snapshots
+                bump_dataset_version(CROSS_REFERENCE)
+    
+    def activate(self):
+        """
+        Make this the active file of its type, in one transaction. For cross-reference files
+        this switches the active-version pointer: requests already in flight finish on the
+        version they started with.
+        """
+        with transaction.atomic():
+            if self.file_type == "cross_reference":
+                if CrossReferenceArchive.objects.filter(excel_upload=self).exists():
+                    # A compacted upload gets its rows back before it serves lookups
+                    restore_cross_references(self)
+                switch_dataset(CROSS_REFERENCE, self.pk)
+            # Keep the is_active flags (admin list, get_excel_data) in step with the pointer
+            ExcelUpload.objects.filter(file_type=self.file_type, is_active=True).exclude(pk=self.pk).update(is_active=False)
+            ExcelUpload.objects.filter(pk=self.pk, is_active=False).update(is_active=True)
+        self.is_active = True
+    
+    def delete(self, *args, **kwargs):
+        upload_id = self.pk
+        result = super().delete(*args, **kwargs)
+        if self.file_type == "cross_reference":
+            release_dataset(CROSS_REFERENCE, [upload_id])
+        return result
     
     def __str__(self):
         return f"{self.file_type} - {self.uploaded_at.strftime('%Y-%m-%d %H:%M')}"
@@ -141,12 +236,157 @@ class CrossReference(models.Model):
     excel_upload = models.ForeignKey(ExcelUpload, on_delete=models.CASCADE, related_name='cross_references')
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Trimmed, case-folded lookup keys and the "has a real mapping" flag, set at ingest
+    gail_grade_key = models.CharField(max_length=100, default='')
+    competitor_key = models.CharField(max_length=100, default='')
+    competitor_grade_key = models.CharField(max_length=100, blank=True, null=True)
+    is_valid = models.BooleanField(default=True)
+    
     class Meta:
         unique_together = ['gail_grade', 'competitor_name', 'competitor_grade', 'excel_upload']
         indexes = [
-            models.Index(fields=['gail_grade', 'competitor_name']),
-            models.Index(fields=['competitor_name', 'competitor_grade']),
+            models.Index(fields=['excel_upload', 'gail_grade_key', 'competitor_key', 'is_valid'], name='crossref_grade_lookup_idx'),
+            models.Index(fields=['excel_upload', 'competitor_key', 'competitor_grade_key', 'is_valid'], name='crossref_competitor_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        for field, value in cross_reference_keys(self.gail_grade, self.competitor_name, self.competitor_grade).items():
+            setattr(self, field, value)
+        super().save(*args, **kwargs)
+        # Rows saved outside an upload (ingest bulk-creates): the workers' snapshots and ETags must change
+        bump_dataset_version(CROSS_REFERENCE)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_dataset_version(CROSS_REFERENCE)
+        return result
+    
+    def __str__(self):
+        return f"{self.gail_grade} -> {self.competitor_name}: {self.competitor_grade}"
+
+class CrossReferenceArchive(models.Model):
+    """Cold storage of an inactive upload's CrossReference rows: one compressed blob per upload"""
+    
+    excel_upload = models.OneToOneField(ExcelUpload, on_delete=models.CASCADE, related_name='cross_reference_archive')
+    row_count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()  # zlib-compressed JSON list of [gail_grade, competitor_name, competitor_grade, location]
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Archive of {self.excel_upload}: {self.row_count} rows"
+
+class PriceEntry(models.Model):
+    """One product price at one location of a stock point or ex-work upload, for indexed lookups"""
+    
+    pdf_upload = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name='price_entries')
+    file_type = models.CharField(max_length=64, choices=FILE_TYPE_MAPPING.items())  # Source: stock point or ex-work
+    month = models.CharField(max_length=64, choices=MONTH_MAPPING.items())
+    year = models.PositiveIntegerField()
+    item_index = models.PositiveIntegerField()  # Position of the location item in extracted_data['data']
+    product_index = models.PositiveIntegerField()  # Position of the product in the item's products
+    sap_code = models.CharField(max_length=64, blank=True, null=True)
+    location = models.CharField(max_length=255)  # Location as it appears in the pricing file
+    location_key = models.CharField(max_length=255)  # Trimmed, case-folded location for lookups
+    product_code = models.CharField(max_length=100)
+    product_code_key = models.CharField(max_length=100)  # Trimmed, case-folded product code for lookups
+    price = models.FloatField(blank=True, null=True)
+    freight_amount = models.FloatField(blank=True, null=True)  # Freight merged into the location, if any
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['pdf_upload', 'location_key', 'product_code_key'], name='price_location_idx'),
+            models.Index(fields=['pdf_upload', 'product_code_key', 'price'], name='price_product_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.location} {self.product_code}: {self.price} ({self.file_type} {self.month}/{self.year})"
+
+
+class PricingLocation(models.Model):
+    """One enriched location record of a stock point or ex-work upload, as get_file_data serves it"""
+    
+    pdf_upload = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name='pricing_locations')
+    position = models.PositiveIntegerField()  # Position in extracted_data['data'], PriceEntry.item_index
+    location_key = models.CharField(max_length=255)  # Trimmed, case-folded location for prefix filters
+    has_freight = models.BooleanField(default=False)
+    record = models.JSONField()  # The location record with its freight_status and price_summary
+    
+    class Meta:
+        unique_together = ['pdf_upload', 'position']
+        indexes = [
+            models.Index(fields=['pdf_upload', 'location_key'], name='pricing_location_key_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.record.get('location')} ({self.pdf_upload})"
+
+
+class FreightRate(models.Model):
+    """Freight rate history: one row per destination per freight upload, with its validity interval"""
+    
+    destination = models.CharField(max_length=255)  # Destination as it appears in the freight file
+    destination_key = models.CharField(max_length=255)  # Trimmed, upper-cased destination for lookups
+    amount = models.FloatField()
+    valid_from = models.DateField()
+    valid_to = models.DateField()
+    details = models.JSONField()  # The full freight record as extracted
+    pdf_upload = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name='freight_rates')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['destination_key', 'valid_from', 'valid_to']),
+            models.Index(fields=['valid_from', 'valid_to']),
         ]
     
     def __str__(self):
-        return f"{self.gail_grade} -> {self.competitor_name}: {self.competitor_grade}"
\ No newline at end of file
+        return f"{self.destination}: {self.amount} ({self.valid_from} - {self.valid_to})"
+
+
+class FreightCoverageReport(models.Model):
+    """Freight coverage of a period's pricing locations, computed when freight is merged"""
+    
+    month = models.CharField(max_length=64, choices=MONTH_MAPPING.items())
+    year = models.PositiveIntegerField()
+    freight_upload = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name='freight_coverage_reports')
+    total_locations = models.PositiveIntegerField(default=0)
+    locations_with_freight = models.PositiveIntegerField(default=0)
+    locations_without_freight = models.PositiveIntegerField(default=0)
+    coverage_percentage = models.FloatField(default=0)
+    generated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['month', 'year']
+    
+    def __str__(self):
+        return f"Freight coverage {self.month}/{self.year}: {self.coverage_percentage}%"
+
+
+class FreightCoverageLocation(models.Model):
+    """Freight match of a single pricing location within a FreightCoverageReport"""
+    
+    report = models.ForeignKey(FreightCoverageReport, on_delete=models.CASCADE, related_name='locations')
+    location = models.CharField(max_length=255)
+    has_freight = models.BooleanField(default=False)
+    freight_amount = models.FloatField(blank=True, null=True)
+    freight_details = models.JSONField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['location']
+        indexes = [
+            models.Index(fields=['report', 'has_freight', 'location']),
+        ]
+    
+    def __str__(self):
+        return f"{self.location}: {'matched' if self.has_freight else 'unmatched'}"
+
+
+class DatasetVersion(models.Model):
+    """Change counter and active-version pointer of a dataset that workers cache in memory"""
+    
+    key = models.CharField(max_length=64, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    target_id = models.BigIntegerField(blank=True, null=True)  # Active version of the dataset, e.g. an ExcelUpload id
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.key} v{self.version}"
@@ -0,0 +1,114 @@
+"""
+Process-local location indexes of the current stock point and ex-work files.
+
+Location queries used to scan extracted_data['data'] of the latest pricing file on
+every request, normalizing each item's location as they went. Each worker now keeps
+one immutable PricingIndex per file type, built from the location items of the current
+upload (see the current-upload pointers in datasets.py) and rebuilt lazily the first
+time it is asked for after the file type's dataset version changes, i.e. after a new
+upload or a freight merge. Items keep the shape they were extracted with: items without
+products are listed, and freight amounts and prices are the extracted values.
+"""
+import threading
+from types import MappingProxyType
+
+from .datasets import get_dataset_state
+from .utils import normalize_key, pricing_item_location
+
+
+class PricingIndex:
+    """Immutable location index of one pricing upload at one dataset version"""
+    
+    __slots__ = ('version', 'upload_id', 'extraction_failed', 'locations', 'items_by_location', 'prices')
+    
+    def __init__(self, version, upload_id, items, file_type, extraction_failed=False):
+        """
+        Args:
+            version: The file type's dataset version the items were read at
+            upload_id: The PDFUpload the items belong to, None if the file type has no upload
+            items: The upload's location items (extracted_data['data']), in file order
+            file_type: 'stock_point_file' or 'ex_work_file', for the location of each item
+            extraction_failed: Whether the upload's extraction failed
+        """
+        indexed_items = [
+            {
+                'sap_code': item.get('sap_code'),
+                'location': pricing_item_location(item, file_type),
+                'freight_amount': item.get('freight_amount'),
+                'products': tuple(item.get('products') or ())
+            }
+            for item in items
+        ]
+        
+        items_by_location = {}  # location key -> items at the location (one per SAP code)
+        prices = {}  # (location key, product code key) -> price in the location's first item, first match
+        for item in indexed_items:
+            if not item['location']:
+                continue
+            location_key = normalize_key(item['location'])
+            location_items = items_by_location.setdefault(location_key, [])
+            if not location_items:
+                for product in item['products']:
+                    prices.setdefault((location_key, normalize_key(product.get('product_code') or '')), product.get('price'))
+            location_items.append(item)
+        
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'upload_id', upload_id)
+        object.__setattr__(self, 'extraction_failed', extraction_failed)
+        object.__setattr__(self, 'locations', tuple(item['location'] for item in indexed_items))
+        object.__setattr__(self, 'items_by_location', MappingProxyType({
+            location_key: tuple(location_items) for location_key, location_items in items_by_location.items()
+        }))
+        object.__setattr__(self, 'prices', MappingProxyType(prices))
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('PricingIndex is immutable')
+    
+    def items_at(self, location):
+        """The location's items (one per SAP code) in file order, matched trimmed and case-insensitively"""
+        return self.items_by_location.get(normalize_key(location), ())
+    
+    def location_record(self, location):
+        """The location's first item, or None if the location is not in the file"""
+        location_items = self.items_at(location)
+        return location_items[0] if location_items else None
+    
+    def price(self, location, product_code):
+        """Price of a product in the location's first item, or None"""
+        return self.prices.get((normalize_key(location), normalize_key(product_code)))
+
+
+_indexes = {}  # file type -> PricingIndex of its current upload
+_lock = threading.Lock()
+
+
+def get_pricing_index(file_type):
+    """
+    Get this worker's location index of a file type's current upload, building it if needed.
+    
+    Args:
+        file_type: 'stock_point_file' or 'ex_work_file'
+    
+    Returns:
+        PricingIndex: The index
+    """
+    from .models import PDFUpload  # Import here to avoid circular imports
+    
+    version, upload_id, _ = get_dataset_state(file_type)
+    index = _indexes.get(file_type)
+    if index is not None and index.version == version:
+        return index
+    
+    with _lock:
+        index = _indexes.get(file_type)
+        if index is not None and index.version == version:
+            return index
+        
+        # The state is read before the data: a change landing in between only causes one more rebuild
+        pricing_data = PDFUpload.objects.filter(pk=upload_id).values_list('extracted_data', flat=True).first() if upload_id else None
+        extraction_failed = isinstance(pricing_data, dict) and 'error' in pricing_data
+        items = pricing_data.get('data', []) if isinstance(pricing_data, dict) and not extraction_failed else []
+        index = PricingIndex(version, upload_id, items, file_type, extraction_failed)
+        print(f"Pricing index of {file_type} upload {upload_id} v{version} built: {len(index.items_by_location)} locations.")
+        _indexes[file_type] = index
+        return index
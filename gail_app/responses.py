@@ -0,0 +1,274 @@
+"""
+Rendered response bodies of the period endpoints, kept per worker.
+
+Responses of file-data, freight-data, excel-data and locations only change when a file
+is uploaded, merged or deleted, yet each request used to read the JSON documents,
+rebuild the response dicts, render them with DRF and compress them again. Each worker
+now keeps the rendered body of each (endpoint, query parameters), with the versions of
+the datasets it was built from (see datasets.py), and its gzip and brotli variants once
+asked for. They are served as raw bytes with the matching Content-Encoding, without
+going through DRF rendering. An upload changes the dataset versions, so the next
+request renders the response again.
+
+Brotli is used when the brotli package is installed.
+
+The same dataset versions give the read endpoints strong ETags and Last-Modified
+dates (see condition_on_datasets), so polling clients and proxies get a 304 without
+the request reading any upload.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .datasets import get_dataset_state
+
+try:
+    import brotli  # Optional: smaller than gzip for JSON
+except ImportError:
+    brotli = None
+
+# Query parameters that change how a response is sent, not what it contains
+TRANSPORT_PARAMS = {'stream'}
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=9)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+class RenderedPayload:
+    """A rendered response body and its compressed variants"""
+
+    def __init__(self, key, version, body):
+        """
+        Args:
+            key: (endpoint, query parameters) the body answers
+            version: Versions of the datasets the body was built from
+            body: The JSON bytes
+        """
+        self.key = key
+        self.version = version
+        self.variants = {'identity': body}
+        self.size = len(body)
+
+
+_payloads = OrderedDict()  # (endpoint, params) -> RenderedPayload, least recently used first
+_payloads_size = 0
+_lock = threading.Lock()
+
+
+def _max_cache_size():
+    return getattr(settings, 'RENDERED_PAYLOAD_CACHE_MB', 64) * 1024 * 1024
+
+
+def _evict():
+    global _payloads_size
+    while _payloads and _payloads_size > _max_cache_size():
+        _, payload = _payloads.popitem(last=False)
+        _payloads_size -= payload.size
+
+
+def get_rendered_payload(key, version):
+    """
+    The payload stored for key, if it was built from the given dataset versions.
+
+    Returns:
+        RenderedPayload: The payload, or None
+    """
+    global _payloads_size
+    with _lock:
+        payload = _payloads.get(key)
+        if payload is None:
+            return None
+        if payload.version != version:
+            # Built before the last upload: it can no longer be served
+            del _payloads[key]
+            _payloads_size -= payload.size
+            return None
+        _payloads.move_to_end(key)
+        return payload
+
+
+def store_rendered_payload(key, version, body):
+    """
+    Store a rendered body, unless it would take more than a quarter of the
+    RENDERED_PAYLOAD_CACHE_MB budget.
+
+    Returns:
+        RenderedPayload: The payload, stored or not
+    """
+    global _payloads_size
+    payload = RenderedPayload(key, version, body)
+    if payload.size * 4 > _max_cache_size():
+        return payload
+    with _lock:
+        previous = _payloads.pop(key, None)
+        if previous is not None:
+            _payloads_size -= previous.size
+        _payloads[key] = payload
+        _payloads_size += payload.size
+        _evict()
+    return payload
+
+
+def payload_variant(payload, encoding):
+    """
+    The payload's body in an encoding ('identity', 'gzip' or 'br'), compressed the first
+    time it is asked for and kept with the payload.
+    """
+    global _payloads_size
+    body = payload.variants.get(encoding)
+    if body is not None:
+        return body
+    
+    body = _compress(payload.variants['identity'], encoding)
+    with _lock:
+        if encoding not in payload.variants:
+            payload.variants[encoding] = body
+            payload.size += len(body)
+            if _payloads.get(payload.key) is payload:
+                _payloads_size += len(body)
+                _evict()
+    return body
+
+
+def clear_rendered_payloads():
+    """Forget every stored payload of this worker"""
+    global _payloads_size
+    with _lock:
+        _payloads.clear()
+        _payloads_size = 0
+
+
+def preferred_encoding(accept_encoding):
+    """
+    Pick the response encoding from an Accept-Encoding header: br, then gzip, then identity.
+
+    Returns:
+        str: 'br', 'gzip' or 'identity'
+    """
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return 'identity'
+
+
+def payload_response(payload, request):
+    """An HttpResponse of a payload, in the best encoding the client accepts"""
+    encoding = preferred_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+    response = HttpResponse(payload_variant(payload, encoding), content_type='application/json')
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def _dataset_keys(datasets, request):
+    return datasets(request) if callable(datasets) else datasets
+
+
+def serve_rendered_payload(endpoint, datasets):
+    """
+    Serve a GET view's successful JSON responses from the rendered payload store.
+    Goes below @api_view, so that the view gets DRF's request.
+
+    Args:
+        endpoint: Name of the endpoint in the store's keys
+        datasets: Keys of the datasets the response is built from, or a function of the
+            request giving them (None when the response must not be stored)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            keys = _dataset_keys(datasets, request)
+            if keys is None:
+                return view(request, *args, **kwargs)
+            version = tuple(get_dataset_state(key).version for key in keys)
+            if getattr(request, 'accepted_renderer', None) is None or request.accepted_renderer.format != 'json':
+                return view(request, *args, **kwargs)
+
+            key = (endpoint, tuple(sorted(
+                (name, tuple(values)) for name, values in request.query_params.lists() if name not in TRANSPORT_PARAMS
+            )))
+            payload = get_rendered_payload(key, version)
+            if payload is None:
+                response = view(request, *args, **kwargs)
+                if not isinstance(response, Response) or response.status_code != 200:
+                    return response
+                payload = store_rendered_payload(key, version, JSONRenderer().render(response.data))
+            return payload_response(payload, request)
+        return wrapper
+    return decorator
+
+
+def condition_on_datasets(datasets, vary_encoding=False):
+    """
+    Conditional GET for a read view: condition() with a strong ETag and a Last-Modified
+    date made from the state of the datasets the response is built from. Goes above
+    @api_view, so a 304 costs no more than the (cached) dataset states.
+
+    The ETag changes with the dataset versions and active uploads, and with the URL and
+    the headers the response depends on. Error responses get neither header.
+
+    Args:
+        datasets: Keys of the datasets, or a function of the request giving them
+            (None for no conditional GET)
+        vary_encoding: Whether the response is served compressed from the payload store,
+            so each Content-Encoding needs its own ETag
+    """
+    def dataset_states(request):
+        keys = _dataset_keys(datasets, request)
+        if keys is None:
+            return None
+        return [(key, get_dataset_state(key)) for key in keys]
+    
+    def etag(request, *args, **kwargs):
+        states = dataset_states(request)
+        if states is None:
+            return None
+        validator = [request.get_full_path(), request.META.get('HTTP_ACCEPT', '')]
+        if vary_encoding:
+            validator.append(preferred_encoding(request.META.get('HTTP_ACCEPT_ENCODING')))
+        validator += [f"{key}:{state.version}:{state.target_id}" for key, state in states]
+        return hashlib.sha1('|'.join(validator).encode()).hexdigest()
+    
+    def last_modified(request, *args, **kwargs):
+        states = dataset_states(request)
+        changes = [state.updated_at for key, state in states or () if state.updated_at]
+        return max(changes) if changes else None
+    
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+        
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                # An error is not a representation for clients to revalidate
+                del response['ETag']
+                del response['Last-Modified']
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,178 @@
+"""
+Full-text search over the active cross-reference rows.
+
+On SQLite the rows are indexed in an FTS5 table (trigram tokenizer, so terms
+match as case-insensitive substrings) that triggers keep in sync with
+gail_app_crossreference; see migration 0011. The index holds the rows of every
+upload version, so the FTS scan is limited to the searched upload's rowid range
+(an upload's rows are inserted together, under increasing ids) and only its rows
+are ranked. Results are ranked by bm25 and paged with keyset cursors over (score, id). Terms shorter than three characters
+cannot use the trigram index and are applied as icontains filters instead; on
+other databases, or without FTS5, the whole search falls back to icontains
+filters ordered by id.
+"""
+import base64
+import json
+
+from django.db import connection
+from django.db.models import Q
+
+from .datasets import CROSS_REFERENCE, get_active_version_id
+
+SEARCH_INDEX_TABLE = 'gail_app_crossreference_fts'
+SEARCH_FIELDS = ['gail_grade', 'competitor_name', 'competitor_grade', 'location']
+SEARCH_RESULT_FIELDS = ['id', 'gail_grade', 'competitor_name', 'competitor_grade', 'location', 'created_at']
+DEFAULT_SEARCH_LIMIT = 100
+MAX_SEARCH_LIMIT = 500
+
+_index_available = {}  # database name -> whether the FTS table exists
+
+
+class InvalidCursor(ValueError):
+    """A search cursor that could not be decoded, or that belongs to another kind of search"""
+
+
+def search_index_available():
+    """Whether the FTS5 search index exists in the current database"""
+    name = connection.settings_dict['NAME']
+    if name not in _index_available:
+        _index_available[name] = (
+            connection.vendor == 'sqlite'
+            and SEARCH_INDEX_TABLE in connection.introspection.table_names()
+        )
+    return _index_available[name]
+
+
+def encode_cursor(score, row_id):
+    return base64.urlsafe_b64encode(json.dumps([score, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (score, id) of the last row of the previous page; score is None for unranked searches
+    """
+    try:
+        score, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (None if score is None else float(score)), int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_pattern(term):
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_cross_references(filters, cursor=None, limit=DEFAULT_SEARCH_LIMIT, upload_id=None):
+    """
+    Search the rows of a cross-reference upload.
+
+    Args:
+        filters: Dict of field -> term, fields from SEARCH_FIELDS plus 'q' (any field); empty terms are ignored
+        cursor: next_cursor of the previous page, if any
+        limit: Page size, at most MAX_SEARCH_LIMIT
+        upload_id: The cross-reference upload to search, None for the active one
+
+    Returns:
+        tuple: (rows as dicts of SEARCH_RESULT_FIELDS, next_cursor or None)
+
+    Raises:
+        InvalidCursor: If the cursor cannot be decoded, or comes from a ranked search
+            and this one is unranked or the other way round
+    """
+    limit = max(1, min(int(limit), MAX_SEARCH_LIMIT))
+    after = decode_cursor(cursor) if cursor else None
+    terms = {field: term.strip() for field, term in filters.items() if term and term.strip()}
+    
+    if upload_id is None:
+        upload_id = get_active_version_id(CROSS_REFERENCE)
+    if upload_id is None:
+        return [], None
+    ranked = search_index_available() and any(len(term) >= 3 for term in terms.values())
+    if after and (after[0] is not None) != ranked:
+        # A (score, id) keyset means nothing to an id-ordered search, and the other way round
+        raise InvalidCursor(f"Cursor does not belong to this search: {cursor}")
+    if ranked:
+        return _ranked_search(terms, upload_id, after, limit)
+    return _unranked_search(terms, upload_id, after, limit)
+
+
+def _unranked_search(terms, upload_id, after, limit):
+    """icontains filters, keyset over id alone"""
+    from .models import CrossReference  # Import here to avoid circular imports
+    
+    queryset = CrossReference.objects.filter(excel_upload_id=upload_id)
+    for field, term in terms.items():
+        if field == 'q':
+            any_field = Q()
+            for search_field in SEARCH_FIELDS:
+                any_field |= Q(**{f'{search_field}__icontains': term})
+            queryset = queryset.filter(any_field)
+        else:
+            queryset = queryset.filter(**{f'{field}__icontains': term})
+    if after:
+        queryset = queryset.filter(id__gt=after[1])
+    
+    rows = list(queryset.order_by('id').values(*SEARCH_RESULT_FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(None, rows[limit - 1]['id']) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _ranked_search_sql(terms, upload_id, after, limit):
+    """
+    The ranked search query: the FTS match, limited to the upload's rowid range so that
+    other versions' rows are neither scanned nor ranked.
+
+    Returns:
+        tuple: (sql, params) selecting (id, score) of up to limit + 1 rows
+    """
+    match_terms = []
+    where = ['cr.excel_upload_id = %s']
+    params = [upload_id]
+    for field, term in terms.items():
+        columns = SEARCH_FIELDS if field == 'q' else [field]
+        if len(term) >= 3:
+            match_terms.append(_fts_phrase(term) if field == 'q' else f'{field} : {_fts_phrase(term)}')
+        else:
+            # Too short for the trigram index
+            where.append('(' + ' OR '.join(f"cr.{column} LIKE %s ESCAPE '\\'" for column in columns) + ')')
+            params += [_like_pattern(term)] * len(columns)
+    if after:
+        where.append('(ranked.score > %s OR (ranked.score = %s AND ranked.id > %s))')
+        params += [after[0], after[0], after[1]]
+    
+    sql = (
+        f'SELECT ranked.id, ranked.score FROM ('
+        f'SELECT rowid AS id, bm25({SEARCH_INDEX_TABLE}) AS score FROM {SEARCH_INDEX_TABLE} WHERE {SEARCH_INDEX_TABLE} MATCH %s '
+        f'AND rowid BETWEEN (SELECT MIN(id) FROM gail_app_crossreference WHERE excel_upload_id = %s) '
+        f'AND (SELECT MAX(id) FROM gail_app_crossreference WHERE excel_upload_id = %s)'
+        f') ranked '
+        f'JOIN gail_app_crossreference cr ON cr.id = ranked.id '
+        f'WHERE {" AND ".join(where)} '
+        f'ORDER BY ranked.score, ranked.id LIMIT %s'
+    )
+    # The range only bounds the scan: the join still keeps the upload's rows alone
+    return sql, [' AND '.join(match_terms), upload_id, upload_id, *params, limit + 1]
+
+
+def _ranked_search(terms, upload_id, after, limit):
+    """FTS5 match ranked by bm25, keyset over (score, id)"""
+    from .models import CrossReference  # Import here to avoid circular imports
+    
+    sql, params = _ranked_search_sql(terms, upload_id, after, limit)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        page = db_cursor.fetchall()
+    
+    page_ids = [row_id for row_id, _ in page[:limit]]
+    rows_by_id = {
+        row['id']: row
+        for row in CrossReference.objects.filter(id__in=page_ids).values(*SEARCH_RESULT_FIELDS)
+    }
+    rows = [rows_by_id[row_id] for row_id in page_ids if row_id in rows_by_id]
+    next_cursor = encode_cursor(page[limit - 1][1], page[limit - 1][0]) if len(page) > limit else None
+    return rows, next_cursor
@@ -0,0 +1,106 @@
+"""
+Streaming JSON responses for large exports.
+
+A DRF Response holds the whole payload as Python objects, then renders it to bytes in
+one shot: a file with 10k locations sits in a worker's memory twice before the first
+byte is sent. StreamingJSONResponse encodes the payload as it is sent instead. Lists and
+dicts are walked item by item, and iterators/generators in the payload (e.g. location
+records read from the database with .iterator()) are consumed lazily, so only one
+record and one output chunk are in memory at a time.
+
+The bytes are the same as DRF's JSONRenderer output with the default settings.
+"""
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+# Encoded pieces are sent in chunks of about this many bytes
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Lists and dicts this deep (a location record, a freight record) are encoded in one
+# piece: they are small, and walking them item by item would only cost time
+STREAM_DEPTH = 2
+
+_encoder = JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+
+
+class JSONObjectItems:
+    """Wraps an iterable of (key, value) pairs to be streamed as a JSON object"""
+
+    def __init__(self, items):
+        self.items = items
+
+
+def _encode(value):
+    # DRF's JSONRenderer escapes these two, which are valid JSON but not valid JavaScript
+    return _encoder.encode(value).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+def _iter_items(items, depth):
+    yield '{'
+    for index, (key, value) in enumerate(items):
+        # Non-string keys are converted as json converts them: 1 -> "1", True -> "true"
+        key = key if isinstance(key, str) else _encoder.encode(key)
+        yield (',' if index else '') + _encode(key) + ':'
+        yield from iter_json(value, depth + 1)
+    yield '}'
+
+
+def iter_json(value, depth=0):
+    """
+    Encode a value to JSON piece by piece.
+
+    Args:
+        value: Anything DRF can render; generators, iterators and JSONObjectItems are streamed
+        depth: Nesting depth of the value
+
+    Returns:
+        generator: str pieces of the JSON document
+    """
+    if isinstance(value, JSONObjectItems):
+        yield from _iter_items(value.items, depth)
+    elif isinstance(value, dict) and depth < STREAM_DEPTH:
+        yield from _iter_items(value.items(), depth)
+    elif isinstance(value, (list, tuple)) and depth < STREAM_DEPTH or hasattr(value, '__next__'):
+        yield '['
+        for index, item in enumerate(value):
+            if index:
+                yield ','
+            yield from iter_json(item, depth + 1)
+        yield ']'
+    else:
+        yield _encode(value)
+
+
+def iter_json_chunks(value, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Encode a value to JSON in byte chunks of about chunk_size.
+
+    Returns:
+        generator: bytes chunks of the JSON document
+    """
+    pieces, size = [], 0
+    try:
+        for piece in iter_json(value):
+            pieces.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield ''.join(pieces).encode()
+                pieces, size = [], 0
+    except Exception as e:
+        # The status line is already sent: all that can be done is to cut the document short
+        print(f"Error streaming JSON response: {e}")
+        raise
+    if pieces:
+        yield ''.join(pieces).encode()
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """A JSON response encoded while it is sent"""
+
+    def __init__(self, data, status=200, **kwargs):
+        super().__init__(iter_json_chunks(data), status=status, content_type='application/json', **kwargs)
+
+
+def wants_stream(request):
+    """Whether the client asked for a streamed response (?stream=true)"""
+    return request.query_params.get('stream', 'false').lower() == 'true'
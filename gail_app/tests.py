@@ -1,3 +1,1626 @@
-from django.test import TestCase
+import gzip
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
+from concurrent.futures.process import BrokenProcessPool
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from openpyxl import Workbook
+import pandas as pd
+from rest_framework.renderers import JSONRenderer
+
+from . import cross_reference_cache, datasets, pricing_index, responses
+from .benchmarks import measure_response_in_process
+from .datasets import CROSS_REFERENCE, bump_dataset_version, switch_dataset
+from .cross_reference_cache import (
+    CrossReferenceSnapshot, InvalidAsOf, diff_cross_reference_uploads, get_cross_reference_snapshot, resolve_cross_reference_upload
+)
+from .models import CrossReference, CrossReferenceArchive, ExcelUpload, FreightCoverageReport, FreightRate, PDFUpload, PricingLocation
+from .search import InvalidCursor, _ranked_search_sql, search_cross_references, search_index_available
+from .streaming import JSONObjectItems, iter_json_chunks
+from .utils import (
+    _location_price_stats, derive_file_data, extract_cross_reference, extract_freight, extract_freight_from_excel, extract_freight_from_pdf, freight_pdf_workers,
+    parse_freight_table, get_freight_rates_as_of, get_freight_rates_in_range, save_cross_reference_to_db, save_freight_history
+)
+
+
+class CrossReferenceLookupTests(TestCase):
+    """Cross-reference lookups use the normalized key columns and their composite indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Already "extracted", so saving skips extraction: the rows are created directly below
+        upload = ExcelUpload.objects.create(file='cross_reference.xlsx', extracted_data={'mappings': {}}, is_active=True)
+        cls.upload = upload
+        for gail_grade, competitor_name, competitor_grade in [
+            (' G-100 ', 'Reliance', 'R100'),
+            ('G-100', 'IOCL', 'No Equivalent'),
+            ('G-200', 'reliance ', '(blank)'),
+            ('G-200', 'Haldia', 'H200'),
+        ]:
+            CrossReference.objects.create(
+                gail_grade=gail_grade,
+                competitor_name=competitor_name,
+                competitor_grade=competitor_grade,
+                excel_upload=upload
+            )
+
+    def test_keys_and_validity_set_on_save(self):
+        row = CrossReference.objects.get(gail_grade=' G-100 ')
+        self.assertEqual((row.gail_grade_key, row.competitor_key, row.competitor_grade_key), ('g-100', 'reliance', 'r100'))
+        self.assertFalse(CrossReference.objects.get(competitor_grade='No Equivalent').is_valid)
+        self.assertFalse(CrossReference.objects.get(competitor_grade='(blank)').is_valid)
+
+    def test_lookup_matches_case_and_whitespace(self):
+        competitors = CrossReference.objects.filter(
+            gail_grade_key='g-100',
+            excel_upload_id=self.upload.id,
+            is_valid=True
+        ).values_list('competitor_name', flat=True)
+        self.assertEqual(list(competitors), ['Reliance'])
+
+    def test_grade_lookup_uses_composite_index(self):
+        plan = CrossReference.objects.filter(
+            gail_grade_key='g-100',
+            competitor_key='reliance',
+            excel_upload_id=self.upload.id,
+            is_valid=True
+        ).explain()
+        self.assertIn('crossref_grade_lookup_idx', plan)
+
+    def test_competitor_lookup_uses_composite_index(self):
+        plan = CrossReference.objects.filter(
+            competitor_key='reliance',
+            competitor_grade_key='r100',
+            excel_upload_id=self.upload.id,
+            is_valid=True
+        ).explain()
+        self.assertIn('crossref_competitor_idx', plan)
+
+
+class GradeResolutionTests(SimpleTestCase):
+    """User-typed grades resolve to catalog grades that have valid mappings"""
+
+    def setUp(self):
+        self.snapshot = CrossReferenceSnapshot(1, [
+            ('G-100', 'g-100', 'Reliance', 'R100', True),
+            ('G-1000', 'g-1000', 'Reliance', 'R1000', True),
+            ('G-200', 'g-200', 'Reliance', 'No Equivalent', False),
+            ('G-2000', 'g-2000', 'IOCL', 'I2000', True),
+            ('HDPE-5000', 'hdpe-5000', 'IOCL', 'I5000', True),
+        ])
+
+    def test_exact_match(self):
+        resolution = self.snapshot.resolve_grade('G-100')
+        self.assertTrue(resolution.exact)
+        self.assertEqual(resolution.grades, ('G-100',))
+
+    def test_normalized_exact_match(self):
+        resolution = self.snapshot.resolve_grade('  g-100 ')
+        self.assertTrue(resolution.exact)
+        self.assertEqual(resolution.grade_keys, ('g-100',))
+
+    def test_substring_match(self):
+        resolution = self.snapshot.resolve_grade('g-10')
+        self.assertFalse(resolution.exact)
+        self.assertEqual(resolution.grades, ('G-100', 'G-1000'))
+
+    def test_fuzzy_match(self):
+        resolution = self.snapshot.resolve_grade('HDPE-500O')
+        self.assertFalse(resolution.exact)
+        self.assertEqual(resolution.grades, ('HDPE-5000',))
+
+    def test_grade_without_valid_mappings_is_not_exact(self):
+        resolution = self.snapshot.resolve_grade('G-200')
+        self.assertFalse(resolution.exact)
+        self.assertEqual(resolution.grades, ('G-2000',))
+        self.assertNotIn('G-200', resolution.suggestions)
+        self.assertTrue(self.snapshot.has_grade('G-200'))
+
+    def test_unknown_grade(self):
+        resolution = self.snapshot.resolve_grade('XYZ')
+        self.assertEqual((resolution.exact, resolution.grades), (False, ()))
+
+
+FREIGHT_SHEET_HEADER = ['No', 'CnTy', 'Condition Type', 'PL Number', 'City', 'Amount', 'Unit', 'Per', 'UoM', 'Valid From', 'Valid To']
+
+
+class FreightExcelTests(SimpleTestCase):
+    """Excel freight workbooks are read from the City..Valid_To columns of one or more sheets"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'freight.xlsx')
+
+    def write_workbook(self, sheets):
+        """Save sheets ({title: rows}) under the two header rows of a freight sheet"""
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        for title, rows in sheets.items():
+            sheet = workbook.create_sheet(title)
+            sheet.append(FREIGHT_SHEET_HEADER[:len(rows[0])] if rows else FREIGHT_SHEET_HEADER)
+            sheet.append([None] * len(FREIGHT_SHEET_HEADER))
+            for row in rows:
+                sheet.append(row)
+        workbook.save(self.path)
+
+    def test_first_sheet_by_default(self):
+        self.write_workbook({
+            'North': [
+                [1, 'ZF', 'Freight', 'PL1', 'Delhi', 100, 'INR', 1, 'MT', datetime(2025, 2, 1), datetime(2025, 2, 28)],
+                [2, 'ZF', 'Freight', 'PL1', 'Agra', None, 'INR', 1, 'MT', datetime(2025, 2, 1), datetime(2025, 2, 28)],
+            ],
+            'South': [[1, 'ZF', 'Freight', 'PL1', 'Chennai', 90.5, 'INR', 1, 'MT', '01.02.2025', '28.02.2025']],
+        })
+        self.assertEqual(extract_freight_from_excel(self.path), {
+            'Delhi': {'Amount': 100, 'Unit': 'INR', 'Per': 1, 'UoM': 'MT', 'Valid_From': '2025-02-01', 'Valid_To': '2025-02-28'}
+        })
+
+    def test_several_sheets_later_sheets_win(self):
+        self.write_workbook({
+            'North': [[1, 'ZF', 'Freight', 'PL1', 'Delhi', 100, 'INR', 1, 'MT', datetime(2025, 2, 1), datetime(2025, 2, 28)]],
+            'South': [
+                [1, 'ZF', 'Freight', 'PL1', 'Chennai', 90.5, 'INR', 1, 'MT', datetime(2025, 2, 1), datetime(2025, 2, 28)],
+                [2, 'ZF', 'Freight', 'PL1', 'Delhi', 120, 'INR', 1, 'MT', datetime(2025, 3, 1), datetime(2025, 3, 31)],
+            ],
+        })
+        everything = extract_freight_from_excel(self.path, sheet_name=None)
+        self.assertEqual(list(everything), ['Delhi', 'Chennai'])
+        self.assertEqual(everything['Delhi']['Amount'], 120)
+        self.assertEqual(extract_freight_from_excel(self.path, sheet_name=['South', 'North'])['Delhi']['Amount'], 100)
+
+    def test_dates_are_iso_strings_and_text_is_kept(self):
+        self.write_workbook({'North': [
+            [1, 'ZF', 'Freight', 'PL1', 'Delhi', 100, 'INR', 1, 'MT', datetime(2025, 2, 1), '28.02.2025'],
+        ]})
+        delhi = extract_freight_from_excel(self.path)['Delhi']
+        self.assertEqual((delhi['Valid_From'], delhi['Valid_To']), ('2025-02-01', '28.02.2025'))
+        json.dumps(delhi)
+
+    def test_missing_columns_are_an_error(self):
+        self.write_workbook({'North': [[1, 'ZF', 'Freight', 'PL1', 'Delhi', 100, 'INR']]})
+        self.assertIn('error', extract_freight(self.path))
+
+
+def row_by_row_freight_table(table):
+    """The freight table parser before it was vectorized, kept as the reference for parity"""
+    freight_data = {}
+    if not table or len(table) < 2:
+        return freight_data
+    # pdfplumber cells are str or None, which the pinned pandas 2.2 keeps as they are
+    df = pd.DataFrame(table[1:], columns=table[0], dtype=object)
+    df.columns = [str(col).strip() if col else f'col_{i}' for i, col in enumerate(df.columns)]
+    for row in df.itertuples(index=False):
+        if len(row) < 8:
+            continue
+        sl_no, state, sector, district, destination, distance, transit_time, amount = (str(row[i]).strip() for i in range(8))
+        if (not destination or
+            destination.upper() in ['DESTINATION / CONSUMPTION POINT', 'DESTINATION/CONSUMPTION POINT'] or
+            sl_no.upper() in ['SL', 'SL.'] or
+            destination == 'nan' or
+            not amount or
+            amount == 'nan'):
+            continue
+        try:
+            amount_clean = ''.join(c for c in amount if c.isdigit() or c == '.')
+            amount_value = float(amount_clean) if amount_clean else 0
+            if amount_value <= 0:
+                continue
+        except (ValueError, TypeError):
+            continue
+        try:
+            distance_clean = ''.join(c for c in distance if c.isdigit() or c == '.')
+            distance_value = float(distance_clean) if distance_clean else 0
+        except ValueError:
+            distance_value = 0
+        try:
+            transit_clean = ''.join(c for c in transit_time if c.isdigit())
+            transit_value = int(transit_clean) if transit_clean else 0
+        except ValueError:
+            transit_value = 0
+        freight_data[destination] = {
+            "Amount": amount_value, "Unit": "MT", "Per": "MT", "UoM": "MT",
+            "Distance_KM": distance_value, "Transit_Days": transit_value,
+            "State": state, "Sector": sector, "District": district,
+            "Valid_From": "1 Feb, 2025", "Valid_To": "28 Feb, 2025"
+        }
+    return freight_data
+
+
+FREIGHT_TABLE_HEADER = ['SL', 'STATE', 'SECTOR', 'DISTRICT', 'DESTINATION / CONSUMPTION POINT', 'DISTANCE', 'TRANSIT', 'AMOUNT']
+
+
+class FreightTableParityTests(SimpleTestCase):
+    """The column-wise freight table parser returns what the row-by-row parser returned"""
+
+    def assertParity(self, table):
+        parsed = parse_freight_table(table)
+        self.assertEqual(parsed, row_by_row_freight_table(table))
+        # Same values, and the same int/float types
+        self.assertEqual(repr(parsed), repr(row_by_row_freight_table(table)))
+
+    def test_fixture_table(self):
+        self.assertParity([FREIGHT_TABLE_HEADER] + [
+            ['SL.', 'STATE', 'SECTOR', 'DISTRICT', 'DESTINATION/CONSUMPTION POINT', 'DISTANCE', 'TRANSIT', 'AMOUNT'],
+            ['1', 'Delhi', 'North', 'New Delhi', ' Delhi ', '12.5 km', '2 days', 'Rs 1,250.50'],
+            ['2', 'Delhi', 'North', None, 'Delhi Cantt', '', '', '1100'],
+            ['3', 'UP', 'North', 'Agra', 'Agra', 'n/a', 'x', '0'],
+            ['4', 'UP', 'North', 'Agra', 'Mathura', '1.2.3', '3', '1.2.3'],
+            ['5', 'UP', 'North', 'Agra', '', '10', '1', '900'],
+            ['6', 'UP', 'North', 'Agra', 'nan', '10', '1', '900'],
+            ['7', 'UP', 'North', 'Agra', 'Firozabad', '10', '1', None],
+            ['8', 'Delhi', 'North', 'New Delhi', 'Delhi', '14', '3', '1300'],
+            [None, None, None, None, None, None, None, None],
+        ])
+
+    def test_non_ascii_digits(self):
+        self.assertParity([FREIGHT_TABLE_HEADER] + [
+            ['1', 'Delhi', 'North', 'New Delhi', 'Delhi', '١٢.٥', '٣', '١٠٠٠'],
+            ['2', 'Delhi', 'North', 'New Delhi', 'Narela', '²', '²', '1200'],
+            ['3', 'Delhi', 'North', 'New Delhi', 'Bawana', '12', '3', '²'],
+            ['4', 'Delhi', 'North', 'New Delhi', 'Rohini', '१२ किमी', '३ दिन', '₹ १,१००'],
+        ])
+
+    def test_short_and_wide_tables(self):
+        self.assertParity([FREIGHT_TABLE_HEADER[:7], ['1', 'Delhi', 'North', 'New Delhi', 'Delhi', '12', '2']])
+        self.assertParity([FREIGHT_TABLE_HEADER + ['REMARKS'], ['1', 'Delhi', 'North', 'New Delhi', 'Delhi', '12', '2', '1000', 'ok']])
+        self.assertParity([FREIGHT_TABLE_HEADER])
+        self.assertParity([])
+
+    def test_random_tables(self):
+        generator = random.Random(27)
+        cells = ['', ' ', None, 'nan', 'SL', 'sl.', '0', '-5', '12', '12.5', ' 1,000 ', '1.2.3', '.', 'Rs. 900/-', '٣', '²', 'abc', 'Delhi', 'Agra']
+        for _ in range(200):
+            width = generator.choice([7, 8, 8, 9])
+            rows = [[generator.choice(cells) for _ in range(width)] for _ in range(generator.randint(0, 12))]
+            self.assertParity([FREIGHT_TABLE_HEADER[:width] + ['EXTRA'] * (width - 8)] + rows)
+
+
+class FreightPdfWorkersTests(SimpleTestCase):
+    """Freight PDF extraction falls back to one process for unusable worker counts"""
+
+    @override_settings(FREIGHT_PDF_WORKERS=1)
+    def test_setting_of_one_extracts_serially(self):
+        self.assertEqual(freight_pdf_workers(), 1)
+
+    def test_invalid_counts_mean_one_worker(self):
+        for workers in [0, -3, '0', 'many', '', 1.0]:
+            self.assertEqual(freight_pdf_workers(workers), 1, workers)
+
+    @override_settings(FREIGHT_PDF_WORKERS='4')
+    def test_setting_and_request_values_are_parsed(self):
+        self.assertEqual(freight_pdf_workers(), 4)
+        self.assertEqual(freight_pdf_workers('3'), 3)
+
+
+def write_freight_pdf(path, tables):
+    """Write a PDF with one ruled freight table per page, which pdfplumber reads back as it was"""
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * page} 0 R' for page in range(len(tables)))}] /Count {len(tables)} >>".encode(),
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    for page, table in enumerate(tables):
+        operators = []
+        for row_index, row in enumerate(table):
+            for column_index, cell in enumerate(row):
+                x, y = 20 + column_index * 60, 786 - row_index * 14
+                text = cell.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+                operators.append(f"{x} {y} 60 14 re S BT /F1 6 Tf {x + 2} {y + 4} Td ({text}) Tj ET")
+        content = '\n'.join(operators).encode('latin-1')
+        objects[4 + 2 * page] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {5 + 2 * page} 0 R >>"
+        ).encode()
+        objects[5 + 2 * page] = f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream"
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number in sorted(objects):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n".encode() + objects[number] + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, 'wb') as pdf_file:
+        pdf_file.write(pdf)
+
+
+@override_settings(FREIGHT_PDF_WORKERS=1)
+class FreightPdfExtractionTests(SimpleTestCase):
+    """Freight PDFs are parsed page by page, in a process pool when it can start"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'freight.pdf')
+        write_freight_pdf(self.path, [
+            [FREIGHT_TABLE_HEADER, ['1', 'Delhi', 'North', 'New Delhi', 'Delhi', '12', '2', '1000']],
+            [FREIGHT_TABLE_HEADER, ['2', 'UP', 'North', 'Agra', 'Agra', '200', '3', '1500']],
+            [FREIGHT_TABLE_HEADER, ['3', 'Delhi', 'North', 'New Delhi', 'Delhi', '14', '3', '1100']],
+        ])
+
+    def test_serial_extraction(self):
+        page_timings = []
+        freight = extract_freight_from_pdf(self.path, page_timings=page_timings)
+        self.assertEqual({destination: record['Amount'] for destination, record in freight.items()}, {'Delhi': 1100, 'Agra': 1500})
+        self.assertEqual([timing['page'] for timing in page_timings], [1, 2, 3])
+
+    def test_process_pool_matches_serial_extraction(self):
+        self.assertEqual(extract_freight_from_pdf(self.path, workers=2), extract_freight_from_pdf(self.path))
+
+    def test_pool_that_cannot_start_falls_back_to_serial(self):
+        serial = extract_freight_from_pdf(self.path)
+        with patch('gail_app.utils.ProcessPoolExecutor', side_effect=OSError('no processes')):
+            self.assertEqual(extract_freight_from_pdf(self.path, workers=2), serial)
+        broken_pool = MagicMock()
+        broken_pool.return_value.__enter__.return_value.map.side_effect = BrokenProcessPool('worker died')
+        with patch('gail_app.utils.ProcessPoolExecutor', broken_pool):
+            self.assertEqual(extract_freight_from_pdf(self.path, workers=2), serial)
+        broken_pool.assert_called_once_with(max_workers=2)
+
+    def test_pdf_without_pages(self):
+        write_freight_pdf(self.path, [])
+        page_timings = []
+        with patch('gail_app.utils.ProcessPoolExecutor') as pool:
+            self.assertEqual(extract_freight_from_pdf(self.path, workers=4, page_timings=page_timings), {})
+        pool.assert_not_called()
+        self.assertEqual(page_timings, [])
+
+
+class FreightHistoryTests(TestCase):
+    """Freight rates are looked up by validity date on the destination index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        def freight_upload(month, amounts):
+            upload = PDFUpload.objects.create(file=f'pdfs/freight_{month}.xlsx', file_type='freight_file', month=month, year=2025, extracted_data={
+                destination: {'Amount': amount, 'Unit': 'MT', 'Valid_From': valid_from, 'Valid_To': valid_to}
+                for destination, (amount, valid_from, valid_to) in amounts.items()
+            })
+            save_freight_history(upload)
+            return upload
+
+        cls.february = freight_upload('february', {
+            'Delhi': (1000, '2025-02-01', '2025-02-28'),
+            'Delhi Cantt': (1100, '2025-02-01', '2025-02-28'),
+            'New Delhi': (1200, '2025-02-01', '2025-02-28'),
+            'Agra': (900, 'not a date', ''),
+        })
+        cls.march = freight_upload('march', {
+            'Delhi': (1050, '2025-02-15', '2025-03-31'),
+        })
+
+    def test_as_of_picks_latest_started_interval(self):
+        rates = get_freight_rates_as_of(date(2025, 2, 20))
+        self.assertEqual(rates['Delhi'].amount, 1050)
+        self.assertEqual(get_freight_rates_as_of(date(2025, 2, 10))['Delhi'].amount, 1000)
+
+    def test_undated_records_are_valid_for_the_upload_month(self):
+        agra = FreightRate.objects.get(destination='Agra')
+        self.assertEqual((agra.valid_from, agra.valid_to), (date(2025, 2, 1), date(2025, 2, 28)))
+
+    def test_location_matches_destination_prefix(self):
+        self.assertEqual(sorted(get_freight_rates_as_of(date(2025, 2, 10), ' delhi')), ['Delhi', 'Delhi Cantt'])
+        self.assertEqual(get_freight_rates_as_of(date(2025, 4, 1), 'delhi'), {})
+
+    def test_range_returns_every_overlapping_rate(self):
+        rates = get_freight_rates_in_range(date(2025, 2, 20), date(2025, 3, 5), 'delhi')
+        self.assertEqual([rate.amount for rate in rates['Delhi']], [1000, 1050])
+        self.assertEqual(list(get_freight_rates_in_range(date(2025, 3, 1), date(2025, 3, 5))), ['Delhi'])
+
+    def test_location_lookup_uses_destination_index(self):
+        plan = FreightRate.objects.filter(
+            destination_key__gte='DELHI', destination_key__lt='DELHI\U0010ffff', valid_from__lte=date(2025, 2, 10)
+        ).explain()
+        self.assertIn('USING INDEX', plan)
+        self.assertIn('destination_key>? AND destination_key<?', plan)
+
+    def test_as_of_response_after_rebuild_is_rebuilt(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        params = {'as_of': '2025-02-10', 'location': 'agra'}
+        self.assertEqual(self.client.get('/api/freight-data/', params).json()['freight_data']['Agra']['Amount'], 900)
+        PDFUpload.objects.filter(pk=self.february.pk).update(extracted_data={
+            'Agra': {'Amount': 950, 'Unit': 'MT', 'Valid_From': '2025-02-01', 'Valid_To': '2025-02-28'}
+        })
+        call_command('rebuild_freight_history', stdout=StringIO())
+        self.assertEqual(self.client.get('/api/freight-data/', params).json()['freight_data']['Agra']['Amount'], 950)
+
+    def test_upload_without_month_keeps_dated_records_only(self):
+        upload = PDFUpload.objects.create(file='pdfs/freight_blank.xlsx', file_type='freight_file', month='', year=2025, extracted_data={
+            'Pune': {'Amount': 800, 'Valid_From': '2025-05-01', 'Valid_To': '2025-05-31'},
+            'Nagpur': {'Amount': 700},
+        })
+        self.assertEqual(save_freight_history(upload), 1)
+        self.assertEqual(list(upload.freight_rates.values_list('destination', flat=True)), ['Pune'])
+
+
+def pricing_data(locations, products=('G100', 'G200')):
+    """Extracted data of a stock point / ex-work file with one item per location"""
+    return {'data': [
+        {'sap_code': f'S{index}', 'location': location, 'products': [{'product_code': code, 'price': 1000 + index} for code in products]}
+        for index, location in enumerate(locations)
+    ]}
+
+
+class FreightCoverageReportTests(TestCase):
+    """The period's coverage report follows edits and deletes of its pricing and freight files"""
+
+    def setUp(self):
+        self.stock_point = PDFUpload.objects.create(file='pdfs/stock.pdf', file_type='stock_point_file', month='february', year=2025,
+                                                    extracted_data=pricing_data(['Delhi', 'Agra', 'Pune']))
+        self.freight = PDFUpload.objects.create(file='pdfs/freight.pdf', file_type='freight_file', month='february', year=2025,
+                                                extracted_data={'DELHI': {'Amount': 1000}, 'PUNE': {'Amount': 1200}})
+
+    def report(self):
+        return FreightCoverageReport.objects.get(month='february', year=2025)
+
+    def test_report_built_when_files_arrive(self):
+        self.assertEqual((self.report().total_locations, self.report().locations_with_freight), (3, 2))
+
+    def test_report_rebuilt_when_pricing_file_edited(self):
+        self.stock_point.extracted_data = pricing_data(['Delhi'])
+        self.stock_point.save()
+        self.assertEqual((self.report().total_locations, self.report().locations_with_freight), (1, 1))
+
+    def test_report_rebuilt_when_pricing_file_deleted(self):
+        self.stock_point.delete()
+        self.assertEqual(self.report().total_locations, 0)
+
+    def test_report_dropped_when_freight_file_deleted(self):
+        self.freight.delete()
+        self.assertFalse(FreightCoverageReport.objects.filter(month='february', year=2025).exists())
+
+    def test_freight_locations_fall_back_to_extracted_data(self):
+        # The freight file was saved with its data, so no rate history was written for it
+        self.assertFalse(FreightRate.objects.filter(pdf_upload=self.freight).exists())
+        response = self.client.get('/api/freight-coverage-report/', {'month': 'february', 'year': 2025, 'include_freight_locations': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['freight_locations_available'], ['DELHI', 'PUNE'])
+
+
+def cross_reference_upload(mappings, is_active=True):
+    """A cross-reference upload with its rows saved, as after extraction"""
+    upload = ExcelUpload.objects.create(file='excel_files/cross_reference.xlsx', extracted_data={'mappings': mappings}, is_active=is_active)
+    upload.ingest_report = save_cross_reference_to_db(upload)
+    return upload
+
+
+def upload_rows(upload):
+    return set(upload.cross_references.values_list('gail_grade', 'competitor_name', 'competitor_grade', 'gail_grade_key', 'is_valid'))
+
+
+def row_by_row_cross_reference(file_path):
+    """The cross-reference sheet parser before it was vectorized, kept as the reference for parity"""
+    df = pd.read_excel(file_path) if file_path.endswith('.xlsx') else pd.read_csv(file_path)
+    df.columns = df.columns.astype(str).str.strip()
+    df = df.dropna(how='all')
+    cross_reference_data = {"companies": [], "mappings": {}, "metadata": {"total_companies": 0, "total_mappings": 0}}
+    if df.empty or len(df.columns) < 5:
+        return cross_reference_data
+    gail_column = df.columns[1]
+    competitor_columns = [col.strip() for col in df.columns[4:11].tolist() if col.strip()]
+    cross_reference_data["companies"] = competitor_columns
+    cross_reference_data["metadata"]["total_companies"] = len(competitor_columns)
+    mappings_count = 0
+    for index, row in df.iterrows():
+        gail_grade = str(row[gail_column]).strip()
+        if pd.isna(row[gail_column]) or not gail_grade or gail_grade.lower() in ['nan', 'null', '', 'gail grade']:
+            continue
+        if gail_grade not in cross_reference_data["mappings"]:
+            cross_reference_data["mappings"][gail_grade] = {}
+        for competitor in competitor_columns:
+            competitor_grade = str(row[competitor]).strip()
+            if (pd.isna(row[competitor]) or not competitor_grade or
+                competitor_grade.lower() in ['nan', 'null', '', 'no equivalent', '(blank)']):
+                continue
+            for delimiter in [',', ';', '|', '\n', '/']:
+                if delimiter in competitor_grade:
+                    competitor_grades = [grade.strip() for grade in competitor_grade.split(delimiter)]
+                    break
+            else:
+                competitor_grades = [competitor_grade]
+            competitor_grades = [
+                grade for grade in competitor_grades
+                if grade and grade.lower() not in ['nan', 'null', '', 'no equivalent', 'n/a', '(blank)']
+            ]
+            if competitor_grades:
+                cross_reference_data["mappings"][gail_grade][competitor] = competitor_grades
+                mappings_count += len(competitor_grades)
+    cross_reference_data["metadata"]["total_mappings"] = mappings_count
+    return cross_reference_data
+
+
+CROSS_REFERENCE_SHEET_HEADER = ['Sl', 'GAIL Grade', 'Type', 'MFI', 'Reliance', 'IOCL', 'Haldia', 'OPaL', 'BCPL', 'HMEL', 'Imported']
+
+
+class CrossReferenceParserParityTests(SimpleTestCase):
+    """The column-wise cross-reference parser returns what the row-by-row parser returned"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_sheet(self, rows, header=CROSS_REFERENCE_SHEET_HEADER, extension='csv'):
+        path = os.path.join(self.directory, f'cross_reference.{extension}')
+        if extension == 'xlsx':
+            workbook = Workbook()
+            for row in [header] + rows:
+                workbook.active.append(row)
+            workbook.save(path)
+        else:
+            pd.DataFrame(rows, columns=header).to_csv(path, index=False)
+        return path
+
+    def assertParity(self, path):
+        parsed = extract_cross_reference(path)
+        self.assertNotIn('error', parsed)
+        expected = row_by_row_cross_reference(path)
+        self.assertEqual(parsed['mappings'], expected['mappings'])
+        # Same grade and competitor order too
+        self.assertEqual(json.dumps(parsed['mappings']), json.dumps(expected['mappings']))
+        self.assertEqual(parsed['companies'], expected['companies'])
+        self.assertEqual(parsed['metadata']['total_mappings'], expected['metadata']['total_mappings'])
+        return parsed
+
+    def fixture_rows(self):
+        return [
+            [1, 'B56A003A', 'HDPE', 0.3, 'R56, R57', 'I56;I57', 'No Equivalent', '(blank)', None, 'H56|H57', 'Imp 56/Imp 57'],
+            [2, ' G-100 ', 'LLDPE', 1, 'R100\nR101', 'N/A', 'nan', 'null', ' B100 ', None, None],
+            [3, 'GAIL Grade', None, None, 'Reliance', None, None, None, None, None, None],
+            [4, None, 'HDPE', 5, 'R-orphan', None, None, None, None, None, None],
+            [None, None, None, None, None, None, None, None, None, None, None],
+            [5, 'G-100', 'LLDPE', 1, 'R102', None, None, None, None, None, 'Imp 100, , n/a'],
+            [6, 'G-200', 'PP', 12, 'no equivalent', ',', None, None, None, None, None],
+        ]
+
+    def test_csv_fixture(self):
+        parsed = self.assertParity(self.write_sheet(self.fixture_rows()))
+        self.assertEqual(parsed['mappings']['G-100']['Reliance'], ['R102'])
+
+    def test_excel_fixture(self):
+        self.assertParity(self.write_sheet(self.fixture_rows(), extension='xlsx'))
+
+    def test_narrow_sheets(self):
+        self.assertParity(self.write_sheet([[1, 'G-1', 'HDPE', 5, 'R1', 'I1']], header=CROSS_REFERENCE_SHEET_HEADER[:6]))
+        self.assertParity(self.write_sheet([[1, 'G-1', 'HDPE', 5, 'R1']], header=CROSS_REFERENCE_SHEET_HEADER[:5]))
+        self.assertEqual(extract_cross_reference(self.write_sheet([[1, 'G-1', 'HDPE', 5]], header=CROSS_REFERENCE_SHEET_HEADER[:4]))['mappings'], {})
+
+    def test_blank_grade_column(self):
+        for rows in [[], [[1, None, 'HDPE', 5, 'R1', 'I1', None, None, None, None, None]], [[1, None, 'HDPE', 5] + [None] * 7]]:
+            for extension in ['csv', 'xlsx']:
+                parsed = self.assertParity(self.write_sheet(rows, extension=extension))
+                self.assertEqual(parsed['mappings'], {})
+
+    def test_grades_without_competitor_cells(self):
+        parsed = self.assertParity(self.write_sheet([[1, 'G-1', 'HDPE', 5] + [None] * 7]))
+        self.assertEqual(parsed['mappings'], {'G-1': {}})
+
+    def test_random_sheets(self):
+        generator = random.Random(31)
+        grades = [None, 'G-1', 'G-2', ' g-2 ', 'GAIL Grade', 'null', '', 'B56A003A']
+        cells = [None, '', 'R1', ' R2 ', 'R1, R2', 'R1;R2|R3', 'R1\nR2', 'A/B', 'No Equivalent', '(blank)', 'N/A', 'nan', ', ;', 'x,n/a']
+        for _ in range(50):
+            rows = [
+                [index, generator.choice(grades), 'HDPE', 5] + [generator.choice(cells) for _ in range(7)]
+                for index in range(generator.randint(0, 15))
+            ]
+            self.assertParity(self.write_sheet(rows))
+
+
+class CrossReferenceIngestTests(TestCase):
+    """Each upload is a new version, written as a delta against the active upload"""
+
+    def setUp(self):
+        self.first = cross_reference_upload({
+            'G-100': {'Reliance': ['R100'], 'IOCL': ['I100']},
+            'G-200': {'Reliance': ['R200', 'No Equivalent']},
+        })
+
+    def test_first_upload_inserts_everything(self):
+        self.assertEqual(self.first.ingest_report, {'compared_to': None, 'inserted': 4, 'copied': 0, 'dropped': 0})
+
+    def test_delta_against_active_upload(self):
+        second = cross_reference_upload({
+            'G-100': {'Reliance': ['R100'], 'IOCL': ['I101']},
+            'G-200': {'Reliance': ['R200', 'No Equivalent']},
+            'G-300': {'HPL': ['H300']},
+        }, is_active=False)
+        self.assertEqual(second.ingest_report, {'compared_to': self.first.pk, 'inserted': 2, 'copied': 3, 'dropped': 1})
+        self.assertEqual({row[:3] for row in upload_rows(second)}, {
+            ('G-100', 'Reliance', 'R100'), ('G-100', 'IOCL', 'I101'),
+            ('G-200', 'Reliance', 'R200'), ('G-200', 'Reliance', 'No Equivalent'), ('G-300', 'HPL', 'H300'),
+        })
+        # Copied rows keep their lookup keys and validity
+        self.assertIn(('G-200', 'Reliance', 'No Equivalent', 'g-200', False), upload_rows(second))
+
+    def test_previous_version_is_untouched(self):
+        before = upload_rows(self.first)
+        cross_reference_upload({'G-100': {'Reliance': ['R100']}}, is_active=False)
+        self.assertEqual(upload_rows(self.first), before)
+
+    def test_unchanged_upload_copies_every_row(self):
+        second = cross_reference_upload(self.first.extracted_data['mappings'], is_active=False)
+        self.assertEqual(second.ingest_report, {'compared_to': self.first.pk, 'inserted': 0, 'copied': 4, 'dropped': 0})
+        self.assertEqual(upload_rows(second), upload_rows(self.first))
+
+    def test_dropped_rows_stay_in_the_compared_upload(self):
+        before = upload_rows(self.first)
+        second = cross_reference_upload({'G-100': {'Reliance': ['R100']}}, is_active=False)
+        self.assertEqual(second.ingest_report, {'compared_to': self.first.pk, 'inserted': 0, 'copied': 1, 'dropped': 3})
+        self.assertEqual(upload_rows(self.first), before)
+
+    def test_compaction_archives_versions_without_touching_their_copies(self):
+        second = cross_reference_upload({'G-100': {'Reliance': ['R100'], 'IOCL': ['I101']}}, is_active=False)
+        second.activate()
+        third = cross_reference_upload({'G-100': {'Reliance': ['R100'], 'IOCL': ['I101']}, 'G-300': {'HPL': ['H300']}}, is_active=False)
+        third.activate()
+        self.assertEqual(third.ingest_report, {'compared_to': second.pk, 'inserted': 1, 'copied': 2, 'dropped': 0})
+        third_rows = upload_rows(third)
+        call_command('compact_cross_references', keep=0, stdout=StringIO())
+        self.assertEqual(set(CrossReferenceArchive.objects.values_list('excel_upload_id', flat=True)), {self.first.pk, second.pk})
+        # Only the active version stays hot, and the rows it copied are its own
+        self.assertEqual(CrossReference.objects.count(), len(third_rows))
+        self.assertEqual(upload_rows(third), third_rows)
+        fourth = cross_reference_upload({'G-300': {'HPL': ['H300']}}, is_active=False)
+        self.assertEqual(fourth.ingest_report, {'compared_to': third.pk, 'inserted': 0, 'copied': 1, 'dropped': 2})
+
+    def test_restored_upload_is_compared_against_once_active(self):
+        cross_reference_upload({'G-300': {'HPL': ['H300']}}, is_active=False).activate()
+        call_command('compact_cross_references', keep=0, stdout=StringIO())
+        self.assertFalse(self.first.cross_references.exists())
+        self.first.activate()
+        second = cross_reference_upload(self.first.extracted_data['mappings'], is_active=False)
+        self.assertEqual(second.ingest_report, {'compared_to': self.first.pk, 'inserted': 0, 'copied': 4, 'dropped': 0})
+        self.assertEqual(upload_rows(second), upload_rows(self.first))
+
+    def test_file_of_existing_upload_cannot_be_replaced(self):
+        self.first.file = SimpleUploadedFile('other.xlsx', b'data')
+        with self.assertRaises(ValidationError):
+            self.first.save()
+
+
+class ExcelUploadActivationTests(TestCase):
+    """Activation moves the active-version pointer and the is_active flags together"""
+
+    def setUp(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        self.first = cross_reference_upload({'G-100': {'Reliance': ['R100']}})
+        self.second = cross_reference_upload({'G-200': {'Reliance': ['R200']}}, is_active=False)
+
+    def active_state(self):
+        state = datasets.get_dataset_state(CROSS_REFERENCE, fresh=True)
+        flags = set(ExcelUpload.objects.filter(is_active=True).values_list('id', flat=True))
+        return state.target_id, flags
+
+    def test_activate_switches_pointer_and_flags(self):
+        version = datasets.get_dataset_state(CROSS_REFERENCE, fresh=True).version
+        self.second.activate()
+        self.assertEqual(self.active_state(), (self.second.pk, {self.second.pk}))
+        self.assertGreater(datasets.get_dataset_state(CROSS_REFERENCE, fresh=True).version, version)
+
+    def test_failed_activation_changes_nothing(self):
+        call_command('compact_cross_references', keep=0, stdout=StringIO())
+        self.assertTrue(CrossReferenceArchive.objects.filter(excel_upload=self.second).exists())
+        before = self.active_state()
+
+        def fail_after_switching(key, target_id):
+            switch_dataset(key, target_id)
+            raise RuntimeError('database went away')
+
+        with patch('gail_app.models.switch_dataset', side_effect=fail_after_switching):
+            with self.assertRaises(RuntimeError):
+                self.second.activate()
+        self.assertEqual(self.active_state(), before)
+        # The archived rows were not restored either
+        self.assertTrue(CrossReferenceArchive.objects.filter(excel_upload=self.second).exists())
+        self.assertFalse(self.second.cross_references.exists())
+
+    def test_admin_activates_one_upload_per_type(self):
+        third = cross_reference_upload({'G-300': {'Reliance': ['R300']}}, is_active=False)
+        other_type = [
+            ExcelUpload.objects.create(file=f'excel_files/products_{index}.xlsx', file_type='product_list', extracted_data={}, is_active=False)
+            for index in range(2)
+        ]
+        version = datasets.get_dataset_state(CROSS_REFERENCE, fresh=True).version
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.post('/admin/gail_app/excelupload/', {
+            'action': 'activate_selected',
+            '_selected_action': [self.second.pk, third.pk] + [upload.pk for upload in other_type],
+        })
+        self.assertEqual(response.status_code, 302)
+        # The most recent upload of each type in the selection wins, and the pointer follows the cross-reference one
+        self.assertEqual(self.active_state(), (third.pk, {third.pk, other_type[-1].pk}))
+        self.assertGreater(datasets.get_dataset_state(CROSS_REFERENCE, fresh=True).version, version)
+        self.assertEqual(self.client.get('/api/gail-grades-list/').json()['gail_grades'], ['G-300'])
+
+
+class CrossReferenceSearchTests(TestCase):
+    """Search pages through the rows of an upload with keyset cursors"""
+
+    def setUp(self):
+        self.upload = cross_reference_upload({
+            f'G-{grade}': {'Reliance': [f'R{grade}'], 'IOCL': [f'I{grade}']} for grade in range(100, 107)
+        })
+
+    def search_pages(self, filters, limit=2):
+        rows, cursor = search_cross_references(filters, limit=limit, upload_id=self.upload.pk)
+        pages = [rows]
+        while cursor:
+            rows, cursor = search_cross_references(filters, cursor=cursor, limit=limit, upload_id=self.upload.pk)
+            pages.append(rows)
+        return pages
+
+    def assert_pages_cover(self, pages, expected):
+        ids = [row['id'] for page in pages for row in page]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual({(row['gail_grade'], row['competitor_grade']) for page in pages for row in page}, expected)
+        self.assertTrue(all(len(page) <= 2 for page in pages))
+
+    def test_unranked_paging(self):
+        # Two-character terms cannot use the trigram index
+        pages = self.search_pages({'competitor_grade': 'R1'})
+        self.assertEqual(len(pages), 4)
+        self.assert_pages_cover(pages, {(f'G-{grade}', f'R{grade}') for grade in range(100, 107)})
+
+    def test_ranked_paging(self):
+        if not search_index_available():
+            self.skipTest('FTS5 trigram index unavailable')
+        pages = self.search_pages({'q': 'reliance'})
+        self.assertEqual(len(pages), 4)
+        self.assert_pages_cover(pages, {(f'G-{grade}', f'R{grade}') for grade in range(100, 107)})
+
+    def test_cursor_of_other_search_mode_is_rejected(self):
+        if not search_index_available():
+            self.skipTest('FTS5 trigram index unavailable')
+        _, unranked_cursor = search_cross_references({'competitor_grade': 'R1'}, limit=2, upload_id=self.upload.pk)
+        _, ranked_cursor = search_cross_references({'q': 'reliance'}, limit=2, upload_id=self.upload.pk)
+        with self.assertRaises(InvalidCursor):
+            search_cross_references({'q': 'reliance'}, cursor=unranked_cursor, upload_id=self.upload.pk)
+        with self.assertRaises(InvalidCursor):
+            search_cross_references({'competitor_grade': 'R1'}, cursor=ranked_cursor, upload_id=self.upload.pk)
+
+    def test_ranked_search_reads_only_the_upload(self):
+        if not search_index_available():
+            self.skipTest('FTS5 trigram index unavailable')
+        # Rows that rank better on every page, in versions before and after the searched one
+        for _ in range(2):
+            cross_reference_upload({
+                f'RELIANCE-{grade}': {'Reliance': [f'Reliance R{grade}']} for grade in range(10)
+            }, is_active=False)
+        pages = self.search_pages({'q': 'reliance'})
+        self.assertEqual(len(pages), 4)
+        self.assert_pages_cover(pages, {(f'G-{grade}', f'R{grade}') for grade in range(100, 107)})
+        newest = ExcelUpload.objects.order_by('-id').first()
+        rows, _ = search_cross_references({'q': 'reliance'}, limit=20, upload_id=newest.pk)
+        self.assertEqual(len(rows), 10)
+
+        sql, params = _ranked_search_sql({'q': 'reliance'}, self.upload.pk, None, 2)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in db_cursor.fetchall())
+        # The FTS scan gets the match and both rowid bounds
+        self.assertRegex(plan, r'VIRTUAL TABLE INDEX \d+:M\d*(><|<>)')
+
+    def test_undecodable_cursor_is_rejected(self):
+        with self.assertRaises(InvalidCursor):
+            search_cross_references({'q': 'reliance'}, cursor='not-a-cursor', upload_id=self.upload.pk)
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        if not search_index_available():
+            self.skipTest('FTS5 trigram index unavailable')
+
+        def found(term):
+            rows, _ = search_cross_references({'competitor_grade': term}, upload_id=self.upload.pk)
+            return [row['competitor_grade'] for row in rows]
+
+        row = CrossReference.objects.create(gail_grade='G-900', competitor_name='HPL', competitor_grade='HX900', excel_upload=self.upload)
+        self.assertEqual(found('HX900'), ['HX900'])
+        row.competitor_grade = 'HY900'
+        row.save()
+        self.assertEqual(found('HX900'), [])
+        self.assertEqual(found('HY900'), ['HY900'])
+        row.delete()
+        self.assertEqual(found('HY900'), [])
+
+
+def reset_worker_caches():
+    """Forget the per-worker caches: dataset versions repeat once a test's transaction is rolled back"""
+    datasets._checked_states.clear()
+    cross_reference_cache._snapshots.clear()
+    cross_reference_cache._upload_as_of.cache_clear()
+    cross_reference_cache._diff_uploads.cache_clear()
+    pricing_index._indexes.clear()
+    responses.clear_rendered_payloads()
+
+
+class CrossReferencePricingTestCase(TestCase):
+    """An active cross-reference upload and current stock point and ex-work files"""
+
+    def setUp(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        self.upload = cross_reference_upload({
+            'G-100': {'Reliance': ['R100'], 'IOCL': ['I100']},
+            'G-101': {'Reliance': ['R100']},
+            'G-200': {'Reliance': ['R200'], 'IOCL': ['No Equivalent']},
+        })
+        for file_type, prices in [('stock_point_file', {'G-100': 1000, 'G-101': 1010}), ('ex_work_file', {'G-100': 900})]:
+            PDFUpload.objects.create(file=f'pdfs/{file_type}.pdf', file_type=file_type, month='february', year=2025, extracted_data={'data': [
+                {'sap_code': 'S1', 'location': 'Delhi', 'freight_amount': 50,
+                 'products': [{'product_code': code, 'price': price} for code, price in prices.items()]},
+            ]})
+
+
+@override_settings(DATASET_VERSION_TTL=60)
+class CrossReferenceSnapshotTests(CrossReferencePricingTestCase):
+    """Lookups are answered from the worker's snapshot, which follows every change of the rows"""
+
+    def test_warm_snapshot_answers_without_sql(self):
+        snapshot = get_cross_reference_snapshot()
+        self.client.get('/api/gail-grades-list/')
+        with self.assertNumQueries(0):
+            self.assertIs(get_cross_reference_snapshot(), snapshot)
+            self.assertEqual(snapshot.resolve_grade('g-100').grades, ('G-100',))
+            response = self.client.get('/api/gail-grades-list/')
+        self.assertEqual(response.json()['gail_grades'], ['G-100', 'G-101', 'G-200'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/gail-grades-list/', headers={'if-none-match': response['ETag']}).status_code, 304)
+
+    def test_row_saved_outside_an_upload_changes_the_snapshot(self):
+        etag = self.client.get('/api/gail-grades-list/')['ETag']
+        row = CrossReference.objects.create(gail_grade='G-300', competitor_name='HPL', competitor_grade='H300', excel_upload=self.upload)
+        self.assertIn('G-300', get_cross_reference_snapshot().gail_grades)
+        response = self.client.get('/api/gail-grades-list/', headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('G-300', response.json()['gail_grades'])
+        row.delete()
+        self.assertNotIn('G-300', get_cross_reference_snapshot().gail_grades)
+
+    def test_admin_shows_rows_read_only(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        row = self.upload.cross_references.get(gail_grade='G-100', competitor_name='Reliance')
+        self.assertEqual(self.client.get('/admin/gail_app/crossreference/').status_code, 200)
+        change_url = f'/admin/gail_app/crossreference/{row.pk}/change/'
+        self.assertEqual(self.client.get(change_url).status_code, 200)
+        self.assertEqual(self.client.post(change_url, {'gail_grade': 'G-999'}).status_code, 403)
+        self.assertEqual(self.client.post(f'/admin/gail_app/crossreference/{row.pk}/delete/', {'post': 'yes'}).status_code, 403)
+        self.assertEqual(self.client.get('/admin/gail_app/crossreference/add/').status_code, 403)
+        self.client.post('/admin/gail_app/crossreference/', {'action': 'delete_selected', '_selected_action': [row.pk], 'post': 'yes'})
+        row.refresh_from_db()
+        self.assertEqual(row.gail_grade, 'G-100')
+
+
+class GailEquivalentsTests(CrossReferencePricingTestCase):
+    """Reverse lookup of the GAIL grades a competitor grade is mapped to"""
+
+    def get(self, **params):
+        return self.client.get('/api/gail-equivalents/', params)
+
+    def test_competitor_grade_required(self):
+        self.assertEqual(self.get().status_code, 400)
+
+    def test_unknown_competitor_grade(self):
+        response = self.get(competitor_grade='X999')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['gail_equivalents'], [])
+
+    def test_equivalents_of_competitor_grade(self):
+        response = self.get(competitor_grade=' r100 ')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted((match['gail_grade'], match['competitor_name']) for match in response.json()['gail_equivalents']),
+            [('G-100', 'Reliance'), ('G-101', 'Reliance')]
+        )
+
+    def test_competitor_filter(self):
+        self.assertEqual(self.get(competitor_grade='R100', competitor='IOCL').status_code, 404)
+        self.assertEqual(self.get(competitor_grade='I100', competitor='iocl').json()['total_matches'], 1)
+
+    def test_invalid_mappings_are_not_equivalents(self):
+        self.assertEqual(self.get(competitor_grade='No Equivalent').status_code, 404)
+
+    def test_pricing_at_location(self):
+        data = self.get(competitor_grade='R100', location='delhi').json()
+        self.assertTrue(data['location_found'])
+        pricing = {match['gail_grade']: match['pricing_data'] for match in data['gail_equivalents']}
+        self.assertEqual(pricing['G-100']['stock_point'], {'price': 1000, 'freight_amount': 50, 'landed_cost': 1050, 'sap_code': 'S1', 'available': True})
+        self.assertEqual(pricing['G-100']['ex_work']['landed_cost'], 950)
+        self.assertEqual((pricing['G-101']['ex_work']['price'], pricing['G-101']['ex_work']['available']), (None, False))
+
+    def test_unknown_location(self):
+        data = self.get(competitor_grade='R100', location='Nowhere').json()
+        self.assertFalse(data['location_found'])
+        self.assertTrue(all(match['pricing_data']['stock_point']['sap_code'] is None for match in data['gail_equivalents']))
+
+
+class CrossReferenceBatchTests(CrossReferencePricingTestCase):
+    """Many cross-reference queries resolved in one request"""
+
+    def post(self, body):
+        return self.client.post('/api/cross-reference-batch/', body, content_type='application/json')
+
+    def test_queries_must_be_a_non_empty_list(self):
+        self.assertEqual(self.post({}).status_code, 400)
+        self.assertEqual(self.post({'queries': []}).status_code, 400)
+        self.assertEqual(self.post({'queries': 'G-100'}).status_code, 400)
+
+    def test_batch_limit(self):
+        queries = [{'gail_grade': 'G-100', 'competitor': 'Reliance'}] * 1001
+        self.assertEqual(self.post({'queries': queries}).status_code, 400)
+
+    def test_results_keyed_by_query(self):
+        data = self.post({'queries': [
+            {'gail_grade': 'G-100', 'competitor': 'Reliance'},
+            {'gail_grade': 'G-100', 'competitor': 'Reliance'},
+            {'gail_grade': 'G-200', 'competitor': 'IOCL'},
+            {'gail_grade': 'G-100'},
+        ]}).json()
+        self.assertEqual((data['total_queries'], data['total_found'], data['total_not_found']), (4, 1, 2))
+        self.assertEqual(data['results']['G-100|Reliance|']['equivalent_grades'], ['R100'])
+        # Invalid mappings are not equivalents
+        self.assertFalse(data['results']['G-200|IOCL|']['found'])
+        self.assertFalse(data['results'][str({'gail_grade': 'G-100'})]['found'])
+
+    def test_fuzzy_grade_resolution(self):
+        result = self.post({'queries': [{'gail_grade': 'g-10', 'competitor': 'Reliance'}]}).json()['results']['g-10|Reliance|']
+        self.assertTrue(result['found'])
+        self.assertEqual(sorted(result['resolved_grades']), ['G-100', 'G-101'])
+
+    def test_location_info(self):
+        result = self.post({'queries': [{'gail_grade': 'G-100', 'competitor': 'IOCL', 'location': 'DELHI'}]}).json()['results']['G-100|IOCL|DELHI']
+        self.assertTrue(result['location_available'])
+        self.assertEqual(result['location_info'], {
+            'stock_point_data': [{'sap_code': 'S1', 'price': 1000, 'freight_amount': 50}],
+            'ex_work_data': [{'sap_code': 'S1', 'price': 900, 'freight_amount': 50}],
+        })
+
+    def test_invalid_as_of(self):
+        self.assertEqual(self.post({'queries': [{'gail_grade': 'G-100', 'competitor': 'IOCL'}], 'as_of': 'yesterday'}).status_code, 400)
+
+
+class CrossReferenceDiffTests(TestCase):
+    """What changed between two cross-reference uploads"""
+
+    def setUp(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        self.old = cross_reference_upload({
+            'G-200': {'Reliance': ['R200'], 'IOCL': ['I200']},
+            'G-100': {'Reliance': ['R100']},
+            'G-300': {'HPL': ['H300']},
+        })
+        self.new = cross_reference_upload({
+            'G-200': {'Reliance': ['R201'], 'IOCL': ['I200']},
+            'G-100': {'Reliance': ['R100'], 'IOCL': ['I100']},
+            'G-400': {'HPL': ['H400']},
+        })
+
+    def test_changes_and_counts(self):
+        changes, counts = diff_cross_reference_uploads(self.old.pk, self.new.pk)
+        self.assertEqual(dict(counts), {'added': 2, 'removed': 1, 'changed': 1, 'unchanged': 2})
+        self.assertEqual(changes[('G-200', 'Reliance')], {'status': 'changed', 'added_grades': ['R201'], 'removed_grades': ['R200']})
+        self.assertEqual(changes[('G-300', 'HPL')]['status'], 'removed')
+
+    def test_changes_sorted_and_cached(self):
+        changes, _ = diff_cross_reference_uploads(self.old.pk, self.new.pk)
+        self.assertEqual(list(changes), [('G-100', 'IOCL'), ('G-200', 'Reliance'), ('G-300', 'HPL'), ('G-400', 'HPL')])
+        self.assertIs(diff_cross_reference_uploads(self.old.pk, self.new.pk)[0], changes)
+
+    def test_endpoint_groups_and_filters(self):
+        data = self.client.get('/api/cross-reference-diff/', {'from_upload_id': self.old.pk, 'to_upload_id': self.new.pk}).json()
+        self.assertEqual(list(data['changes']), ['G-100', 'G-200', 'G-300', 'G-400'])
+        self.assertEqual(data['summary']['grades_with_changes'], 4)
+        data = self.client.get('/api/cross-reference-diff/', {'from_upload_id': self.old.pk, 'to_upload_id': self.new.pk, 'competitor': 'hpl'}).json()
+        self.assertEqual(list(data['changes']), ['G-300', 'G-400'])
+
+    def test_unknown_upload(self):
+        response = self.client.get('/api/cross-reference-diff/', {'from_upload_id': 999, 'to_upload_id': self.new.pk})
+        self.assertEqual(response.status_code, 404)
+
+
+class CrossReferenceAsOfTests(TestCase):
+    """as_of names a cross-reference upload by id or by date"""
+
+    def setUp(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        self.old = cross_reference_upload({'G-100': {'Reliance': ['R100']}})
+        self.new = cross_reference_upload({'G-200': {'Reliance': ['R200']}})
+        ExcelUpload.objects.filter(pk=self.old.pk).update(uploaded_at=datetime(2025, 1, 10, 12, tzinfo=dt_timezone.utc))
+        ExcelUpload.objects.filter(pk=self.new.pk).update(uploaded_at=datetime(2025, 2, 10, 12, tzinfo=dt_timezone.utc))
+
+    def test_active_upload_by_default(self):
+        self.assertEqual(resolve_cross_reference_upload(None), self.new.pk)
+        self.assertEqual(resolve_cross_reference_upload(' '), self.new.pk)
+
+    def test_upload_id(self):
+        self.assertEqual(resolve_cross_reference_upload(str(self.old.pk)), self.old.pk)
+
+    def test_latest_upload_on_or_before_date(self):
+        self.assertEqual(resolve_cross_reference_upload('2025-01-10'), self.old.pk)
+        self.assertEqual(resolve_cross_reference_upload('2025-02-09'), self.old.pk)
+        self.assertEqual(resolve_cross_reference_upload('2025-03-01'), self.new.pk)
+
+    def test_unknown_or_malformed_as_of(self):
+        for as_of in ['2024-12-31', '999', 'last-week', '2025-13-01']:
+            with self.assertRaises(InvalidAsOf):
+                resolve_cross_reference_upload(as_of)
+
+    def test_snapshot_cached_per_upload(self):
+        snapshot = get_cross_reference_snapshot(self.old.pk)
+        self.assertEqual(snapshot.gail_grades, ('G-100',))
+        self.assertIs(get_cross_reference_snapshot(self.old.pk), snapshot)
+        self.assertEqual(get_cross_reference_snapshot().gail_grades, ('G-200',))
+
+    def test_endpoints_read_the_named_upload(self):
+        response = self.client.get('/api/gail-grades-list/', {'as_of': '2025-01-31'})
+        self.assertEqual(response.json()['gail_grades'], ['G-100'])
+        self.assertEqual(self.client.get('/api/gail-grades-list/').json()['gail_grades'], ['G-200'])
+
+    def test_invalid_as_of_is_a_bad_request(self):
+        self.assertEqual(self.client.get('/api/gail-grades-list/', {'as_of': 'soon'}).status_code, 400)
+        response = self.client.post('/api/cross-reference-batch/', {
+            'queries': [{'gail_grade': 'G-100', 'competitor': 'Reliance'}], 'as_of': '2024-01-01'
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('ETag', self.client.get('/api/gail-grades-list/', {'as_of': 'soon'}))
+
+    def test_batch_reads_as_of_from_body(self):
+        response = self.client.post('/api/cross-reference-batch/', {
+            'queries': [{'gail_grade': 'G-100', 'competitor': 'Reliance'}], 'as_of': str(self.old.pk)
+        }, content_type='application/json')
+        self.assertTrue(response.json()['results']['G-100|Reliance|']['found'])
+
+
+class CrossReferenceArchiveTests(CrossReferencePricingTestCase):
+    """as_of still reads an upload whose rows were compacted into an archive"""
+
+    def setUp(self):
+        super().setUp()
+        self.old_rows = upload_rows(self.upload)
+        cross_reference_upload({'G-100': {'HPL': ['H100']}})
+        call_command('compact_cross_references', keep=0, stdout=StringIO())
+
+    def get(self, path, **params):
+        return self.client.get(path, {'as_of': self.upload.pk, **params})
+
+    def test_rows_moved_to_archive(self):
+        self.assertFalse(self.upload.cross_references.exists())
+        self.assertTrue(CrossReferenceArchive.objects.filter(excel_upload=self.upload).exists())
+
+    def test_snapshot_endpoints_read_archive(self):
+        self.assertEqual(self.get('/api/gail-grades-list/').json()['gail_grades'], ['G-100', 'G-101', 'G-200'])
+
+    def test_pricing_endpoints_read_archive(self):
+        for path in ['/api/cross-reference-with-competitor-pricing/', '/api/enhanced-cross-reference-pricing/']:
+            response = self.get(path, gail_grade='G-100', location='Delhi')
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(
+                sorted((match['competitor_name'], match['competitor_grade'], match['gail_grade']) for match in response.json()['competitors']),
+                [('IOCL', 'I100', 'G-100'), ('Reliance', 'R100', 'G-100')]
+            )
+        response = self.get('/api/cross-reference-with-competitor-pricing/', gail_grade='G-100', location='Delhi', competitor='hpl')
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_of_archived_upload_is_gone(self):
+        response = self.get('/api/search-cross-reference/', q='reliance')
+        self.assertEqual(response.status_code, 410)
+        self.assertNotIn('ETag', response)
+
+    def test_restore_round_trip(self):
+        call_command('compact_cross_references', restore=self.upload.pk, stdout=StringIO())
+        self.assertEqual(upload_rows(self.upload), self.old_rows)
+        self.assertFalse(CrossReferenceArchive.objects.filter(excel_upload=self.upload).exists())
+        response = self.get('/api/search-cross-reference/', competitor_name='IOCL')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['competitor_grade'] for row in response.json()['results']}, {'I100', 'No Equivalent'})
+
+    def test_compaction_changes_etags(self):
+        etag = self.get('/api/gail-grades-list/')['ETag']
+        call_command('compact_cross_references', restore=self.upload.pk, stdout=StringIO())
+        self.assertNotEqual(self.get('/api/gail-grades-list/')['ETag'], etag)
+
+
+class PricingLocationShapeTests(TestCase):
+    """Location endpoints serve the pricing items as they were extracted"""
+
+    def setUp(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        PDFUpload.objects.create(file='pdfs/stock.pdf', file_type='stock_point_file', month='february', year=2025, extracted_data={'data': [
+            {'sap_code': 'S1', 'location': 'Delhi', 'freight_amount': 50, 'products': [{'product_code': 'G100', 'price': 1500}]},
+            {'sap_code': 'S2', 'location': 'Agra', 'products': []},
+            {'sap_code': 'S3', 'location_grade': 'Pune', 'products': [{'product_code': 'G100', 'price': 1400}]},
+        ]})
+        PDFUpload.objects.create(file='pdfs/ex_work.pdf', file_type='ex_work_file', month='february', year=2025, extracted_data={'data': [
+            {'sap_code': 'E1', 'location_grade': 'Pune', 'freight_amount': 75.5, 'products': [{'product_code': 'G200', 'price': 1450.5}]},
+        ]})
+
+    def grades_at(self, location):
+        return self.client.get('/api/grades-by-location/', {'location': location}).json()
+
+    def test_items_without_products_are_listed(self):
+        self.assertIn('Agra', self.client.get('/api/locations/').json()['locations'])
+        data = self.grades_at('agra')
+        self.assertEqual(data['grades'], [])
+        self.assertEqual(data['location_data'], [{'sap_code': 'S2', 'location': 'Agra', 'file_type': 'stock_point', 'products': []}])
+
+    def test_extracted_values_are_kept(self):
+        self.assertEqual(self.grades_at('Delhi')['location_data'][0]['products'], [{'product_code': 'G100', 'price': 1500}])
+        stock_point_item = pricing_index.get_pricing_index('stock_point_file').location_record('Delhi')
+        self.assertIs(type(stock_point_item['freight_amount']), int)
+        self.assertEqual(pricing_index.get_pricing_index('ex_work_file').price('Pune', 'G200'), 1450.5)
+
+    def test_only_ex_work_items_match_location_grade(self):
+        self.assertEqual(sorted(self.client.get('/api/locations/').json()['locations']), ['Agra', 'Delhi', 'Pune'])
+        data = self.grades_at('Pune')
+        self.assertEqual(data['grades'], ['G200'])
+        self.assertEqual([(item['sap_code'], item['file_type']) for item in data['location_data']], [('E1', 'ex_work')])
+
+
+class CurrentUploadPointerTests(TestCase):
+    """Each pricing file type points at its most recent extracted upload"""
+
+    def setUp(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        self.uploads = [
+            PDFUpload.objects.create(file=f'pdfs/stock_{month}.pdf', file_type='stock_point_file', month=month, year=2025,
+                                     extracted_data=pricing_data(['Delhi']))
+            for month in ['january', 'february', 'march']
+        ]
+
+    def current(self, file_type='stock_point_file'):
+        return datasets.get_dataset_state(file_type, fresh=True).target_id
+
+    def test_delete_moves_pointer_to_next_newest(self):
+        self.assertEqual(self.current(), self.uploads[2].pk)
+        self.uploads[2].delete()
+        self.assertEqual(self.current(), self.uploads[1].pk)
+        self.uploads[0].delete()
+        self.assertEqual(self.current(), self.uploads[1].pk)
+        self.uploads[1].delete()
+        self.assertIsNone(self.current())
+
+    def test_admin_bulk_delete_moves_pointer(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        freight = PDFUpload.objects.create(file='pdfs/freight.pdf', file_type='freight_file', month='march', year=2025,
+                                           extracted_data={'DELHI': {'Amount': 1000}})
+        response = self.client.post('/admin/gail_app/pdfupload/', {
+            'action': 'delete_selected', 'post': 'yes', '_selected_action': [self.uploads[1].pk, self.uploads[2].pk, freight.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.current(), self.uploads[0].pk)
+        self.assertIsNone(self.current('freight_file'))
+
+    def test_unrelated_save_does_not_repoint(self):
+        upload = PDFUpload.objects.get(pk=self.uploads[1].pk)
+        version = datasets.get_dataset_state('stock_point_file', fresh=True).version
+        with patch('gail_app.models.point_at_current_upload') as point:
+            upload.save()
+            upload.extracted_data = pricing_data(['Agra'])
+            upload.save()
+            upload.save(update_fields=['derived_data'])
+        point.assert_not_called()
+        # The data changed, so the workers' caches still go
+        self.assertEqual(datasets.get_dataset_state('stock_point_file', fresh=True).version, version + 3)
+        self.assertEqual(self.current(), self.uploads[2].pk)
+
+    def test_period_and_type_changes_repoint(self):
+        upload = PDFUpload.objects.get(pk=self.uploads[2].pk)
+        with patch('gail_app.models.point_at_current_upload') as point:
+            upload.month = 'april'
+            upload.save()
+        point.assert_called_once_with('stock_point_file')
+        upload.file_type = 'ex_work_file'
+        upload.save()
+        self.assertEqual(self.current(), self.uploads[1].pk)
+        self.assertEqual(self.current('ex_work_file'), upload.pk)
+
+
+class PricingIndexTests(TestCase):
+    """Each worker keeps a location index of the current pricing files, rebuilt per dataset version"""
+
+    def setUp(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        self.upload = PDFUpload.objects.create(file='pdfs/stock.pdf', file_type='stock_point_file', month='february', year=2025, extracted_data={'data': [
+            {'sap_code': 'S1', 'location': ' Delhi ', 'products': [{'product_code': 'G100', 'price': 1000}]},
+            {'sap_code': 'S2', 'location': 'DELHI', 'products': [{'product_code': 'G100', 'price': 1100}, {'product_code': 'G200', 'price': 1200}]},
+        ]})
+
+    def test_items_matched_trimmed_and_case_insensitively(self):
+        index = pricing_index.get_pricing_index('stock_point_file')
+        self.assertEqual([item['sap_code'] for item in index.items_at('delhi')], ['S1', 'S2'])
+        self.assertEqual(index.location_record('DELHI')['sap_code'], 'S1')
+        self.assertIsNone(index.location_record('Agra'))
+
+    def test_prices_from_the_first_item_at_a_location(self):
+        index = pricing_index.get_pricing_index('stock_point_file')
+        self.assertEqual(index.price('Delhi', 'g100'), 1000)
+        self.assertIsNone(index.price('Delhi', 'G200'))
+
+    def test_index_built_once_per_version(self):
+        index = pricing_index.get_pricing_index('stock_point_file')
+        self.assertIs(pricing_index.get_pricing_index('stock_point_file'), index)
+        with self.assertRaises(AttributeError):
+            index.prices = {}
+
+    def test_index_follows_new_uploads(self):
+        index = pricing_index.get_pricing_index('stock_point_file')
+        upload = PDFUpload.objects.create(file='pdfs/stock_march.pdf', file_type='stock_point_file', month='march', year=2025, extracted_data={'data': [
+            {'sap_code': 'S9', 'location': 'Agra', 'products': [{'product_code': 'G100', 'price': 900}]},
+        ]})
+        rebuilt = pricing_index.get_pricing_index('stock_point_file')
+        self.assertEqual((rebuilt.upload_id, rebuilt.locations), (upload.pk, ('Agra',)))
+        self.assertGreater(rebuilt.version, index.version)
+
+    def test_failed_extraction(self):
+        PDFUpload.objects.create(file='pdfs/ex_work.pdf', file_type='ex_work_file', month='february', year=2025, extracted_data={'error': 'unreadable'})
+        index = pricing_index.get_pricing_index('ex_work_file')
+        self.assertTrue(index.extraction_failed)
+        self.assertEqual(index.locations, ())
+
+    def test_no_upload(self):
+        index = pricing_index.get_pricing_index('ex_work_file')
+        self.assertEqual((index.upload_id, index.extraction_failed, index.locations), (None, False, ()))
+
+
+class DerivedDataTests(TestCase):
+    """The get_file_data enrichment computed at ingest"""
+
+    def test_price_summary_keeps_extracted_types(self):
+        derived_data = derive_file_data('stock_point_file', {'data': [
+            {'location': 'Delhi', 'freight_amount': 100, 'products': [
+                {'product_code': 'G100', 'price': 1500}, {'product_code': 'G200', 'price': 1600.5}, {'product_code': 'G300', 'price': 0},
+            ]},
+            {'location': 'Agra', 'products': [{'product_code': 'G100', 'price': 1500}]},
+        ]})
+        delhi, agra = derived_data['document']['data']
+        self.assertEqual(delhi['price_summary'], {
+            'min_price': 1500, 'max_price': 1600.5, 'avg_price': 1550.25, 'total_products': 3,
+            'landed_costs': {'min_landed_cost': 1600, 'max_landed_cost': 1700.5, 'avg_landed_cost': 1650.25},
+        })
+        self.assertIs(type(delhi['price_summary']['min_price']), int)
+        self.assertIs(type(agra['price_summary']['max_price']), int)
+        self.assertNotIn('landed_costs', agra['price_summary'])
+
+    def test_price_stats_match_python_min_max_and_sum(self):
+        locations = [
+            {'products': [{'price': 1500.0}, {'price': 1500}, {'price': 1700}, {'price': 1700.0}]},
+            {'products': [{'price': None}, {'price': 0}]},
+            {'products': [{'price': 1200}, {'price': 1100}, {'price': 1300}]},
+            {},
+            {'products': [{'price': 10.25}, {'price': 20.5}]},
+        ]
+        stats = _location_price_stats(locations)
+        self.assertEqual(list(stats), [0, 2, 4])
+        for position, (min_price, max_price, price_sum, count) in stats.items():
+            prices = [product['price'] for product in locations[position]['products'] if product.get('price')]
+            expected = (min(prices), max(prices), sum(prices), len(prices))
+            self.assertEqual((min_price, max_price, price_sum, count), expected)
+            self.assertEqual([type(value) for value in (min_price, max_price, price_sum, count)], [type(value) for value in expected])
+
+    def test_failed_step_clears_derived_data(self):
+        upload = PDFUpload.objects.create(file='pdfs/stock.pdf', file_type='stock_point_file', month='february', year=2025,
+                                          extracted_data=pricing_data(['Delhi']))
+        for step in ['save_price_entries', 'save_derived_data']:
+            upload.extracted_data = pricing_data(['Delhi'])
+            upload.save()
+            self.assertIsNotNone(PDFUpload.objects.get(pk=upload.pk).derived_data)
+            with patch(f'gail_app.models.{step}', side_effect=RuntimeError(step)):
+                upload.extracted_data = pricing_data(['Agra'])
+                upload.save()
+            self.assertIsNone(upload.derived_data, step)
+            self.assertIsNone(PDFUpload.objects.get(pk=upload.pk).derived_data, step)
+
+
+class FileDataWithoutDerivedDataTests(TestCase):
+    """get_file_data derives missing enrichment in memory and never writes it"""
+
+    def setUp(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        extracted_data = pricing_data(['Delhi', 'Agra', 'Dehradun', 'Pune'])
+        extracted_data['data'][0]['freight_amount'] = 100
+        extracted_data['data'][2]['products'][0]['price'] = 5000
+        self.stock_point = PDFUpload.objects.create(file='pdfs/stock.pdf', file_type='stock_point_file', month='february', year=2025,
+                                                    extracted_data=extracted_data)
+        self.freight = PDFUpload.objects.create(file='pdfs/freight.pdf', file_type='freight_file', month='february', year=2025,
+                                                extracted_data={'DELHI': {'Amount': 100}})
+        self.stored_responses = {params: self.get(params) for params in self.queries()}
+        reset_worker_caches()
+        PDFUpload.objects.update(derived_data=None)
+        PricingLocation.objects.all().delete()
+
+    def queries(self):
+        return [
+            (),
+            (('limit', '2'),),
+            (('location_prefix', 'd'),),
+            (('has_freight', 'true'), ('fields', 'location')),
+            (('product_code', 'g100'), ('min_price', '2000')),
+            (('max_price', '1001'),),
+        ]
+
+    def get(self, params):
+        response = self.client.get('/api/pdf/file-data/', {'file_type': 'stock_point_file', 'month': 'february', 'year': 2025, **dict(params)})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_same_responses_as_stored_derived_data(self):
+        self.assertEqual([record['location'] for record in self.stored_responses[(('location_prefix', 'd'),)]['data']], ['Delhi', 'Dehradun'])
+        self.assertEqual([record['location'] for record in self.stored_responses[(('product_code', 'g100'), ('min_price', '2000'))]['data']], ['Dehradun'])
+        self.assertEqual(self.stored_responses[()]['freight_summary']['total_freight_locations'], 1)
+        for params in self.queries():
+            self.assertEqual(self.get(params), self.stored_responses[params], params)
+        self.assertFalse(PDFUpload.objects.filter(derived_data__isnull=False).exists())
+        self.assertFalse(PricingLocation.objects.exists())
+
+    def test_cursor_paging_in_memory(self):
+        first = self.get((('limit', '3'),))
+        second = self.get((('limit', '3'), ('cursor', first['next_cursor'])))
+        self.assertEqual([record['location'] for record in first['data'] + second['data']], ['Delhi', 'Agra', 'Dehradun', 'Pune'])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_command_stores_derived_data(self):
+        call_command('rebuild_derived_data', stdout=StringIO())
+        self.assertFalse(PDFUpload.objects.filter(derived_data__isnull=True).exists())
+        self.assertEqual(PricingLocation.objects.filter(pdf_upload=self.stock_point).count(), 4)
+        reset_worker_caches()
+        self.assertEqual(self.get(()), self.stored_responses[()])
+
+    def test_response_after_rebuild_is_rebuilt(self):
+        self.assertEqual(self.get(())['data'][1]['price_summary']['min_price'], 1001)
+        extracted_data = pricing_data(['Delhi', 'Agra'], products=('G100',))
+        extracted_data['data'][1]['products'][0]['price'] = 1500
+        # Rows rewritten under the upload, as a rebuild after a code change would find them
+        PDFUpload.objects.filter(pk=self.stock_point.pk).update(extracted_data=extracted_data)
+        call_command('rebuild_derived_data', all=True, stdout=StringIO())
+        response = self.get(())
+        self.assertEqual([record['location'] for record in response['data']], ['Delhi', 'Agra'])
+        self.assertEqual(response['data'][1]['price_summary']['min_price'], 1500)
+
+
+class StreamingJSONTests(TestCase):
+    """Streamed JSON is the same document DRF renders, encoded piece by piece"""
+
+    def test_same_bytes_as_json_renderer(self):
+        data = {
+            'data': [{'location': 'Dĕlhi ', 'products': [{'price': 1.5}], 'sap_code': None}, {'day': date(2025, 2, 1)}],
+            1: True,
+            'nested': {'deeper': {'deepest': ['a', 2]}},
+        }
+        self.assertEqual(b''.join(iter_json_chunks(data, chunk_size=8)), JSONRenderer().render(data))
+
+    def test_iterators_and_object_items_are_consumed_lazily(self):
+        consumed = []
+
+        def records():
+            for index in range(3):
+                consumed.append(index)
+                yield {'index': index}
+
+        chunks = iter_json_chunks({'data': records(), 'totals': JSONObjectItems(iter([('count', 3)]))}, chunk_size=1)
+        first = next(chunks)
+        self.assertEqual(consumed, [])
+        self.assertEqual(first + b''.join(chunks), b'{"data":[{"index":0},{"index":1},{"index":2}],"totals":{"count":3}}')
+
+    def test_file_data_stream(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        PDFUpload.objects.create(file='pdfs/stock.pdf', file_type='stock_point_file', month='february', year=2025,
+                                 extracted_data=pricing_data(['Delhi', 'Agra']))
+        params = {'file_type': 'stock_point_file', 'month': 'february', 'year': 2025}
+        streamed = self.client.get('/api/pdf/file-data/', {**params, 'stream': 'true'})
+        self.assertTrue(streamed.streaming)
+        buffered = self.client.get('/api/pdf/file-data/', params)
+        self.assertEqual(json.loads(b''.join(streamed.streaming_content)), buffered.json())
+
+
+def streamed_view(request):
+    return StreamingHttpResponse(iter([b'{"a":', b'1}']))
+
+
+def failing_view(request):
+    raise RuntimeError('view failed')
+
+
+def exiting_view(request):
+    os._exit(3)
+
+
+def slow_view(request):
+    time.sleep(30)
+
+
+@skipUnless(hasattr(os, 'fork'), 'needs fork')
+class MeasureResponseTests(SimpleTestCase):
+    """Benchmark measurements run in a child process that always reports back"""
+
+    def measure(self, view, timeout=30):
+        return measure_response_in_process(multiprocessing.get_context('fork'), view, {}, timeout=timeout)
+
+    def test_measurements(self):
+        result = self.measure(streamed_view)
+        self.assertEqual(result['bytes'], 7)
+        self.assertEqual(set(result), {'bytes', 'ttfb_ms', 'seconds', 'peak_rss_mb'})
+
+    def test_view_error_is_reported(self):
+        self.assertEqual(self.measure(failing_view), {'error': 'RuntimeError: view failed'})
+
+    def test_process_exit_is_reported(self):
+        self.assertEqual(self.measure(exiting_view), {'error': 'measuring process exited with code 3'})
+
+    def test_timeout(self):
+        self.assertEqual(self.measure(slow_view, timeout=0.5), {'error': 'no result within 0.5s'})
+
+
+def buffered_view(request):
+    return HttpResponse(b'{"a":1}', content_type='application/json')
+
+
+class RenderedPayloadTests(TestCase):
+    """Each worker keeps rendered response bodies until the datasets they were built from change"""
+
+    def setUp(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        self.upload = PDFUpload.objects.create(file='pdfs/stock.pdf', file_type='stock_point_file', month='february', year=2025,
+                                               extracted_data=pricing_data(['Delhi', 'Agra']))
+
+    def get_locations(self, **headers):
+        return self.client.get('/api/locations/', headers=headers)
+
+    def test_body_served_from_store_until_upload(self):
+        first = self.get_locations()
+        with patch('gail_app.views.get_pricing_index', side_effect=AssertionError('view called')):
+            self.assertEqual(self.get_locations().content, first.content)
+        PDFUpload.objects.create(file='pdfs/stock_march.pdf', file_type='stock_point_file', month='march', year=2025,
+                                 extracted_data=pricing_data(['Pune']))
+        self.assertEqual(self.get_locations().json()['locations'], ['Pune'])
+
+    def test_compressed_variants(self):
+        identity = self.get_locations().content
+        response = self.get_locations(accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), identity)
+        self.assertNotIn('Content-Encoding', self.get_locations(accept_encoding='gzip;q=0').headers)
+
+    def test_errors_are_not_stored(self):
+        response = self.client.get('/api/pdf/file-data/', {'file_type': 'stock_point_file', 'month': 'july', 'year': 2025})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(responses._payloads), 0)
+
+    def test_stream_parameter_shares_the_stored_body(self):
+        params = {'file_type': 'stock_point_file', 'month': 'february', 'year': 2025}
+        body = self.client.get('/api/pdf/file-data/', params).content
+        self.assertEqual(self.client.get('/api/pdf/file-data/', {**params, 'stream': 'true'}).content, body)
+        self.assertEqual(len(responses._payloads), 1)
+
+    @override_settings(RENDERED_PAYLOAD_CACHE_MB=0.001)
+    def test_store_budget(self):
+        # About 1 kB: bodies over a quarter of it are not stored, and the least recently used go first
+        def stored():
+            return [key for key, _ in responses._payloads]
+
+        responses.store_rendered_payload(('large', ()), (1,), b'x' * 300)
+        for name in ['a', 'b', 'c', 'd']:
+            responses.store_rendered_payload((name, ()), (1,), b'x' * 250)
+        self.assertEqual(stored(), ['a', 'b', 'c', 'd'])
+        self.assertIsNotNone(responses.get_rendered_payload(('a', ()), (1,)))
+        responses.store_rendered_payload(('e', ()), (1,), b'x' * 250)
+        self.assertEqual(stored(), ['c', 'd', 'a', 'e'])
+        self.assertIsNone(responses.get_rendered_payload(('c', ()), (2,)))
+        self.assertEqual(stored(), ['d', 'a', 'e'])
+
+    @skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_benchmark_measures_plain_responses(self):
+        result = measure_response_in_process(multiprocessing.get_context('fork'), buffered_view, {})
+        self.assertEqual(result['bytes'], 7)
+
+
+class ConditionalGetTests(TestCase):
+    """Read endpoints validate on the versions of the datasets they are built from"""
+
+    def setUp(self):
+        reset_worker_caches()
+        self.addCleanup(reset_worker_caches)
+        cross_reference_upload({'G-100': {'Reliance': ['R100']}})
+
+    def get(self, path='/api/gail-grades-list/', params=None, **headers):
+        return self.client.get(path, params or {}, headers=headers)
+
+    def test_ok_response_has_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.get(if_modified_since=self.get()['Last-Modified']).status_code, 304)
+
+    def test_etag_changes_with_dataset_version(self):
+        etag = self.get()['ETag']
+        bump_dataset_version(CROSS_REFERENCE)
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def assertModifiedAfter(self, change, path='/api/gail-grades-list/', params=None):
+        etag = self.get(path, params)['ETag']
+        self.assertEqual(self.get(path, params, if_none_match=etag).status_code, 304)
+        change()
+        response = self.get(path, params, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_etag_changes_with_cross_reference_rows(self):
+        upload = ExcelUpload.objects.get()
+        self.assertModifiedAfter(lambda: CrossReference.objects.create(
+            gail_grade='G-200', competitor_name='Reliance', competitor_grade='R200', excel_upload=upload))
+        self.assertModifiedAfter(lambda: CrossReference.objects.get(gail_grade='G-200').delete())
+
+    def test_etag_changes_after_derived_data_rebuild(self):
+        upload = PDFUpload.objects.create(file='pdfs/stock.pdf', file_type='stock_point_file', month='february', year=2025,
+                                          extracted_data=pricing_data(['Delhi']))
+        params = {'file_type': 'stock_point_file', 'month': 'february', 'year': 2025}
+        
+        def rebuild():
+            PDFUpload.objects.filter(pk=upload.pk).update(extracted_data=pricing_data(['Delhi', 'Agra']))
+            call_command('rebuild_derived_data', '--all', stdout=StringIO())
+        
+        response = self.assertModifiedAfter(rebuild, '/api/pdf/file-data/', params)
+        self.assertEqual([record['location'] for record in response.json()['data']], ['Delhi', 'Agra'])
+
+    def test_etag_changes_after_freight_history_rebuild(self):
+        upload = PDFUpload.objects.create(file='pdfs/freight.xlsx', file_type='freight_file', month='february', year=2025,
+                                          extracted_data={'Delhi': {'Amount': 1000, 'Unit': 'MT'}})
+        save_freight_history(upload)
+        
+        def rebuild():
+            PDFUpload.objects.filter(pk=upload.pk).update(extracted_data={'Delhi': {'Amount': 1100, 'Unit': 'MT'}})
+            call_command('rebuild_freight_history', stdout=StringIO())
+        
+        response = self.assertModifiedAfter(rebuild, '/api/freight-data/', {'as_of': '2025-02-10'})
+        self.assertEqual(response.json()['freight_data']['Delhi']['Amount'], 1100)
+
+    def test_etag_depends_on_request(self):
+        etag = self.get()['ETag']
+        self.assertNotEqual(self.get(params={'as_of': '2099-01-01'})['ETag'], etag)
+        self.assertNotEqual(self.get(accept='application/json; indent=2')['ETag'], etag)
+
+    def test_etag_per_content_encoding(self):
+        path = '/api/locations/'
+        self.assertNotEqual(self.get(path)['ETag'], self.get(path, accept_encoding='gzip')['ETag'])
+
+    def test_errors_have_no_validators(self):
+        for path, params in [('/api/gail-grades-list/', {'as_of': 'soon'}), ('/api/grades-by-location/', {})]:
+            response = self.get(path, params)
+            self.assertEqual(response.status_code, 400, path)
+            self.assertNotIn('ETag', response)
+            self.assertNotIn('Last-Modified', response)
@@ -35,6 +35,8 @@ urlpatterns = [
     
     # Legacy Cross-reference endpoints
     path('cross-reference-query/', views.cross_reference_query, name='cross_reference_query'),
+    path('cross-reference-batch/', views.cross_reference_batch, name='cross_reference_batch'),
+    path('cross-reference-diff/', views.cross_reference_diff, name='cross_reference_diff'),
     path('companies-list/', views.get_companies_list, name='get_companies_list'),
     path('gail-grades-list/', views.get_gail_grades_list, name='get_gail_grades_list'),
     path('search-cross-reference/', views.search_cross_reference, name='search_cross_reference'),
@@ -42,4 +44,5 @@ urlpatterns = [
     # In urls.py, you can either replace existing URLs or add new ones
     path('enhanced-cross-reference-pricing/', views.enhanced_cross_reference_with_competitor_pricing, name='enhanced_cross_reference_pricing'),
     path('enhanced-competitors-for-grade/', views.enhanced_get_competitors_for_grade, name='enhanced_competitors_for_grade'),
+    path('gail-equivalents/', views.gail_equivalents_for_competitor_grade, name='gail_equivalents_for_competitor_grade'),
 ]
\ No newline at end of file
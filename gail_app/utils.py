@@ -1,12 +1,31 @@
+import calendar
 import json
+import math
+import re
+import time
+import zlib
 import tabula  # Correct import for tabula-py
 import camelot
+import numpy as np
 import pandas as pd
 import pdfplumber
 from pprint import pprint
 from Levenshtein import ratio
 from collections import defaultdict
 import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from functools import partial
+from django.conf import settings
+from django.db import connection, transaction
+from .datasets import CROSS_REFERENCE, CURRENT_UPLOAD_FILE_TYPES, bump_dataset_version, get_dataset_state, switch_dataset
+
+try:
+    import python_calamine  # Optional: much faster read-only Excel reader
+    EXCEL_READ_ENGINE = "calamine"
+except ImportError:
+    EXCEL_READ_ENGINE = None  # pandas default (openpyxl in read-only mode)
 
 
 FILE_TYPE_MAPPING = {
@@ -32,6 +51,42 @@ MONTH_MAPPING = {
 }
 
 
+# Excel freight workbooks: column E holds the city, F:K its freight attributes
+FREIGHT_EXCEL_USECOLS = "E:K"
+FREIGHT_EXCEL_FIELDS = ["Amount", "Unit", "Per", "UoM", "Valid_From", "Valid_To"]
+
+# HPL freight rate PDFs: the first eight table columns, in order
+FREIGHT_PDF_COLUMNS = ["sl_no", "state", "sector", "district", "destination", "distance", "transit_time", "amount"]
+FREIGHT_PDF_HEADER_DESTINATIONS = ['DESTINATION / CONSUMPTION POINT', 'DESTINATION/CONSUMPTION POINT']
+NON_DECIMAL_CHARS = re.compile(r'[^0-9.]')
+NON_DIGIT_CHARS = re.compile(r'[^0-9]')
+NON_ASCII_CHARS = re.compile(r'[^\x00-\x7f]')
+
+# Cross-reference sheets: column B is the GAIL grade, E-K the competitors,
+# and these values mean "no grade". Columns A-K are read: a row with data in A, C or D
+# only is still a row of the sheet
+CROSS_REFERENCE_USECOLS = list(range(11))
+INVALID_GAIL_GRADES = ['nan', 'null', '', 'gail grade']
+INVALID_COMPETITOR_CELLS = ['nan', 'null', '', 'no equivalent', '(blank)']
+INVALID_COMPETITOR_GRADES = ['nan', 'null', '', 'no equivalent', 'n/a', '(blank)']
+GRADE_DELIMITERS = [',', ';', '|', '\n', '/']
+GRADE_SEPARATOR = '\x1f'
+
+# Competitor grades the cross-reference lookups treat as "no mapping", compared
+# against the normalized key
+UNMAPPED_COMPETITOR_GRADES = ['no equivalent', '', '(blank)']
+
+# Keys with a prefix are the range [prefix, prefix + MAX_CHARACTER), which can use an index
+# (LIKE 'prefix%' cannot on SQLite)
+MAX_CHARACTER = chr(0x10FFFF)
+
+# Formats seen in freight Valid_From/Valid_To values
+VALIDITY_DATE_FORMATS = ['%Y-%m-%d', '%d %b, %Y', '%d %B, %Y', '%d.%m.%Y', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S']
+
+# File types whose extracted data is location -> product prices, kept as PriceEntry rows
+PRICING_FILE_TYPES = ['stock_point_file', 'ex_work_file']
+
+
 def word_similarity(word1, word2):
     """
     Computes the similarity score between two words based on Levenshtein Ratio.
@@ -109,6 +164,10 @@ def extract_cross_reference(file_path):
     """
     Extract cross-reference data from Excel/CSV files.
     Fixed to handle the exact structure of your Excel file.
+
+    Only columns A-K, which hold the GAIL grade (B) and the competitors (E-K), are read. The
+    competitor cells are reshaped into one long column, and multi-grade cells are
+    split and filtered with whole-column string operations.
     
     Args:
         file_path (str): Path to the Excel/CSV file.
@@ -124,23 +183,12 @@ def extract_cross_reference(file_path):
         print(f"File format: {file_format}")
         
         if file_format == 'excel':
-            df = pd.read_excel(file_path)
+            read_sheet = partial(pd.read_excel, file_path, engine=EXCEL_READ_ENGINE)
         elif file_format == 'csv':
-            df = pd.read_csv(file_path)
+            read_sheet = partial(pd.read_csv, file_path)
         else:
             return {"error": f"Unsupported file format: {file_format}"}
         
-        print(f"File loaded successfully. Shape: {df.shape}")
-        print(f"Original columns: {df.columns.tolist()}")
-        
-        # Clean column names and remove extra spaces
-        df.columns = df.columns.astype(str).str.strip()
-        print(f"Cleaned columns: {df.columns.tolist()}")
-        
-        # Remove completely empty rows
-        df = df.dropna(how='all')
-        print(f"After removing empty rows - Shape: {df.shape}")
-        
         cross_reference_data = {
             "companies": [],
             "mappings": {},
@@ -151,86 +199,74 @@ def extract_cross_reference(file_path):
             }
         }
         
-        if df.empty or len(df.columns) < 5:
+        # Column 1 is the "GAIL Grade" column, columns 4-10 are the competitors
+        try:
+            df = read_sheet(usecols=CROSS_REFERENCE_USECOLS)
+        except ValueError:
+            # Narrower sheets: keep only the competitor columns that exist
+            total_columns = len(read_sheet(nrows=0).columns)
+            if total_columns < 5:
+                print(f"❌ Not enough columns or empty DataFrame")
+                return cross_reference_data
+            df = read_sheet(usecols=CROSS_REFERENCE_USECOLS[:total_columns])
+        df.columns = df.columns.astype(str).str.strip()
+        print(f"File loaded successfully. Shape: {df.shape}")
+        
+        if df.dropna(how='all').empty:
             print(f"❌ Not enough columns or empty DataFrame")
             return cross_reference_data
         
-        
-        gail_column = df.columns[1]  # "GAIL Grade" column
-        competitor_columns = df.columns[4:11].tolist()  # Columns 4-10 are the competitors
+        gail_column = df.columns[1]
+        competitor_columns = [col for col in df.columns[4:].tolist() if col]
+        cross_reference_data["companies"] = competitor_columns
+        cross_reference_data["metadata"]["total_companies"] = len(competitor_columns)
         
         print(f"GAIL column: '{gail_column}'")
         print(f"Competitor columns: {competitor_columns}")
         
-        # Clean competitor column names and store them
-        competitor_columns = [col.strip() for col in competitor_columns if col.strip()]
-        cross_reference_data["companies"] = competitor_columns
-        cross_reference_data["metadata"]["total_companies"] = len(competitor_columns)
+        # Skip rows where the GAIL grade is empty or invalid
+        # astype(str), not map(str): an all-blank column stays float and has no .str
+        gail_grades = df[gail_column].dropna().astype(str).str.strip()
+        gail_grades = gail_grades[~gail_grades.str.lower().isin(INVALID_GAIL_GRADES)]
+        cross_reference_data["mappings"] = {gail_grade: {} for gail_grade in gail_grades.unique()}
         
-        print(f"Processing {len(competitor_columns)} competitor columns...")
+        # Reshape competitor cells to long form, row by row in column order
+        competitor_cells = df.loc[gail_grades.index, competitor_columns].to_numpy(dtype=object)
+        cells = pd.DataFrame({
+            "row": np.repeat(np.arange(len(gail_grades)), len(competitor_columns)),
+            "competitor": np.tile(np.arange(len(competitor_columns)), len(gail_grades)),
+            "value": competitor_cells.ravel(),
+        })
+        cells = cells[cells["value"].notna()]
+        values = cells["value"].astype(str).str.strip()
+        keep = ~values.str.lower().isin(INVALID_COMPETITOR_CELLS)
+        cells, values = cells[keep], values[keep]
         
-        mappings_count = 0
-        b56_found = False
+        # Split multi-grade cells on the first delimiter (in priority order) they contain
+        split_values = values
+        has_delimiter = pd.Series(False, index=values.index)
+        for delimiter in GRADE_DELIMITERS:
+            use_delimiter = ~has_delimiter & values.str.contains(delimiter, regex=False)
+            split_values = split_values.where(~use_delimiter, values.str.replace(delimiter, GRADE_SEPARATOR, regex=False))
+            has_delimiter |= use_delimiter
+        cells = cells.assign(grade=split_values.str.split(GRADE_SEPARATOR, regex=False)).explode("grade")
         
-        for index, row in df.iterrows():
-            # Get GAIL grade (product code)
-            gail_grade = str(row[gail_column]).strip()
-            
-            # Debug B56A003A specifically
-            if 'B56A003' in gail_grade:
-                print(f"Row {index}: Found B56A003 variant: '{gail_grade}'")
-                b56_found = True
-                
-                # Check all competitor values for this row
-                for comp_col in competitor_columns:
-                    if comp_col in df.columns:
-                        comp_value = str(row[comp_col]).strip() if pd.notna(row[comp_col]) else 'NaN'
-                        print(f"  {comp_col}: '{comp_value}'")
-            
-            # Skip if GAIL grade is empty or invalid
-            if (pd.isna(row[gail_column]) or 
-                not gail_grade or 
-                gail_grade.lower() in ['nan', 'null', '', 'gail grade']):
-                continue
-            
-            if gail_grade not in cross_reference_data["mappings"]:
-                cross_reference_data["mappings"][gail_grade] = {}
-            
-            # Process each competitor column
-            for competitor in competitor_columns:
-                if competitor not in df.columns:
-                    print(f"Warning: Competitor column '{competitor}' not found in DataFrame")
-                    continue
-                    
-                competitor_grade = str(row[competitor]).strip()
-                
-                # Skip if competitor grade is empty, NaN, or "No equivalent"
-                if (pd.isna(row[competitor]) or 
-                    not competitor_grade or 
-                    competitor_grade.lower() in ['nan', 'null', '', 'no equivalent', '(blank)']):
-                    continue
-                
-                # Handle multiple grades with various delimiters
-                competitor_grades = []
-                for delimiter in [',', ';', '|', '\n', '/']:
-                    if delimiter in competitor_grade:
-                        competitor_grades = [grade.strip() for grade in competitor_grade.split(delimiter)]
-                        break
-                else:
-                    competitor_grades = [competitor_grade]
-                
-                # Filter out empty and invalid grades
-                competitor_grades = [
-                    grade for grade in competitor_grades 
-                    if grade and grade.lower() not in ['nan', 'null', '', 'no equivalent', 'n/a', '(blank)']
-                ]
-                
-                if competitor_grades:
-                    cross_reference_data["mappings"][gail_grade][competitor] = competitor_grades
-                    mappings_count += len(competitor_grades)
+        # Filter out empty and invalid grades
+        cells["grade"] = cells["grade"].str.strip()
+        cells = cells[(cells["grade"] != '') & ~cells["grade"].str.lower().isin(INVALID_COMPETITOR_GRADES)]
         
-        print(f"B56A003A variants found during processing: {b56_found}")
-        print(f"Final mappings for B56A003A: {cross_reference_data['mappings'].get('B56A003A', 'NOT FOUND')}")
+        # Cells are still in row-major order, so each (row, competitor) cell is one contiguous run
+        cell_ids = cells["row"].to_numpy() * len(competitor_columns) + cells["competitor"].to_numpy()
+        starts = np.flatnonzero(np.diff(cell_ids, prepend=-1))
+        grade_runs = np.split(cells["grade"].to_numpy(dtype=object), starts[1:])
+        
+        # Later rows replace earlier ones for the same GAIL grade and competitor
+        row_grades = gail_grades.to_numpy(dtype=object)
+        mappings = cross_reference_data["mappings"]
+        for cell_id, competitor_grades in zip(cell_ids[starts], grade_runs):
+            row, competitor_index = divmod(int(cell_id), len(competitor_columns))
+            mappings[row_grades[row]][competitor_columns[competitor_index]] = competitor_grades.tolist()
+        mappings_count = len(cells)
         
         cross_reference_data["metadata"]["total_mappings"] = mappings_count
         
@@ -251,38 +287,612 @@ def extract_cross_reference(file_path):
         traceback.print_exc()
         return {"error": f"Failed to extract cross-reference data: {str(e)}"}
     
+def normalize_key(value):
+    """
+    Normalize a grade or competitor name into its lookup key: trimmed and case-folded.
+
+    Args:
+        value: The raw value, may be None
+
+    Returns:
+        str: The lookup key, or None for None
+    """
+    if value is None:
+        return None
+    return str(value).strip().casefold()
+
+
+def cross_reference_keys(gail_grade, competitor_name, competitor_grade):
+    """
+    Compute the normalized lookup columns of a CrossReference row.
+
+    Returns:
+        dict: gail_grade_key, competitor_key, competitor_grade_key and is_valid
+    """
+    competitor_grade_key = normalize_key(competitor_grade)
+    return {
+        'gail_grade_key': normalize_key(gail_grade),
+        'competitor_key': normalize_key(competitor_name),
+        'competitor_grade_key': competitor_grade_key,
+        'is_valid': competitor_grade_key is not None and competitor_grade_key not in UNMAPPED_COMPETITOR_GRADES
+    }
+
+
+def _copy_cross_references(row_ids, excel_upload_instance):
+    """
+    Copy CrossReference rows (keys, validity and creation time included) into another
+    upload with INSERT ... SELECT, without loading them.
+    """
+    from .models import CrossReference  # Import here to avoid circular imports
+    
+    table = connection.ops.quote_name(CrossReference._meta.db_table)
+    columns = [
+        connection.ops.quote_name(field.column)
+        for field in CrossReference._meta.concrete_fields
+        if field.name not in ('id', 'excel_upload')
+    ]
+    upload_column = connection.ops.quote_name(CrossReference._meta.get_field('excel_upload').column)
+    with connection.cursor() as db_cursor:
+        for i in range(0, len(row_ids), 500):
+            chunk = row_ids[i:i + 500]
+            db_cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}, {upload_column}) "
+                f"SELECT {', '.join(columns)}, %s FROM {table} WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                [excel_upload_instance.pk] + chunk
+            )
+
+
 def save_cross_reference_to_db(excel_upload_instance):
     """
     Save cross-reference data to individual CrossReference model instances.
     This makes querying much faster and more efficient.
+
+    Every upload is its own immutable version of the dataset. Its mappings are diffed
+    against the active upload's rows by (gail_grade, competitor_name, competitor_grade)
+    tuple: unchanged rows are copied into the new version inside the database, and only
+    the added mappings are built and inserted, in one transaction.
+
+    Each version holds a full copy of its rows, so storage grows with every upload until
+    compact_cross_references archives the old versions. Nothing is deleted from the
+    upload compared against.
+
+    Returns:
+        dict: The compared upload's id as 'compared_to', and row counts of the new version:
+            'inserted' (built for mappings the compared upload lacks), 'copied' (copied from
+            it) and 'dropped' (its rows left out of the new version, which it keeps), or
+            None if there is nothing to save.
     """
-    from .models import CrossReference  # Import here to avoid circular imports
+    from .models import CrossReference, CrossReferenceArchive  # Import here to avoid circular imports
     
     if not excel_upload_instance.extracted_data or 'mappings' not in excel_upload_instance.extracted_data:
-        return
-    
-    # Clear existing cross-references for this upload
-    CrossReference.objects.filter(excel_upload=excel_upload_instance).delete()
+        return None
     
-    # Create new cross-reference entries
-    cross_references = []
     mappings = excel_upload_instance.extracted_data['mappings']
+    new_rows = {
+        (gail_grade, competitor_name, competitor_grade)
+        for gail_grade, competitors in mappings.items()
+        for competitor_name, competitor_grades in competitors.items()
+        for competitor_grade in competitor_grades
+    }
+    
+    active_id = get_dataset_state(CROSS_REFERENCE, fresh=True).target_id
+    base_id = active_id if active_id != excel_upload_instance.pk else None
     
-    for gail_grade, competitors in mappings.items():
-        for competitor_name, competitor_grades in competitors.items():
-            for competitor_grade in competitor_grades:
-                cross_references.append(
-                    CrossReference(
-                        gail_grade=gail_grade,
-                        competitor_name=competitor_name,
-                        competitor_grade=competitor_grade,
-                        excel_upload=excel_upload_instance
+    with transaction.atomic():
+        # A fresh upload has no rows yet; anything left from a failed ingest is replaced
+        CrossReferenceArchive.objects.filter(excel_upload=excel_upload_instance).delete()
+        CrossReference.objects.filter(excel_upload=excel_upload_instance).delete()
+        
+        base_rows = {
+            (gail_grade, competitor_name, competitor_grade): row_id
+            for row_id, gail_grade, competitor_name, competitor_grade in CrossReference.objects.filter(
+                excel_upload_id=base_id
+            ).order_by('id').values_list('id', 'gail_grade', 'competitor_name', 'competitor_grade')
+        } if base_id else {}
+        
+        copied_ids = [row_id for row, row_id in base_rows.items() if row in new_rows]
+        _copy_cross_references(copied_ids, excel_upload_instance)
+        
+        cross_references = [
+            CrossReference(
+                gail_grade=gail_grade,
+                competitor_name=competitor_name,
+                competitor_grade=competitor_grade,
+                excel_upload=excel_upload_instance,
+                **cross_reference_keys(gail_grade, competitor_name, competitor_grade)
+            )
+            for gail_grade, competitor_name, competitor_grade in new_rows
+            if (gail_grade, competitor_name, competitor_grade) not in base_rows
+        ]
+        # Bulk create for efficiency
+        CrossReference.objects.bulk_create(cross_references, batch_size=1000)
+    
+    ingest_report = {
+        'compared_to': base_id,
+        'inserted': len(cross_references),
+        'copied': len(copied_ids),
+        'dropped': len(base_rows) - len(copied_ids)
+    }
+    print(f"Cross-reference rows against upload {base_id}: {ingest_report['inserted']} inserted, "
+          f"{ingest_report['copied']} copied, {ingest_report['dropped']} dropped.")
+    return ingest_report
+
+
+def archive_cross_references(excel_upload_instance):
+    """
+    Move an upload's CrossReference rows into its CrossReferenceArchive: one
+    zlib-compressed JSON blob, written and the rows deleted in one transaction.
+
+    Returns:
+        int: Number of rows archived
+    """
+    from .models import CrossReference, CrossReferenceArchive  # Import here to avoid circular imports
+    
+    rows = CrossReference.objects.filter(excel_upload=excel_upload_instance).order_by('id')
+    with transaction.atomic():
+        archived_rows = [list(row) for row in rows.values_list('gail_grade', 'competitor_name', 'competitor_grade', 'location')]
+        if not archived_rows:
+            return 0
+        CrossReferenceArchive.objects.update_or_create(
+            excel_upload=excel_upload_instance,
+            defaults={
+                'row_count': len(archived_rows),
+                'data': zlib.compress(json.dumps(archived_rows, separators=(',', ':')).encode(), 9)
+            }
+        )
+        rows.delete()
+        # Search can no longer serve the upload: cached answers and ETags must change
+        bump_dataset_version(CROSS_REFERENCE)
+    return len(archived_rows)
+
+
+def load_archived_cross_references(excel_upload_id):
+    """
+    Read an upload's archived cross-reference rows without restoring them.
+
+    Returns:
+        list: (gail_grade, competitor_name, competitor_grade, location) tuples, empty if the upload has no archive
+    """
+    from .models import CrossReferenceArchive  # Import here to avoid circular imports
+    
+    data = CrossReferenceArchive.objects.filter(excel_upload_id=excel_upload_id).values_list('data', flat=True).first()
+    if data is None:
+        return []
+    return [tuple(row) for row in json.loads(zlib.decompress(data))]
+
+
+def restore_cross_references(excel_upload_instance):
+    """
+    Move an upload's archived rows back into CrossReference and drop the archive.
+
+    Returns:
+        int: Number of rows restored
+    """
+    from .models import CrossReference, CrossReferenceArchive  # Import here to avoid circular imports
+    
+    with transaction.atomic():
+        archived_rows = load_archived_cross_references(excel_upload_instance.pk)
+        CrossReference.objects.bulk_create([
+            CrossReference(
+                gail_grade=gail_grade,
+                competitor_name=competitor_name,
+                competitor_grade=competitor_grade,
+                location=location,
+                excel_upload=excel_upload_instance,
+                **cross_reference_keys(gail_grade, competitor_name, competitor_grade)
+            )
+            for gail_grade, competitor_name, competitor_grade, location in archived_rows
+        ], batch_size=1000)
+        CrossReferenceArchive.objects.filter(excel_upload=excel_upload_instance).delete()
+        bump_dataset_version(CROSS_REFERENCE)
+    return len(archived_rows)
+
+
+def parse_validity_date(value):
+    """
+    Parse a freight Valid_From/Valid_To value ("1 Feb, 2025", "2025-02-01", date or datetime).
+
+    Returns:
+        date: The parsed date, or None if the value is not a recognisable date.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for date_format in VALIDITY_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def month_period(month, year):
+    """
+    First and last day of an upload period, e.g. ('february', 2025) -> (2025-02-01, 2025-02-28).
+
+    Returns:
+        tuple: (first day, last day), or (None, None) for a blank or unknown month or year
+    """
+    month = str(month or '').lower()
+    if month not in MONTH_MAPPING or not year:
+        return None, None
+    month_number = list(MONTH_MAPPING).index(month) + 1
+    year = int(year)
+    return date(year, month_number, 1), date(year, month_number, calendar.monthrange(year, month_number)[1])
+
+
+def destination_key(destination):
+    """Lookup key of a freight destination: trimmed and upper-cased"""
+    return str(destination).strip().upper()
+
+
+def filter_destination_prefix(rates, location):
+    """Freight rates whose destination starts with location, as a range on the destination_key index"""
+    prefix = destination_key(location)
+    return rates.filter(destination_key__gte=prefix, destination_key__lt=prefix + MAX_CHARACTER)
+
+
+def save_freight_history(pdf_upload_instance):
+    """
+    Save the freight records of a freight upload as FreightRate rows with their validity interval.
+
+    Excel freight files carry real Valid_From/Valid_To dates. The PDF rate sheets don't,
+    so PDF records (and records with unparseable dates) are valid for the upload's month.
+    Uploads without a valid month/year only keep the records with their own dates.
+
+    Returns:
+        int: Number of freight rates saved, None if the upload has no freight data
+    """
+    from .models import FreightRate  # Import here to avoid circular imports
+    
+    freight_data = pdf_upload_instance.extracted_data
+    if not isinstance(freight_data, dict) or "error" in freight_data:
+        return None
+    
+    period_start, period_end = month_period(pdf_upload_instance.month, pdf_upload_instance.year)
+    if period_start is None:
+        print(f"Freight upload {pdf_upload_instance.pk} has no valid month/year ({pdf_upload_instance.month!r}, {pdf_upload_instance.year!r}): "
+              f"records without validity dates are left out of the freight history.")
+    from_pdf = pdf_upload_instance.file.name.lower().endswith('.pdf')
+    
+    freight_rates = []
+    for destination, freight_info in freight_data.items():
+        if not isinstance(freight_info, dict):
+            continue
+        try:
+            amount = float(freight_info.get('Amount'))
+        except (ValueError, TypeError):
+            continue
+        
+        valid_from = None if from_pdf else parse_validity_date(freight_info.get('Valid_From'))
+        valid_to = None if from_pdf else parse_validity_date(freight_info.get('Valid_To'))
+        if not (valid_from or period_start) or not (valid_to or period_end):
+            continue
+        freight_rates.append(
+            FreightRate(
+                destination=destination,
+                destination_key=destination_key(destination),
+                amount=amount,
+                valid_from=valid_from or period_start,
+                valid_to=valid_to or period_end,
+                details=freight_info,
+                pdf_upload=pdf_upload_instance
+            )
+        )
+    
+    with transaction.atomic():
+        FreightRate.objects.filter(pdf_upload=pdf_upload_instance).delete()
+        FreightRate.objects.bulk_create(freight_rates, batch_size=1000)
+    print(f"Saved {len(freight_rates)} freight rates for {pdf_upload_instance.month}/{pdf_upload_instance.year}.")
+    return len(freight_rates)
+
+
+def get_freight_rates_as_of(as_of, location=None):
+    """
+    Freight rate valid on a given date for every destination (or those starting with location).
+
+    Each destination is resolved on the (destination_key, valid_from, valid_to) index; when
+    intervals overlap the most recently started one wins, then the most recent upload.
+
+    Returns:
+        dict: destination -> FreightRate
+    """
+    from .models import FreightRate  # Import here to avoid circular imports
+    
+    rates = FreightRate.objects.filter(valid_from__lte=as_of, valid_to__gte=as_of)
+    if location:
+        rates = filter_destination_prefix(rates, location)
+    
+    freight_rates = {}
+    for rate in rates.order_by('destination_key', '-valid_from', '-pdf_upload_id'):
+        freight_rates.setdefault(rate.destination_key, rate)
+    return {rate.destination: rate for rate in freight_rates.values()}
+
+
+def get_freight_rates_in_range(start, end, location=None):
+    """
+    All freight rates whose validity interval overlaps [start, end], for every destination
+    (or those starting with location).
+
+    Returns:
+        dict: destination -> list of FreightRate, ordered by valid_from
+    """
+    from .models import FreightRate  # Import here to avoid circular imports
+    
+    rates = FreightRate.objects.filter(valid_from__lte=end, valid_to__gte=start)
+    if location:
+        rates = filter_destination_prefix(rates, location)
+    
+    freight_rates = defaultdict(list)
+    for rate in rates.order_by('destination_key', 'valid_from', 'pdf_upload_id'):
+        freight_rates[rate.destination].append(rate)
+    return dict(freight_rates)
+
+
+def _number_or_none(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def pricing_item_location(item, file_type):
+    """
+    The location of a location item of a stock point or ex-work file. Ex-work items may
+    carry it as location_grade instead; stock point items only match on their location.
+
+    Returns:
+        str: The location, '' if the item has none
+    """
+    if file_type == 'ex_work_file':
+        return item.get('location') or item.get('location_grade') or ''
+    return item.get('location') or ''
+
+
+def save_price_entries(pdf_upload_instance):
+    """
+    Save the prices of a stock point or ex-work upload as PriceEntry rows: one per product
+    per location item, carrying the item's SAP code and merged freight.
+
+    Called when extraction finishes and again whenever the extracted data changes (freight merge).
+    Items without products have no entries: the pricing index (see pricing_index.py) reads the
+    items themselves.
+    """
+    from .models import PriceEntry  # Import here to avoid circular imports
+    
+    pricing_data = pdf_upload_instance.extracted_data
+    price_entries = []
+    if isinstance(pricing_data, dict) and "error" not in pricing_data:
+        for item_index, item in enumerate(pricing_data.get('data', [])):
+            location = pricing_item_location(item, pdf_upload_instance.file_type)
+            freight_amount = _number_or_none(item.get('freight_amount'))
+            for product_index, product in enumerate(item.get('products', [])):
+                product_code = str(product.get('product_code') or '')
+                price_entries.append(
+                    PriceEntry(
+                        pdf_upload=pdf_upload_instance,
+                        file_type=pdf_upload_instance.file_type,
+                        month=pdf_upload_instance.month,
+                        year=pdf_upload_instance.year,
+                        item_index=item_index,
+                        product_index=product_index,
+                        sap_code=item.get('sap_code'),
+                        location=location,
+                        location_key=normalize_key(location),
+                        product_code=product_code,
+                        product_code_key=normalize_key(product_code),
+                        price=_number_or_none(product.get('price')),
+                        freight_amount=freight_amount
                     )
                 )
     
-    # Bulk create for efficiency
-    CrossReference.objects.bulk_create(cross_references, batch_size=1000)
-    print(f"Created {len(cross_references)} cross-reference entries in database.")
+    with transaction.atomic():
+        PriceEntry.objects.filter(pdf_upload=pdf_upload_instance).delete()
+        PriceEntry.objects.bulk_create(price_entries, batch_size=1000)
+    print(f"Saved {len(price_entries)} price entries for {pdf_upload_instance.file_type} {pdf_upload_instance.month}/{pdf_upload_instance.year}.")
+
+
+def _location_price_stats(locations):
+    """
+    Min, max, sum and count of each location's (non-zero) product prices, in one pandas groupby.
+
+    The groupby runs on the prices as floats. Min and max are then read back from the
+    extracted prices (the first lowest and highest, as min() and max() pick them), and sums
+    of int prices are cast back to int, so whole prices stay int.
+
+    Returns:
+        dict: location position -> (min, max, sum, count)
+    """
+    location_positions = []
+    prices = []
+    int_prices = []
+    for position, location_data in enumerate(locations):
+        for product in location_data.get('products', []):
+            if product.get('price'):
+                location_positions.append(position)
+                prices.append(product['price'])
+                int_prices.append(isinstance(product['price'], int))
+    if not prices:
+        return {}
+    
+    stats = pd.DataFrame({
+        'position': location_positions,
+        'price': pd.Series(prices, dtype=float),
+        'is_int': int_prices
+    }).groupby('position').agg(
+        min_at=('price', 'idxmin'),
+        max_at=('price', 'idxmax'),
+        total=('price', 'sum'),
+        count=('price', 'count'),
+        all_int=('is_int', 'all')
+    )
+    return {
+        int(position): (prices[min_at], prices[max_at], int(round(total)) if all_int else float(total), int(count))
+        for position, min_at, max_at, total, count, all_int in stats.itertuples()
+    }
+
+
+def derive_file_data(file_type, extracted_data):
+    """
+    Compute the enrichment get_file_data serves with a file, once per extraction or freight merge.
+
+    Pricing files get a copy of their extracted data with each location's freight_status and
+    price_summary (landed costs included) as 'document'; every file gets the file-level
+    statistics of its file_metadata, and freight files their freight_summary.
+
+    Args:
+        file_type: The upload's file type
+        extracted_data: The upload's extracted data
+
+    Returns:
+        dict: 'file_metadata', and 'document' and/or 'freight_summary', or None if there is no data
+    """
+    if not extracted_data:
+        return None
+    
+    derived_data = {}
+    if file_type == 'freight_file':
+        freight_summary = {
+            'total_freight_locations': len(extracted_data),
+            'freight_locations': list(extracted_data.keys()),
+            'freight_range': {
+                'min_amount': None,
+                'max_amount': None,
+                'avg_amount': None
+            }
+        }
+        
+        # Calculate freight statistics
+        freight_amounts = []
+        for location, freight_info in extracted_data.items():
+            if isinstance(freight_info, dict) and 'Amount' in freight_info:
+                try:
+                    freight_amounts.append(float(freight_info['Amount']))
+                except (ValueError, TypeError):
+                    continue
+        
+        if freight_amounts:
+            freight_summary['freight_range'] = {
+                'min_amount': min(freight_amounts),
+                'max_amount': max(freight_amounts),
+                'avg_amount': round(sum(freight_amounts) / len(freight_amounts), 2)
+            }
+        derived_data['freight_summary'] = freight_summary
+    
+    if not isinstance(extracted_data, dict):
+        return derived_data or None
+    
+    document = dict(extracted_data)
+    file_metadata = {
+        'total_locations': len(document.get('data', [])),
+        'has_freight_data': False
+    }
+    
+    # Enhanced data processing for locations, on copies so the extracted data stays as extracted
+    if 'data' in document:
+        locations_with_freight = 0
+        total_products = 0
+        price_stats = _location_price_stats(document['data'])
+        
+        enriched_locations = []
+        for position, location_data in enumerate(document['data']):
+            location_data = dict(location_data)
+            products = location_data.get('products', [])
+            total_products += len(products)
+            
+            # Check if freight data exists for this location
+            has_freight = 'freight_amount' in location_data
+            if has_freight:
+                locations_with_freight += 1
+                file_metadata['has_freight_data'] = True
+            
+            location_data['freight_status'] = {
+                'has_freight': has_freight,
+                'freight_amount': location_data.get('freight_amount'),
+                'freight_formatted': f"₹{location_data.get('freight_amount', 0):,}" if has_freight else "Not Available"
+            }
+            if 'freight_details' in location_data:
+                location_data['freight_status']['details'] = location_data['freight_details']
+            
+            # Pricing summary of the location, with landed costs if freight is available
+            if products and position in price_stats:
+                min_price, max_price, price_sum, price_count = price_stats[position]
+                avg_price = round(price_sum / price_count, 2)
+                location_data['price_summary'] = {
+                    'min_price': min_price,
+                    'max_price': max_price,
+                    'avg_price': avg_price,
+                    'total_products': len(products)
+                }
+                if has_freight:
+                    freight_amount = location_data.get('freight_amount', 0)
+                    location_data['price_summary']['landed_costs'] = {
+                        'min_landed_cost': min_price + freight_amount,
+                        'max_landed_cost': max_price + freight_amount,
+                        'avg_landed_cost': avg_price + freight_amount
+                    }
+            enriched_locations.append(location_data)
+        document['data'] = enriched_locations
+        derived_data['document'] = document
+        
+        file_metadata.update({
+            'total_products': total_products,
+            'locations_with_freight': locations_with_freight,
+            'freight_coverage_percentage': round((locations_with_freight / len(enriched_locations) * 100), 2) if enriched_locations else 0
+        })
+    
+    derived_data['file_metadata'] = file_metadata
+    return derived_data
+
+
+def save_derived_data(pdf_upload_instance):
+    """
+    Store derive_file_data() of an upload, without another save() round. The enriched location
+    records of pricing files go to PricingLocation rows, so get_file_data can filter and page
+    them on indexes; the stored document keeps a None placeholder for its 'data'.
+    """
+    from .models import PDFUpload, PricingLocation  # Import here to avoid circular imports
+    
+    derived_data = derive_file_data(pdf_upload_instance.file_type, pdf_upload_instance.extracted_data)
+    location_records = []
+    if derived_data and 'document' in derived_data:
+        location_records = derived_data['document']['data']
+        derived_data['document']['data'] = None
+    
+    with transaction.atomic():
+        PDFUpload.objects.filter(pk=pdf_upload_instance.pk).update(derived_data=derived_data)
+        PricingLocation.objects.filter(pdf_upload=pdf_upload_instance).delete()
+        PricingLocation.objects.bulk_create([
+            PricingLocation(
+                pdf_upload=pdf_upload_instance,
+                position=position,
+                location_key=normalize_key(record.get('location') or record.get('location_grade') or ''),
+                has_freight=record['freight_status']['has_freight'],
+                record=record
+            )
+            for position, record in enumerate(location_records)
+        ], batch_size=1000)
+    pdf_upload_instance.derived_data = derived_data
+
+
+def point_at_current_upload(file_type):
+    """
+    Point a file type's dataset at its most recent extracted upload. The dataset version
+    changes too, so every worker drops its cached pointer and whatever it built from the upload.
+
+    Called whenever an upload of the type is saved (extraction, freight merge) or deleted.
+    """
+    from .models import PDFUpload  # Import here to avoid circular imports
+    
+    if file_type not in CURRENT_UPLOAD_FILE_TYPES:
+        return
+    current_id = PDFUpload.objects.filter(
+        file_type=file_type,
+        extracted_data__isnull=False
+    ).order_by('-uploaded_at').values_list('id', flat=True).first()
+    switch_dataset(file_type, current_id)
 
 
 def get_stock_json(pdf_file: str = None, save_json_path: str = None, file_type: str = None):
@@ -515,13 +1125,17 @@ def get_stock_json(pdf_file: str = None, save_json_path: str = None, file_type:
     return output_json
 
 
-def extract_freight(file_path):
+def extract_freight(file_path, sheet_name=0, workers=None, page_timings=None):
     """
     Extract freight data from PDF or Excel files.
     Enhanced to handle HPL freight rate PDF format.
 
     Args:
         file_path (str): Path to the freight PDF or Excel file.
+        sheet_name (int, str, list or None): Excel sheet(s) to read. A list or None
+            reads several sheets; later sheets win for duplicate cities.
+        workers (int): Worker processes for PDF extraction (see extract_freight_from_pdf).
+        page_timings (list): Optional list that receives per-page PDF timings.
 
     Returns:
         dict: Dictionary mapping destinations to their freight attributes.
@@ -532,37 +1146,9 @@ def extract_freight(file_path):
     try:
         # Check if it's a PDF file
         if file_path.lower().endswith('.pdf'):
-            return extract_freight_from_pdf(file_path)
+            return extract_freight_from_pdf(file_path, workers=workers, page_timings=page_timings)
         else:
-            # Original Excel extraction logic
-            data = pd.read_excel(file_path)
-
-            # Rename columns for clarity
-            data.columns = [
-                "No", "CnTy", "Condition_Type", "PL_Number", "City", "Amount",
-                "Unit", "Per", "UoM", "Valid_From", "Valid_To"
-            ]
-
-            # Drop the first row containing header-like information
-            data = data.iloc[1:].reset_index(drop=True)
-
-            # Remove rows where the "City" column or other relevant columns are empty
-            data = data.dropna(subset=["City", "Amount", "Unit", "Per", "UoM", "Valid_From", "Valid_To"]).reset_index(drop=True)
-
-            # Create the dictionary mapping
-            city_mapping = {
-                row["City"]: {
-                    "Amount": row["Amount"],
-                    "Unit": row["Unit"],
-                    "Per": row["Per"],
-                    "UoM": row["UoM"],
-                    "Valid_From": row["Valid_From"],
-                    "Valid_To": row["Valid_To"],
-                }
-                for _, row in data.iterrows()
-            }
-
-            return city_mapping
+            return extract_freight_from_excel(file_path, sheet_name=sheet_name)
             
     except Exception as e:
         print(f"❌ Error extracting freight data: {e}")
@@ -571,12 +1157,188 @@ def extract_freight(file_path):
         return {"error": f"Failed to extract freight data: {str(e)}"}
 
 
-def extract_freight_from_pdf(pdf_path):
+def _format_validity_dates(column):
+    """
+    Render date cells of a validity column as ISO strings so they can be stored in a JSONField.
+    """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.dt.strftime('%Y-%m-%d')
+    return column.map(lambda value: value.date().isoformat() if isinstance(value, datetime) else value)
+
+
+def extract_freight_from_excel(file_path, sheet_name=0):
+    """
+    Extract freight data from an Excel freight workbook.
+
+    Only the City..Valid_To columns (E:K) are read, with a read-only reader
+    (calamine when installed, openpyxl otherwise), and the mapping is built
+    column-wise instead of row by row.
+
+    Args:
+        file_path (str): Path to the freight Excel file.
+        sheet_name (int, str, list or None): Sheet(s) to read, as for pd.read_excel.
+
+    Returns:
+        dict: Dictionary mapping cities to their freight attributes. Date cells of
+            Valid_From/Valid_To are ISO strings ('2025-02-01'), text cells are kept as they are.
+    """
+    # The first two rows of the sheet are headers
+    sheets = pd.read_excel(
+        file_path,
+        sheet_name=sheet_name,
+        header=None,
+        skiprows=2,
+        usecols=FREIGHT_EXCEL_USECOLS,
+        names=["City"] + FREIGHT_EXCEL_FIELDS,
+        engine=EXCEL_READ_ENGINE,
+    )
+    # Several sheets are stacked in workbook order
+    data = pd.concat(sheets.values(), ignore_index=True) if isinstance(sheets, dict) else sheets
+
+    # Remove rows where the "City" column or other relevant columns are empty
+    data = data.dropna(subset=["City"] + FREIGHT_EXCEL_FIELDS)
+    data = data.assign(
+        Valid_From=_format_validity_dates(data["Valid_From"]),
+        Valid_To=_format_validity_dates(data["Valid_To"]),
+    )
+
+    # Later rows win for duplicate cities, as with a plain dict assignment
+    return dict(zip(data["City"], data[FREIGHT_EXCEL_FIELDS].to_dict('records')))
+
+
+def _parse_numeric_column(column, decimal=True):
+    """
+    Parse a text column after dropping everything but its digits (and dots when decimal),
+    NaN where nothing parses.
+
+    Cells with non-ASCII text are cleaned one by one with str.isdigit, which also keeps
+    the digits of other scripts ('١٢' is 12), as the row-by-row parser did.
+    """
+    values = pd.to_numeric(
+        column.str.replace(NON_DECIMAL_CHARS if decimal else NON_DIGIT_CHARS, '', regex=True), errors='coerce'
+    ).astype(float)
+    for index, text in column[column.str.contains(NON_ASCII_CHARS)].items():
+        cleaned = ''.join(c for c in text if c.isdigit() or decimal and c == '.')
+        try:
+            values.loc[index] = float(cleaned) if decimal else int(cleaned)
+        except ValueError:
+            values.loc[index] = np.nan
+    return values
+
+
+def parse_freight_table(table):
+    """
+    Parse one HPL freight rate table into a destination -> freight record mapping.
+
+    Columns are SL, STATE, SECTOR, DISTRICT, DESTINATION, DISTANCE, TRANSIT, AMOUNT.
+    Header rows are dropped by mask and numbers are cleaned over whole columns;
+    later rows win for duplicate destinations.
+
+    Args:
+        table (list): Rows from pdfplumber's extract_tables(), first row as header.
+
+    Returns:
+        dict: Dictionary mapping destinations to freight information
+    """
+    if not table or len(table) < 2:
+        return {}
+
+    df = pd.DataFrame(table[1:], dtype=object)
+    if df.shape[1] < 8:
+        return {}
+
+    # Cells are compared as text, so missing cells become 'None' like str(None)
+    df = df.iloc[:, :8].map(str)
+    df = df.apply(lambda column: column.str.strip())
+    df.columns = FREIGHT_PDF_COLUMNS
+
+    # Skip header rows and invalid data
+    destination = df["destination"]
+    amount = df["amount"]
+    keep = (
+        (destination != '')
+        & ~destination.str.upper().isin(FREIGHT_PDF_HEADER_DESTINATIONS)
+        & ~df["sl_no"].str.upper().isin(['SL', 'SL.'])
+        & (destination != 'nan')
+        & (amount != '')
+        & (amount != 'nan')
+    )
+    df = df[keep]
+
+    # Unparseable or non-positive amounts drop the row; bad distances and transit times become 0
+    amount_value = _parse_numeric_column(df["amount"]).fillna(0)
+    df = df[amount_value > 0]
+    amount_value = amount_value[amount_value > 0]
+    distance_value = _parse_numeric_column(df["distance"])
+    distance_value = distance_value.astype(object).where(distance_value.notna(), 0)
+    transit_value = _parse_numeric_column(df["transit_time"], decimal=False).fillna(0)
+
+    records = pd.DataFrame({
+        "Amount": amount_value.astype(float),
+        "Unit": "MT",
+        "Per": "MT",
+        "UoM": "MT",
+        "Distance_KM": distance_value,
+        "Transit_Days": transit_value.astype('int64'),
+        "State": df["state"],
+        "Sector": df["sector"],
+        "District": df["district"],
+        "Valid_From": "1 Feb, 2025",
+        "Valid_To": "28 Feb, 2025",
+    })
+    return dict(zip(df["destination"], records.to_dict('records')))
+
+
+def _extract_freight_pages(pdf_path, page_numbers):
+    """
+    Parse a range of pages of a freight PDF. Runs inside the process pool.
+
+    Args:
+        pdf_path (str): Path to the freight PDF file
+        page_numbers (list): 1-based page numbers to parse
+
+    Returns:
+        list: (page_number, freight_data, seconds) for each page, in page order
+    """
+    results = []
+    with pdfplumber.open(pdf_path, pages=list(page_numbers)) as pdf:
+        for page in pdf.pages:
+            started = time.perf_counter()
+            page_freight = {}
+            for table in page.extract_tables():
+                page_freight.update(parse_freight_table(table))
+            results.append((page.page_number, page_freight, time.perf_counter() - started))
+            page.close()
+    return results
+
+
+def freight_pdf_workers(workers=None):
+    """
+    Number of worker processes for freight PDF extraction: workers, or settings.FREIGHT_PDF_WORKERS
+    if not given. Anything that is not a positive integer means 1 (no process pool).
+    """
+    if workers is None:
+        workers = getattr(settings, 'FREIGHT_PDF_WORKERS', 1)
+    try:
+        return max(1, int(workers))
+    except (TypeError, ValueError):
+        print(f"Invalid freight PDF worker count {workers!r}, extracting serially")
+        return 1
+
+
+def extract_freight_from_pdf(pdf_path, workers=None, page_timings=None):
     """
     Extract freight data from HPL freight rate PDF format.
+
+    Pages are split into contiguous ranges and parsed in a process pool, then merged
+    in page order so later pages still win for duplicate destinations.
     
     Args:
         pdf_path (str): Path to the freight PDF file
+        workers (int): Worker processes to use; defaults to settings.FREIGHT_PDF_WORKERS.
+            1 (or an invalid value) parses in the current process, as does a pool that cannot start.
+        page_timings (list): Optional list that receives a
+            {"page", "seconds", "destinations"} entry per page.
         
     Returns:
         dict: Dictionary mapping destinations to freight information
@@ -584,93 +1346,42 @@ def extract_freight_from_pdf(pdf_path):
     print(f"Extracting freight from PDF: {pdf_path}")
     
     try:
-        freight_data = {}
-        
         with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages):
-                print(f"Processing page {page_num + 1}...")
-                
-                # Extract tables from the page
-                tables = page.extract_tables()
-                
-                for table_index, table in enumerate(tables):
-                    if not table or len(table) < 2:
-                        continue
-                    
-                    # Convert to DataFrame for easier processing
-                    df = pd.DataFrame(table[1:], columns=table[0])  # First row as headers
-                    
-                    # Clean column names
-                    df.columns = [str(col).strip() if col else f'col_{i}' for i, col in enumerate(df.columns)]
-                    
-                    # Process each row in the table
-                    for index, row in df.iterrows():
-                        try:
-                            # Extract data based on PDF structure (assuming 8 columns: SL, STATE, SECTOR, DISTRICT, DESTINATION, DISTANCE, TRANSIT, AMOUNT)
-                            if len(row) < 8:
-                                continue
-                                
-                            sl_no = str(row.iloc[0]).strip()
-                            state = str(row.iloc[1]).strip()
-                            sector = str(row.iloc[2]).strip()
-                            district = str(row.iloc[3]).strip()
-                            destination = str(row.iloc[4]).strip()
-                            distance = str(row.iloc[5]).strip()
-                            transit_time = str(row.iloc[6]).strip()
-                            amount = str(row.iloc[7]).strip()
-                            
-                            # Skip header rows and invalid data
-                            if (not destination or 
-                                destination.upper() in ['DESTINATION / CONSUMPTION POINT', 'DESTINATION/CONSUMPTION POINT'] or
-                                sl_no.upper() in ['SL', 'SL.'] or
-                                destination == 'nan' or
-                                not amount or
-                                amount == 'nan'):
-                                continue
-                            
-                            # Clean and validate amount
-                            try:
-                                amount_clean = ''.join(c for c in amount if c.isdigit() or c == '.')
-                                amount_value = float(amount_clean) if amount_clean else 0
-                                
-                                if amount_value <= 0:
-                                    continue
-                                    
-                            except (ValueError, TypeError):
-                                continue
-                            
-                            # Clean distance and transit time
-                            try:
-                                distance_clean = ''.join(c for c in distance if c.isdigit() or c == '.')
-                                distance_value = float(distance_clean) if distance_clean else 0
-                            except:
-                                distance_value = 0
-                            
-                            try:
-                                transit_clean = ''.join(c for c in transit_time if c.isdigit())
-                                transit_value = int(transit_clean) if transit_clean else 0
-                            except:
-                                transit_value = 0
-                            
-                            # Store freight data
-                            freight_data[destination] = {
-                                "Amount": amount_value,
-                                "Unit": "MT",
-                                "Per": "MT",
-                                "UoM": "MT",
-                                "Distance_KM": distance_value,
-                                "Transit_Days": transit_value,
-                                "State": state,
-                                "Sector": sector,
-                                "District": district,
-                                "Valid_From": "1 Feb, 2025",
-                                "Valid_To": "28 Feb, 2025"
-                            }
-                            
-                        except Exception as e:
-                            continue
+            page_count = len(pdf.pages)
+
+        page_numbers = list(range(1, page_count + 1))
+        workers = max(1, min(freight_pdf_workers(workers), page_count))
+        page_results = None
+        if workers > 1:
+            # A few ranges per worker keeps the pool busy when some pages are denser than others
+            chunk_size = max(1, math.ceil(page_count / (workers * 4)))
+            chunks = [page_numbers[i:i + chunk_size] for i in range(0, page_count, chunk_size)]
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    page_results = [
+                        result
+                        for chunk_results in executor.map(_extract_freight_pages, [pdf_path] * len(chunks), chunks)
+                        for result in chunk_results
+                    ]
+            except (BrokenProcessPool, OSError) as e:
+                # e.g. a server that does not let request threads start processes
+                print(f"Freight PDF process pool failed ({e}), extracting serially")
+                workers = 1
+        if page_results is None:
+            page_results = _extract_freight_pages(pdf_path, page_numbers)
+
+        freight_data = {}
+        for page_number, page_freight, seconds in page_results:
+            freight_data.update(page_freight)
+            print(f"Processed page {page_number} in {seconds:.3f}s ({len(page_freight)} destinations)")
+            if page_timings is not None:
+                page_timings.append({
+                    "page": page_number,
+                    "seconds": round(seconds, 4),
+                    "destinations": len(page_freight)
+                })
         
-        print(f"Extracted freight data for {len(freight_data)} destinations")
+        print(f"Extracted freight data for {len(freight_data)} destinations from {page_count} pages using {workers} worker(s)")
         return freight_data
         
     except Exception as e:
@@ -728,6 +1439,87 @@ def enhanced_freight_matching(location_name, freight_data):
     return best_match
 
 
+def save_freight_coverage_report(month, year):
+    """
+    Match every stock point / ex-work location of a period against its freight file
+    and store the result as a FreightCoverageReport with one row per location.
+
+    Returns:
+        FreightCoverageReport: The stored report, or None if the period has no freight file
+            (any previous report of the period is then deleted).
+    """
+    from .models import PDFUpload, FreightCoverageReport, FreightCoverageLocation  # Import here to avoid circular imports
+    
+    period_files = PDFUpload.objects.filter(month=month, year=year, extracted_data__isnull=False)
+    stock_point_file = period_files.filter(file_type='stock_point_file').first()
+    ex_work_file = period_files.filter(file_type='ex_work_file').first()
+    freight_file = period_files.filter(file_type='freight_file').first()
+    
+    if not freight_file or not isinstance(freight_file.extracted_data, dict) or "error" in freight_file.extracted_data:
+        FreightCoverageReport.objects.filter(month=month, year=year).delete()
+        return None
+    
+    # Collect all locations from pricing files
+    all_locations = set()
+    if stock_point_file and isinstance(stock_point_file.extracted_data, dict):
+        for item in stock_point_file.extracted_data.get('data', []):
+            if item.get('location'):
+                all_locations.add(item['location'])
+    if ex_work_file and isinstance(ex_work_file.extracted_data, dict):
+        for item in ex_work_file.extracted_data.get('data', []):
+            location = item.get('location') or item.get('location_grade')
+            if location:
+                all_locations.add(location)
+    
+    coverage_rows = []
+    for location in sorted(all_locations):
+        freight_match = enhanced_freight_matching(location, freight_file.extracted_data)
+        coverage_rows.append(
+            FreightCoverageLocation(
+                location=location,
+                has_freight=freight_match is not None,
+                freight_amount=freight_match.get('Amount') if freight_match else None,
+                freight_details=freight_match
+            )
+        )
+    
+    total_locations = len(coverage_rows)
+    locations_with_freight = sum(1 for row in coverage_rows if row.has_freight)
+    coverage_percentage = (locations_with_freight / total_locations * 100) if total_locations > 0 else 0
+    
+    with transaction.atomic():
+        report, _ = FreightCoverageReport.objects.update_or_create(
+            month=month,
+            year=year,
+            defaults={
+                'freight_upload': freight_file,
+                'total_locations': total_locations,
+                'locations_with_freight': locations_with_freight,
+                'locations_without_freight': total_locations - locations_with_freight,
+                'coverage_percentage': round(coverage_percentage, 2),
+            }
+        )
+        report.locations.all().delete()
+        for row in coverage_rows:
+            row.report = report
+        FreightCoverageLocation.objects.bulk_create(coverage_rows, batch_size=1000)
+    
+    print(f"Freight coverage for {month}/{year}: {locations_with_freight}/{total_locations} locations")
+    return report
+
+
+def rebuild_freight_coverage_reports(periods):
+    """
+    Rebuild the freight coverage reports of the given (month, year) periods, e.g. after
+    one of their pricing or freight files was edited or deleted.
+    """
+    for month, year in set(periods):
+        try:
+            save_freight_coverage_report(month, year)
+        except Exception as e:
+            print(f"Error building freight coverage report for {month}/{year}: {e}")
+
+
 def add_freight(same_month_records):
     """
     Add freight data to stock point and ex-work records with enhanced matching.
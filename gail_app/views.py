@@ -1,16 +1,28 @@
+from datetime import date
+from functools import wraps
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Q
-from .models import PDFUpload, ExcelUpload, CrossReference
+from .models import PDFUpload, ExcelUpload, CrossReferenceArchive, FreightRate, FreightCoverageReport
 from .serializers import (
     PDFUploadSerializer, 
     ExcelUploadSerializer, 
-    CrossReferenceSerializer,
     CrossReferenceQuerySerializer,
     CrossReferenceResponseSerializer
 )
-from .utils import save_cross_reference_to_db
+from .cross_reference_cache import (
+    InvalidAsOf,
+    diff_cross_reference_uploads,
+    get_cross_reference_snapshot,
+    resolve_cross_reference_upload
+)
+from .datasets import CROSS_REFERENCE, CURRENT_UPLOAD_FILE_TYPES, get_active_version_id
+from .file_data import DEFAULT_FILE_DATA_LIMIT, MAX_FILE_DATA_LIMIT, iter_location_records, page_records, query_location_records
+from .pricing_index import get_pricing_index
+from .responses import condition_on_datasets, serve_rendered_payload
+from .search import DEFAULT_SEARCH_LIMIT, InvalidCursor, search_cross_references
+from .streaming import StreamingJSONResponse, wants_stream
+from .utils import normalize_key, derive_file_data, save_freight_coverage_report, get_freight_rates_as_of, get_freight_rates_in_range, PRICING_FILE_TYPES
 
 @api_view(['POST'])
 def pdf_upload(request):
@@ -35,27 +47,113 @@ def pdf_upload(request):
 
 # Replace your existing get_file_data function with this enhanced version
 
+# Datasets (see datasets.py) the read endpoints' responses are built from, for the
+# rendered payload store and conditional GETs
+FREIGHT_DATASETS = ['freight_file']
+PRICING_DATASETS = PRICING_FILE_TYPES
+CROSS_REFERENCE_DATASETS = [CROSS_REFERENCE]
+CROSS_REFERENCE_PRICING_DATASETS = [CROSS_REFERENCE] + PRICING_FILE_TYPES
+
+
+def file_data_datasets(request):
+    """get_file_data reads the file type's uploads and the freight file"""
+    file_type = request.GET.get('file_type', 'stock_point_file')
+    if file_type not in CURRENT_UPLOAD_FILE_TYPES:
+        return None
+    return [file_type, 'freight_file']
+
+
+def excel_data_datasets(request):
+    if request.GET.get('file_type', 'cross_reference') != CROSS_REFERENCE:
+        return None
+    return CROSS_REFERENCE_DATASETS
+
+
+def resolves_as_of(view):
+    """
+    Resolve the as_of parameter of a cross-reference view (query string, or JSON body
+    of a POST) into request.cross_reference_upload_id before the view runs, answering
+    an as_of that names no upload with a 400. Goes below @api_view.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        as_of = request.query_params.get('as_of')
+        if request.method == 'POST' and isinstance(request.data, dict):
+            as_of = request.data.get('as_of') or as_of
+        try:
+            request.cross_reference_upload_id = resolve_cross_reference_upload(as_of)
+        except InvalidAsOf as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@condition_on_datasets(file_data_datasets, vary_encoding=True)
 @api_view(['GET'])
+@serve_rendered_payload('file-data', file_data_datasets)
 def get_file_data(request):
     """
     Fetch data of a specific file type for a given month and year.
     Enhanced to include freight information and additional metadata.
+    
+    Query parameters:
+    - file_type, month, year: The file (required; file_type defaults to stock_point_file)
+    - include_freight_details: Add the period's freight summary (default: true)
+    - include: Comma-separated extras: freight_data (the whole freight file), freight_locations (optional)
+    - location_prefix, product_code, has_freight: Location filters (optional)
+    - min_price, max_price: Price range of product_code, or of any product (optional)
+    - fields: Comma-separated location record fields to return, e.g. location,sap_code,products (optional)
+    - limit: Locations per page (default: all; 25 when a cursor is given; max: 1000)
+    - cursor: next_cursor from the previous page (optional)
+    - stream: true to stream the response as it is encoded; without a limit the locations
+      are read from the database in chunks as they are sent (default: false)
     """
     file_type = request.query_params.get('file_type', 'stock_point_file')
     month = request.query_params.get('month')
     year = request.query_params.get('year')
     include_freight_details = request.query_params.get('include_freight_details', 'true').lower() == 'true'
+    include = {name.strip() for name in request.query_params.get('include', '').split(',') if name.strip()}
+    fields = [name.strip() for name in request.query_params.get('fields', '').split(',') if name.strip()] or None
+    cursor = request.query_params.get('cursor')
+    stream = wants_stream(request)
 
     if not file_type or not month or not year:
         return Response({
             'error': 'file_type, month, and year are required parameters'
         }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit else (DEFAULT_FILE_DATA_LIMIT if cursor else None)
+        if limit is not None:
+            limit = min(max(limit, 1), MAX_FILE_DATA_LIMIT)
+        filters = {
+            'location_prefix': request.query_params.get('location_prefix'),
+            'product_code': request.query_params.get('product_code'),
+            'min_price': float(request.query_params['min_price']) if request.query_params.get('min_price') else None,
+            'max_price': float(request.query_params['max_price']) if request.query_params.get('max_price') else None,
+            'has_freight': request.query_params['has_freight'].lower() == 'true' if request.query_params.get('has_freight') else None
+        }
+    except ValueError:
+        return Response({'error': 'limit must be an integer, min_price and max_price numbers'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        pdf = PDFUpload.objects.get(file_type=file_type, month=month, year=year)
+        pdf = PDFUpload.objects.defer('extracted_data').get(file_type=file_type, month=month, year=year)
+        
+        # The enrichment is computed at ingest. Uploads without stored derived data get it in
+        # memory for this request only: reads never write (see the rebuild_derived_data command)
+        derived_data_stored = pdf.derived_data is not None
+        if derived_data_stored:
+            derived_data = pdf.derived_data
+        else:
+            derived_data = derive_file_data(pdf.file_type, pdf.extracted_data) or {}
+        file_statistics = derived_data.get('file_metadata', {})
         
-        # Get the base extracted data
-        response_data = pdf.extracted_data.copy() if pdf.extracted_data else {}
+        # Get the extracted data; the location records of pricing files are read from their rows below
+        if 'document' in derived_data:
+            response_data = dict(derived_data['document'])
+        else:
+            response_data = pdf.extracted_data.copy() if pdf.extracted_data else {}
         
         # Add metadata about the file
         response_data['file_metadata'] = {
@@ -64,115 +162,70 @@ def get_file_data(request):
             'month': pdf.month,
             'year': pdf.year,
             'uploaded_at': pdf.uploaded_at.isoformat() if pdf.uploaded_at else None,
-            'total_locations': len(response_data.get('data', [])),
-            'has_freight_data': False,
+            'total_locations': file_statistics.get('total_locations', 0),
+            'has_freight_data': file_statistics.get('has_freight_data', False),
             'freight_file_available': False
         }
         
         # Check if freight data is available and add freight details
         if include_freight_details:
             try:
-                # Get the freight file for the same month/year
+                # Get the freight file for the same month/year; its data is only read if asked for
                 freight_file = PDFUpload.objects.filter(
                     file_type='freight_file',
                     month=month,
                     year=year,
                     extracted_data__isnull=False
-                ).first()
+                ).defer('extracted_data').first()
+                
+                freight_derived_data = None
+                if freight_file:
+                    freight_derived_data = freight_file.derived_data
+                    if freight_derived_data is None:
+                        freight_derived_data = derive_file_data(freight_file.file_type, freight_file.extracted_data)
                 
-                if freight_file and freight_file.extracted_data:
+                if freight_derived_data:
                     response_data['file_metadata']['freight_file_available'] = True
-                    response_data['freight_data'] = freight_file.extracted_data
-                    
-                    # Add freight summary
-                    freight_summary = {
-                        'total_freight_locations': len(freight_file.extracted_data),
-                        'freight_locations': list(freight_file.extracted_data.keys()),
-                        'freight_range': {
-                            'min_amount': None,
-                            'max_amount': None,
-                            'avg_amount': None
-                        }
-                    }
-                    
-                    # Calculate freight statistics
-                    freight_amounts = []
-                    for location, freight_info in freight_file.extracted_data.items():
-                        if isinstance(freight_info, dict) and 'Amount' in freight_info:
-                            try:
-                                amount = float(freight_info['Amount'])
-                                freight_amounts.append(amount)
-                            except (ValueError, TypeError):
-                                continue
-                    
-                    if freight_amounts:
-                        freight_summary['freight_range'] = {
-                            'min_amount': min(freight_amounts),
-                            'max_amount': max(freight_amounts),
-                            'avg_amount': round(sum(freight_amounts) / len(freight_amounts), 2)
-                        }
+                    if 'freight_data' in include:
+                        response_data['freight_data'] = freight_file.extracted_data
                     
+                    # Freight summary, computed when the freight file was ingested
+                    freight_summary = dict(freight_derived_data['freight_summary'])
+                    if 'freight_locations' not in include:
+                        del freight_summary['freight_locations']
                     response_data['freight_summary'] = freight_summary
                 
             except Exception as e:
                 print(f"Error fetching freight data: {e}")
         
-        # Enhanced data processing for locations
-        if 'data' in response_data:
-            locations_with_freight = 0
-            total_products = 0
-            
-            for location_data in response_data['data']:
-                # Count products
-                products = location_data.get('products', [])
-                total_products += len(products)
-                
-                # Check if freight data exists for this location
-                has_freight = 'freight_amount' in location_data
-                if has_freight:
-                    locations_with_freight += 1
-                    response_data['file_metadata']['has_freight_data'] = True
-                
-                # Add freight status to each location
-                location_data['freight_status'] = {
-                    'has_freight': has_freight,
-                    'freight_amount': location_data.get('freight_amount'),
-                    'freight_formatted': f"₹{location_data.get('freight_amount', 0):,}" if has_freight else "Not Available"
-                }
-                
-                # Add freight details if available
-                if 'freight_details' in location_data:
-                    location_data['freight_status']['details'] = location_data['freight_details']
-                
-                # Add pricing summary for each location
-                if products:
-                    prices = [p.get('price', 0) for p in products if p.get('price')]
-                    if prices:
-                        location_data['price_summary'] = {
-                            'min_price': min(prices),
-                            'max_price': max(prices),
-                            'avg_price': round(sum(prices) / len(prices), 2),
-                            'total_products': len(products)
-                        }
-                        
-                        # Add landed cost calculation if freight is available
-                        if has_freight:
-                            freight_amount = location_data.get('freight_amount', 0)
-                            location_data['price_summary']['landed_costs'] = {
-                                'min_landed_cost': min(prices) + freight_amount,
-                                'max_landed_cost': max(prices) + freight_amount,
-                                'avg_landed_cost': round(sum(prices) / len(prices), 2) + freight_amount
-                            }
-            
-            # Update metadata with enhanced statistics
+        # Location records of pricing files, filtered and paged on their indexes
+        if 'document' in derived_data and not derived_data_stored:
+            response_data['data'], next_cursor = page_records(derived_data['document']['data'], filters, cursor=cursor, limit=limit, fields=fields)
+            if limit is not None:
+                response_data['next_cursor'] = next_cursor
+        elif 'document' in derived_data:
+            if stream and limit is None:
+                response_data['data'] = iter_location_records(pdf.id, filters, cursor=cursor, fields=fields)
+            else:
+                response_data['data'], next_cursor = query_location_records(pdf.id, filters, cursor=cursor, limit=limit, fields=fields)
+                if limit is not None:
+                    response_data['next_cursor'] = next_cursor
+        
+        # Update metadata with the file's product and freight statistics
+        if 'total_products' in file_statistics:
             response_data['file_metadata'].update({
-                'total_products': total_products,
-                'locations_with_freight': locations_with_freight,
-                'freight_coverage_percentage': round((locations_with_freight / len(response_data['data']) * 100), 2) if response_data['data'] else 0
+                'total_products': file_statistics['total_products'],
+                'locations_with_freight': file_statistics['locations_with_freight'],
+                'freight_coverage_percentage': file_statistics['freight_coverage_percentage']
             })
         
+        if stream:
+            return StreamingJSONResponse(response_data, status=status.HTTP_200_OK)
         return Response(response_data, status=status.HTTP_200_OK)
         
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
     except PDFUpload.DoesNotExist:
         return Response({
             'error': 'File not found',
@@ -190,14 +243,29 @@ def get_file_data(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
+@condition_on_datasets(FREIGHT_DATASETS, vary_encoding=True)
 @api_view(['GET'])
+@serve_rendered_payload('freight-data', FREIGHT_DATASETS)
 def get_freight_data(request):
     """
     Fetch freight data for a given month and year.
+    
+    Instead of month/year, the freight rate history can be queried with:
+    - as_of: Date (YYYY-MM-DD); returns the rate valid on that date for each destination
+    - valid_from & valid_to: Date range (YYYY-MM-DD); returns every rate valid in the range
+    With these, location keeps the destinations starting with it (case-insensitive).
+    
+    With stream=true the response is streamed as it is encoded.
     """
     month = request.query_params.get('month')
     year = request.query_params.get('year')
     location = request.query_params.get('location')  # Optional filter by location
+    as_of = request.query_params.get('as_of')
+    range_start = request.query_params.get('valid_from')
+    range_end = request.query_params.get('valid_to')
+
+    if as_of or range_start or range_end:
+        return get_freight_history_response(location, as_of, range_start, range_end, wants_stream(request))
 
     if not month or not year:
         return Response({
@@ -270,6 +338,84 @@ def get_freight_data(request):
             }
         }
         
+        if wants_stream(request):
+            return StreamingJSONResponse(response_data, status=status.HTTP_200_OK)
+        return Response(response_data, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        return Response({
+            'error': 'Internal server error',
+            'details': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def get_freight_history_response(location, as_of, range_start, range_end, stream=False):
+    """
+    Internal function to answer get_freight_data from the freight rate history.
+    """
+    try:
+        as_of_date = date.fromisoformat(as_of) if as_of else None
+        start_date = date.fromisoformat(range_start) if range_start else None
+        end_date = date.fromisoformat(range_end) if range_end else None
+    except ValueError:
+        return Response({
+            'error': 'as_of, valid_from and valid_to must be dates in YYYY-MM-DD format'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not as_of_date and not (start_date and end_date):
+        return Response({
+            'error': 'valid_from and valid_to are both required for a range query'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        if as_of_date:
+            rates = get_freight_rates_as_of(as_of_date, location)
+            freight_data = {destination: rate.details for destination, rate in rates.items()}
+            amounts = [rate.amount for rate in rates.values()]
+            file_ids = {rate.pdf_upload_id for rate in rates.values()}
+        else:
+            rates = get_freight_rates_in_range(start_date, end_date, location)
+            freight_data = {
+                destination: [
+                    dict(rate.details, valid_from=rate.valid_from.isoformat(), valid_to=rate.valid_to.isoformat(), file_id=rate.pdf_upload_id)
+                    for rate in destination_rates
+                ]
+                for destination, destination_rates in rates.items()
+            }
+            amounts = [rate.amount for destination_rates in rates.values() for rate in destination_rates]
+            file_ids = {rate.pdf_upload_id for destination_rates in rates.values() for rate in destination_rates}
+        
+        if not freight_data:
+            return Response({
+                'error': 'No freight rates found',
+                'message': f'No freight rates valid on {as_of}' if as_of_date else f'No freight rates valid between {range_start} and {range_end}',
+                'location_filter': location
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        summary = {
+            'total_locations': len(freight_data),
+            'locations_with_amounts': len(freight_data),
+            'total_rates': len(amounts),
+            'freight_range': {
+                'min_amount': min(amounts),
+                'max_amount': max(amounts),
+                'avg_amount': round(sum(amounts) / len(amounts), 2)
+            }
+        }
+        
+        response_data = {
+            'as_of': as_of,
+            'valid_from': range_start,
+            'valid_to': range_end,
+            'location_filter': location,
+            'freight_data': freight_data,
+            'summary': summary,
+            'file_metadata': {
+                'file_ids': sorted(file_ids)
+            }
+        }
+        
+        if stream:
+            return StreamingJSONResponse(response_data, status=status.HTTP_200_OK)
         return Response(response_data, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -300,11 +446,18 @@ def get_freight_data(request):
 def excel_upload(request):
     """
     Handle Excel file upload and automatic data extraction.
+    
+    Each upload is a new version of the cross-reference data, diffed against the
+    active one: only the added rows are built, the others are copied, and ingest_report
+    counts the rows inserted, copied and dropped (left out of the new version).
+    Pass upload_id to upload a new version of an existing upload; it takes the
+    replaced upload's is_active unless is_active is given.
     """
     if request.method == 'POST':
         file = request.FILES.get('file')
         file_type = request.data.get('file_type', 'cross_reference')
         is_active = request.data.get('is_active', True)
+        upload_id = request.data.get('upload_id')
 
         if file:
             # Validate file extension
@@ -315,54 +468,43 @@ def excel_upload(request):
                     'error': f'Invalid file type. Allowed types: {", ".join(allowed_extensions)}'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
+            if upload_id:
+                try:
+                    replaced_upload = ExcelUpload.objects.get(id=upload_id, file_type=file_type)
+                except ExcelUpload.DoesNotExist:
+                    return Response({'error': 'Excel file not found'}, status=status.HTTP_404_NOT_FOUND)
+                if 'is_active' not in request.data:
+                    is_active = replaced_upload.is_active
+            
             excel_upload = ExcelUpload(
                 file=file, 
                 file_type=file_type,
                 is_active=is_active
             )
-            excel_upload.save()  # Save file and trigger extraction
-            
-            # Save cross-reference data to database for faster querying
-            if file_type == 'cross_reference' and excel_upload.extracted_data:
-                save_cross_reference_to_db(excel_upload)
+            # Save file and trigger extraction (cross-reference rows are saved by the model)
+            excel_upload.save()
 
-            serializer = ExcelUploadSerializer(excel_upload)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            response_data = ExcelUploadSerializer(excel_upload).data
+            response_data['ingest_report'] = getattr(excel_upload, 'ingest_report', None)
+            if upload_id:
+                response_data['replaces'] = int(upload_id)
+            return Response(response_data, status=status.HTTP_201_CREATED)
         else:
             return Response({'error': 'Missing file'}, status=status.HTTP_400_BAD_REQUEST)
 
+@condition_on_datasets(PRICING_DATASETS, vary_encoding=True)
 @api_view(['GET'])
+@serve_rendered_payload('locations', PRICING_DATASETS)
 def get_locations(request):
     """
     Get all available locations from the most recent stock point or ex-work files.
     """
     try:
-        # Get the most recent stock point file
-        stock_point_file = PDFUpload.objects.filter(
-            file_type='stock_point_file',
-            extracted_data__isnull=False
-        ).order_by('-uploaded_at').first()
+        # Location indexes of the current stock point and ex-work files
+        stock_point_index = get_pricing_index('stock_point_file')
+        ex_work_index = get_pricing_index('ex_work_file')
         
-        # Get the most recent ex-work file
-        ex_work_file = PDFUpload.objects.filter(
-            file_type='ex_work_file',
-            extracted_data__isnull=False
-        ).order_by('-uploaded_at').first()
-        
-        locations = set()
-        
-        # Extract locations from stock point file
-        if stock_point_file and stock_point_file.extracted_data:
-            for item in stock_point_file.extracted_data.get('data', []):
-                if item.get('location'):
-                    locations.add(item['location'])
-        
-        # Extract locations from ex-work file
-        if ex_work_file and ex_work_file.extracted_data:
-            for item in ex_work_file.extracted_data.get('data', []):
-                location = item.get('location') or item.get('location_grade')
-                if location:
-                    locations.add(location)
+        locations = {location for location in stock_point_index.locations + ex_work_index.locations if location}
         
         locations_list = sorted(list(locations))
         
@@ -370,14 +512,15 @@ def get_locations(request):
             'locations': locations_list,
             'total_locations': len(locations_list),
             'source_files': {
-                'stock_point': stock_point_file.id if stock_point_file else None,
-                'ex_work': ex_work_file.id if ex_work_file else None
+                'stock_point': stock_point_index.upload_id,
+                'ex_work': ex_work_index.upload_id
             }
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@condition_on_datasets(PRICING_DATASETS)
 @api_view(['GET'])
 def get_grades_by_location(request):
     """
@@ -389,50 +532,22 @@ def get_grades_by_location(request):
         return Response({'error': 'location parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        # Get the most recent stock point and ex-work files
-        stock_point_file = PDFUpload.objects.filter(
-            file_type='stock_point_file',
-            extracted_data__isnull=False
-        ).order_by('-uploaded_at').first()
-        
-        ex_work_file = PDFUpload.objects.filter(
-            file_type='ex_work_file',
-            extracted_data__isnull=False
-        ).order_by('-uploaded_at').first()
-        
         grades = set()
         location_data = []
         
-        # Extract grades from stock point file for the specific location
-        if stock_point_file and stock_point_file.extracted_data:
-            for item in stock_point_file.extracted_data.get('data', []):
-                if item.get('location', '').strip().lower() == location.strip().lower():
-                    location_data.append({
-                        'sap_code': item.get('sap_code'),
-                        'location': item.get('location'),
-                        'file_type': 'stock_point',
-                        'products': item.get('products', [])
-                    })
-                    # Extract product codes (grades)
-                    for product in item.get('products', []):
-                        if product.get('product_code'):
-                            grades.add(product['product_code'])
-        
-        # Extract grades from ex-work file for the specific location
-        if ex_work_file and ex_work_file.extracted_data:
-            for item in ex_work_file.extracted_data.get('data', []):
-                item_location = item.get('location') or item.get('location_grade')
-                if item_location and item_location.strip().lower() == location.strip().lower():
-                    location_data.append({
-                        'sap_code': item.get('sap_code'),
-                        'location': item_location,
-                        'file_type': 'ex_work',
-                        'products': item.get('products', [])
-                    })
-                    # Extract product codes (grades)
-                    for product in item.get('products', []):
-                        if product.get('product_code'):
-                            grades.add(product['product_code'])
+        # The location's items in the current stock point and ex-work files, from the workers' location index
+        for file_type, source in [('stock_point_file', 'stock_point'), ('ex_work_file', 'ex_work')]:
+            for item in get_pricing_index(file_type).items_at(location):
+                location_data.append({
+                    'sap_code': item['sap_code'],
+                    'location': item['location'],
+                    'file_type': source,
+                    'products': item['products']
+                })
+                # Extract product codes (grades)
+                for product in item['products']:
+                    if product.get('product_code'):
+                        grades.add(product['product_code'])
         
         grades_list = sorted(list(grades))
         
@@ -446,7 +561,9 @@ def get_grades_by_location(request):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@condition_on_datasets(CROSS_REFERENCE_PRICING_DATASETS)
 @api_view(['GET'])
+@resolves_as_of
 def cross_reference_by_location(request):
     """
     Query cross-reference data based on location, grade (product code), and competitor.
@@ -455,6 +572,7 @@ def cross_reference_by_location(request):
     - location: Location from stock point/ex-work files (optional)
     - grade: Product code (GAIL Grade from cross-reference file) (required)
     - competitor: Competitor company name (required)
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
     """
     location = request.query_params.get('location')
     grade = request.query_params.get('grade')  # This is the product code like B56A003A
@@ -466,40 +584,11 @@ def cross_reference_by_location(request):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        # Query cross-reference data for the product code and competitor
-        cross_references = CrossReference.objects.filter(
-            gail_grade__iexact=grade.strip(),
-            competitor_name__iexact=competitor.strip(),
-            excel_upload__is_active=True
-        ).exclude(
-            competitor_grade__iexact='No equivalent'
-        ).exclude(
-            competitor_grade__isnull=True
-        ).exclude(
-            competitor_grade__exact=''
-        ).exclude(
-            competitor_grade__iexact='(blank)'
-        ).distinct()
-        
-        if not cross_references.exists():
-            # Try fuzzy matching for grade
-            cross_references = CrossReference.objects.filter(
-                gail_grade__icontains=grade.strip(),
-                competitor_name__iexact=competitor.strip(),
-                excel_upload__is_active=True
-            ).exclude(
-                competitor_grade__iexact='No equivalent'
-            ).exclude(
-                competitor_grade__isnull=True
-            ).exclude(
-                competitor_grade__exact=''
-            ).exclude(
-                competitor_grade__iexact='(blank)'
-            ).distinct()
-        
-        if cross_references.exists():
-            equivalent_grades = list(cross_references.values_list('competitor_grade', flat=True))
-            
+        # Resolve the product code (exactly, or fuzzily) and look up the competitor's grades
+        snapshot = cross_reference_snapshot_as_of(request)
+        resolution, equivalent_grades = resolve_equivalent_grades(snapshot, grade, competitor)
+        
+        if equivalent_grades:
             # Get additional information about the location and grade if location provided
             location_info = None
             location_available = False
@@ -513,7 +602,8 @@ def cross_reference_by_location(request):
                 'competitor_name': competitor,
                 'equivalent_grades': equivalent_grades,
                 'total_matches': len(equivalent_grades),
-                'location_available': location_available
+                'location_available': location_available,
+                **grade_resolution_fields(resolution)
             }
             
             if location_info:
@@ -528,16 +618,22 @@ def cross_reference_by_location(request):
                 'competitor_name': competitor,
                 'equivalent_grades': [],
                 'total_matches': 0,
-                'available_competitors': get_available_competitors_for_grade(grade)
+                'available_competitors': snapshot.competitors_for_grades(resolution.grade_keys),
+                **grade_resolution_fields(resolution)
             }, status=status.HTTP_404_NOT_FOUND)
             
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@condition_on_datasets(CROSS_REFERENCE_DATASETS)
 @api_view(['GET'])
+@resolves_as_of
 def get_competitors_for_grade(request):
     """
     Get list of competitors that have valid mappings for a specific GAIL grade (product code).
+    
+    Query parameters:
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
     """
     grade = request.query_params.get('grade')
     
@@ -545,41 +641,16 @@ def get_competitors_for_grade(request):
         return Response({'error': 'grade parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        # Get competitors that have valid mappings for this grade
-        competitors = CrossReference.objects.filter(
-            gail_grade__iexact=grade.strip(),
-            excel_upload__is_active=True
-        ).exclude(
-            competitor_grade__iexact='No equivalent'
-        ).exclude(
-            competitor_grade__isnull=True
-        ).exclude(
-            competitor_grade__exact=''
-        ).exclude(
-            competitor_grade__iexact='(blank)'
-        ).values_list('competitor_name', flat=True).distinct()
-        
-        if not competitors:
-            # Try fuzzy matching
-            competitors = CrossReference.objects.filter(
-                gail_grade__icontains=grade.strip(),
-                excel_upload__is_active=True
-            ).exclude(
-                competitor_grade__iexact='No equivalent'
-            ).exclude(
-                competitor_grade__isnull=True
-            ).exclude(
-                competitor_grade__exact=''
-            ).exclude(
-                competitor_grade__iexact='(blank)'
-            ).values_list('competitor_name', flat=True).distinct()
-        
-        competitors_list = list(competitors)
+        # Competitors that have valid mappings for this grade, resolved exactly or fuzzily
+        snapshot = cross_reference_snapshot_as_of(request)
+        resolution = snapshot.resolve_grade(grade)
+        competitors_list = snapshot.competitors_for_grades(resolution.grade_keys)
         
         return Response({
             'grade': grade,
             'competitors': competitors_list,
-            'total_competitors': len(competitors_list)
+            'total_competitors': len(competitors_list),
+            **grade_resolution_fields(resolution)
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -590,43 +661,57 @@ def get_available_competitors_for_grade(grade):
     Internal helper function to get available competitors for a grade
     """
     try:
-        competitors = CrossReference.objects.filter(
-            gail_grade__iexact=grade.strip(),
-            excel_upload__is_active=True
-        ).exclude(
-            competitor_grade__iexact='No equivalent'
-        ).exclude(
-            competitor_grade__isnull=True
-        ).exclude(
-            competitor_grade__exact=''
-        ).exclude(
-            competitor_grade__iexact='(blank)'
-        ).values_list('competitor_name', flat=True).distinct()
-        
-        return list(competitors)
+        return get_cross_reference_snapshot().competitors_for_grade(grade)
     except:
         return []
 
+def resolve_equivalent_grades(snapshot, grade, competitor):
+    """
+    Resolve a typed GAIL grade against a cross-reference snapshot and collect the competitor's equivalent grades.
+
+    Returns:
+        tuple: (GradeResolution, list of competitor grades)
+    """
+    resolution = snapshot.resolve_grade(grade)
+    equivalent_grades = [
+        competitor_grade
+        for grades in snapshot.competitor_grades(resolution.grade_keys, competitor).values()
+        for competitor_grade in grades
+    ]
+    return resolution, equivalent_grades
+
+def cross_reference_snapshot_as_of(request):
+    """
+    The cross-reference snapshot an endpoint reads: the upload named by the as_of
+    parameter, or the active one (see resolves_as_of).
+    """
+    return get_cross_reference_snapshot(request.cross_reference_upload_id)
+
+def grade_resolution_fields(resolution):
+    """
+    Response fields describing a non-exact grade resolution: the catalog grades
+    used in place of the typed one, and ranked suggestions. Empty for exact matches.
+    """
+    if resolution.exact:
+        return {}
+    return {
+        'resolved_grades': list(resolution.grades),
+        'suggestions': list(resolution.suggestions)
+    }
+
+@condition_on_datasets(CROSS_REFERENCE_DATASETS)
 @api_view(['GET'])
+@resolves_as_of
 def get_all_product_codes(request):
     """
     Get all available GAIL product codes that have cross-reference mappings.
+    
+    Query parameters:
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
     """
     try:
         # Get all GAIL grades (product codes) that have at least one valid mapping
-        product_codes = CrossReference.objects.filter(
-            excel_upload__is_active=True
-        ).exclude(
-            competitor_grade__iexact='No equivalent'
-        ).exclude(
-            competitor_grade__isnull=True
-        ).exclude(
-            competitor_grade__exact=''
-        ).exclude(
-            competitor_grade__iexact='(blank)'
-        ).values_list('gail_grade', flat=True).distinct()
-        
-        product_codes_list = sorted(list(product_codes))
+        product_codes_list = list(cross_reference_snapshot_as_of(request).product_codes)
         
         return Response({
             'product_codes': product_codes_list,
@@ -636,11 +721,16 @@ def get_all_product_codes(request):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@condition_on_datasets(CROSS_REFERENCE_DATASETS)
 @api_view(['GET'])  
+@resolves_as_of
 def get_cross_reference_summary(request):
     """
     Get a summary of cross-reference data for a specific product code.
     Shows all competitor mappings for a given GAIL grade.
+    
+    Query parameters:
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
     """
     grade = request.query_params.get('grade')
     
@@ -648,36 +738,20 @@ def get_cross_reference_summary(request):
         return Response({'error': 'grade parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        # Get all mappings for this grade
-        cross_references = CrossReference.objects.filter(
-            gail_grade__iexact=grade.strip(),
-            excel_upload__is_active=True
-        ).values('competitor_name', 'competitor_grade').distinct()
-        
-        if not cross_references:
+        snapshot = cross_reference_snapshot_as_of(request)
+        if not snapshot.has_grade(grade):
             return Response({
                 'message': 'No cross-reference data found for this product code',
                 'gail_grade': grade,
                 'mappings': {}
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Organize data by competitor
-        mappings = {}
-        for ref in cross_references:
-            competitor = ref['competitor_name']
-            grade_mapping = ref['competitor_grade']
-            
-            if competitor not in mappings:
-                mappings[competitor] = []
-            
-            # Only add valid mappings (not "No equivalent" or empty)
-            if (grade_mapping and 
-                grade_mapping.strip() and 
-                grade_mapping.lower() not in ['no equivalent', '(blank)', 'null', '']):
-                mappings[competitor].append(grade_mapping)
-        
-        # Remove competitors with no valid mappings
-        mappings = {k: v for k, v in mappings.items() if v}
+        # Valid mappings only (not "No equivalent" or empty), organized by competitor
+        mappings = {
+            competitor: list(grades)
+            for competitor, grades in snapshot.competitor_mappings(grade).items()
+            if grades
+        }
         
         return Response({
             'gail_grade': grade,
@@ -694,33 +768,12 @@ def get_grades_for_location_internal(location):
     """
     grades = set()
     
-    # Get the most recent files
-    stock_point_file = PDFUpload.objects.filter(
-        file_type='stock_point_file',
-        extracted_data__isnull=False
-    ).order_by('-uploaded_at').first()
-    
-    ex_work_file = PDFUpload.objects.filter(
-        file_type='ex_work_file',
-        extracted_data__isnull=False
-    ).order_by('-uploaded_at').first()
-    
-    # Extract grades from stock point file
-    if stock_point_file and stock_point_file.extracted_data:
-        for item in stock_point_file.extracted_data.get('data', []):
-            if item.get('location', '').strip().lower() == location.strip().lower():
-                for product in item.get('products', []):
-                    if product.get('product_code'):
-                        grades.add(product['product_code'])
-    
-    # Extract grades from ex-work file
-    if ex_work_file and ex_work_file.extracted_data:
-        for item in ex_work_file.extracted_data.get('data', []):
-            item_location = item.get('location') or item.get('location_grade')
-            if item_location and item_location.strip().lower() == location.strip().lower():
-                for product in item.get('products', []):
-                    if product.get('product_code'):
-                        grades.add(product['product_code'])
+    # The location's products in the current stock point and ex-work files
+    for file_type in ['stock_point_file', 'ex_work_file']:
+        for item in get_pricing_index(file_type).items_at(location):
+            for product in item['products']:
+                if product.get('product_code'):
+                    grades.add(product['product_code'])
     
     return sorted(list(grades))
 
@@ -733,49 +786,27 @@ def get_location_info_internal(location, grade):
         'ex_work_data': []
     }
     
-    # Get the most recent files
-    stock_point_file = PDFUpload.objects.filter(
-        file_type='stock_point_file',
-        extracted_data__isnull=False
-    ).order_by('-uploaded_at').first()
-    
-    ex_work_file = PDFUpload.objects.filter(
-        file_type='ex_work_file',
-        extracted_data__isnull=False
-    ).order_by('-uploaded_at').first()
-    
-    # Extract info from stock point file
-    if stock_point_file and stock_point_file.extracted_data:
-        for item in stock_point_file.extracted_data.get('data', []):
-            if item.get('location', '').strip().lower() == location.strip().lower():
-                for product in item.get('products', []):
-                    if product.get('product_code') == grade:
-                        info['stock_point_data'].append({
-                            'sap_code': item.get('sap_code'),
-                            'price': product.get('price'),
-                            'freight_amount': item.get('freight_amount')
-                        })
-    
-    # Extract info from ex-work file
-    if ex_work_file and ex_work_file.extracted_data:
-        for item in ex_work_file.extracted_data.get('data', []):
-            item_location = item.get('location') or item.get('location_grade')
-            if item_location and item_location.strip().lower() == location.strip().lower():
-                for product in item.get('products', []):
-                    if product.get('product_code') == grade:
-                        info['ex_work_data'].append({
-                            'sap_code': item.get('sap_code'),
-                            'price': product.get('price'),
-                            'freight_amount': item.get('freight_amount')
-                        })
+    # The grade's prices at the location in the current stock point and ex-work files
+    for file_type, info_key in [('stock_point_file', 'stock_point_data'), ('ex_work_file', 'ex_work_data')]:
+        for item in get_pricing_index(file_type).items_at(location):
+            for product in item['products']:
+                if product.get('product_code') == grade:
+                    info[info_key].append({
+                        'sap_code': item['sap_code'],
+                        'price': product.get('price'),
+                        'freight_amount': item['freight_amount']
+                    })
     
     return info
 
 # Keep the existing endpoints for backward compatibility
+@condition_on_datasets(excel_data_datasets, vary_encoding=True)
 @api_view(['GET'])
+@serve_rendered_payload('excel-data', excel_data_datasets)
 def get_excel_data(request):
     """
     Fetch data from Excel uploads.
+    With stream=true the response is streamed as it is encoded.
     """
     file_type = request.query_params.get('file_type', 'cross_reference')
     upload_id = request.query_params.get('upload_id')
@@ -793,15 +824,22 @@ def get_excel_data(request):
         if not excel_upload:
             return Response({'error': 'No Excel file found'}, status=status.HTTP_404_NOT_FOUND)
             
+        if wants_stream(request):
+            return StreamingJSONResponse(excel_upload.extracted_data, status=status.HTTP_200_OK)
         return Response(excel_upload.extracted_data, status=status.HTTP_200_OK)
     except ExcelUpload.DoesNotExist:
         return Response({'error': 'Excel file not found'}, status=status.HTTP_404_NOT_FOUND)
 
+@condition_on_datasets(CROSS_REFERENCE_DATASETS)
 @api_view(['GET'])
+@resolves_as_of
 def cross_reference_query(request):
     """
     Query cross-reference data to find equivalent grades.
     (Legacy endpoint - maintained for backward compatibility)
+    
+    Query parameters:
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
     """
     gail_grade = request.query_params.get('gail_grade')
     competitor_name = request.query_params.get('competitor_name')
@@ -812,48 +850,17 @@ def cross_reference_query(request):
             'error': 'gail_grade and competitor_name are required parameters'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Build query
-    query = Q(gail_grade__iexact=gail_grade) & Q(competitor_name__iexact=competitor_name)
-    
-    # Get active cross-references and exclude invalid entries
-    cross_references = CrossReference.objects.filter(
-        query,
-        excel_upload__is_active=True
-    ).exclude(
-        competitor_grade__iexact='No equivalent'
-    ).exclude(
-        competitor_grade__isnull=True
-    ).exclude(
-        competitor_grade__exact=''
-    ).exclude(
-        competitor_grade__iexact='(blank)'
-    ).distinct()
-    
-    if not cross_references.exists():
-        # Try fuzzy matching for GAIL grade
-        fuzzy_query = Q(gail_grade__icontains=gail_grade) & Q(competitor_name__iexact=competitor_name)
-        
-        cross_references = CrossReference.objects.filter(
-            fuzzy_query,
-            excel_upload__is_active=True
-        ).exclude(
-            competitor_grade__iexact='No equivalent'
-        ).exclude(
-            competitor_grade__isnull=True
-        ).exclude(
-            competitor_grade__exact=''
-        ).exclude(
-            competitor_grade__iexact='(blank)'
-        ).distinct()
-    
-    if cross_references.exists():
-        equivalent_grades = list(cross_references.values_list('competitor_grade', flat=True))
-        
+    # Resolve the GAIL grade (exactly, or fuzzily) against the active cross-references
+    snapshot = cross_reference_snapshot_as_of(request)
+    resolution, equivalent_grades = resolve_equivalent_grades(snapshot, gail_grade, competitor_name)
+    
+    if equivalent_grades:
         response_data = {
             'gail_grade': gail_grade,
             'competitor_name': competitor_name,
             'equivalent_grades': equivalent_grades,
-            'total_matches': len(equivalent_grades)
+            'total_matches': len(equivalent_grades),
+            **grade_resolution_fields(resolution)
         }
         
         if location:
@@ -866,19 +873,24 @@ def cross_reference_query(request):
             'gail_grade': gail_grade,
             'competitor_name': competitor_name,
             'equivalent_grades': [],
-            'total_matches': 0
+            'total_matches': 0,
+            **grade_resolution_fields(resolution)
         }, status=status.HTTP_404_NOT_FOUND)
 
+@condition_on_datasets(CROSS_REFERENCE_DATASETS)
 @api_view(['GET'])
+@resolves_as_of
 def get_companies_list(request):
     """
     Get list of all competitor companies in the active cross-reference data.
+    
+    Query parameters:
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
     """
     try:
-        # Get active cross-reference upload
+        # Get active (or as_of) cross-reference upload
         active_upload = ExcelUpload.objects.filter(
-            file_type='cross_reference',
-            is_active=True
+            id=request.cross_reference_upload_id
         ).first()
         
         if not active_upload or not active_upload.extracted_data:
@@ -894,18 +906,19 @@ def get_companies_list(request):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@condition_on_datasets(CROSS_REFERENCE_DATASETS)
 @api_view(['GET'])
+@resolves_as_of
 def get_gail_grades_list(request):
     """
     Get list of all GAIL grades in the active cross-reference data.
+    
+    Query parameters:
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
     """
     try:
-        # Get from database for faster access
-        gail_grades = CrossReference.objects.filter(
-            excel_upload__is_active=True
-        ).values_list('gail_grade', flat=True).distinct()
-        
-        gail_grades_list = sorted(list(gail_grades))
+        # Served from the worker's in-memory snapshot
+        gail_grades_list = list(cross_reference_snapshot_as_of(request).gail_grades)
         
         return Response({
             'gail_grades': gail_grades_list,
@@ -915,50 +928,72 @@ def get_gail_grades_list(request):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@condition_on_datasets(CROSS_REFERENCE_DATASETS)
 @api_view(['GET'])
+@resolves_as_of
 def search_cross_reference(request):
     """
     Advanced search for cross-reference data with multiple filters.
+    
+    Query parameters:
+    - gail_grade, competitor_name, competitor_grade, location: Substring filters (optional)
+    - q: Substring to match in any of those fields (optional)
+    - limit: Page size (default: 100, max: 500)
+    - cursor: next_cursor from the previous page (optional)
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional);
+      410 if that version was compacted into an archive
     """
     # Get query parameters
     gail_grade = request.query_params.get('gail_grade')
     competitor_name = request.query_params.get('competitor_name')
     competitor_grade = request.query_params.get('competitor_grade')
     location = request.query_params.get('location')
+    q = request.query_params.get('q')
     
-    # Build query
-    query = Q(excel_upload__is_active=True)
-    
-    if gail_grade:
-        query &= Q(gail_grade__icontains=gail_grade)
-    if competitor_name:
-        query &= Q(competitor_name__icontains=competitor_name)
-    if competitor_grade:
-        query &= Q(competitor_grade__icontains=competitor_grade)
-    if location:
-        query &= Q(location__icontains=location)
+    try:
+        limit = int(request.query_params.get('limit', DEFAULT_SEARCH_LIMIT))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Execute query
-    cross_references = CrossReference.objects.filter(query)[:100]  # Limit to 100 results
+    # Compacted uploads have no rows in the full-text index: they must be restored to be searched
+    upload_id = request.cross_reference_upload_id
+    if upload_id and CrossReferenceArchive.objects.filter(excel_upload_id=upload_id).exists():
+        return Response({
+            'error': f'Cross-reference upload {upload_id} is archived and cannot be searched',
+            'suggestion': f'Restore it with: python manage.py compact_cross_references --restore {upload_id}'
+        }, status=status.HTTP_410_GONE)
     
-    # Serialize results
-    serializer = CrossReferenceSerializer(cross_references, many=True)
+    # Ranked search over the full-text index, one keyset page at a time
+    try:
+        results, next_cursor = search_cross_references({
+            'gail_grade': gail_grade,
+            'competitor_name': competitor_name,
+            'competitor_grade': competitor_grade,
+            'location': location,
+            'q': q
+        }, cursor=request.query_params.get('cursor'), limit=limit, upload_id=upload_id)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
     return Response({
-        'results': serializer.data,
-        'total_results': len(serializer.data),
+        'results': results,
+        'total_results': len(results),
+        'next_cursor': next_cursor,
         'filters_applied': {
             'gail_grade': gail_grade,
             'competitor_name': competitor_name,
             'competitor_grade': competitor_grade,
-            'location': location
+            'location': location,
+            'q': q
         }
     }, status=status.HTTP_200_OK)
 
 
 # Add this function to your views.py file (anywhere after the imports)
 
+@condition_on_datasets(CROSS_REFERENCE_PRICING_DATASETS)
 @api_view(['GET'])
+@resolves_as_of
 def cross_reference_with_competitor_pricing(request):
     """
     Get competitor grades with their actual prices at specified location.
@@ -968,6 +1003,7 @@ def cross_reference_with_competitor_pricing(request):
     - gail_grade: GAIL product code (required) 
     - file_source: 'stock_point' or 'ex_work' (optional, defaults to 'stock_point')
     - competitor: Specific competitor (optional, returns all if not specified)
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
     """
     location = request.query_params.get('location')
     gail_grade = request.query_params.get('gail_grade')
@@ -981,23 +1017,16 @@ def cross_reference_with_competitor_pricing(request):
     
     try:
         # Step 1: Get cross-reference data (GAIL grade → competitor grades)
-        cross_references = CrossReference.objects.filter(
-            gail_grade__iexact=gail_grade.strip(),
-            excel_upload__is_active=True
-        ).exclude(
-            competitor_grade__iexact='No equivalent'
-        ).exclude(
-            competitor_grade__isnull=True
-        ).exclude(
-            competitor_grade__exact=''
-        ).exclude(
-            competitor_grade__iexact='(blank)'
-        )
-        
-        if competitor_filter:
-            cross_references = cross_references.filter(competitor_name__iexact=competitor_filter.strip())
-        
-        if not cross_references.exists():
+        # (from the snapshot, which also reads uploads whose rows were compacted into an archive)
+        snapshot = cross_reference_snapshot_as_of(request)
+        gail_grade_key = normalize_key(gail_grade)
+        cross_references = [
+            (competitor_name, competitor_grade)
+            for competitor_name, grades in snapshot.competitor_grades([gail_grade_key], competitor_filter).items()
+            for competitor_grade in grades
+        ]
+        
+        if not cross_references:
             return Response({
                 'error': 'No cross-reference data found',
                 'message': f'No competitor grades found for GAIL grade {gail_grade}'
@@ -1006,54 +1035,39 @@ def cross_reference_with_competitor_pricing(request):
         # Step 2: Get pricing data from stock point or ex work files
         file_type = 'stock_point_file' if file_source == 'stock_point' else 'ex_work_file'
         
-        pricing_file = PDFUpload.objects.filter(
-            file_type=file_type,
-            extracted_data__isnull=False
-        ).order_by('-uploaded_at').first()
+        pricing_index = get_pricing_index(file_type)
         
-        if not pricing_file or 'error' in pricing_file.extracted_data:
+        if not pricing_index.upload_id or pricing_index.extraction_failed:
             return Response({
                 'error': f'No valid {file_source} pricing data found',
                 'suggestion': f'Please upload a valid {file_type} PDF first'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Step 3: Find location data
-        location_data = None
-        for item in pricing_file.extracted_data.get('data', []):
-            item_location = item.get('location') or item.get('location_grade', '')
-            if item_location.strip().lower() == location.strip().lower():
-                location_data = item
-                break
+        # Step 3: Find location data (the first item at the location) in the location index
+        location_data = pricing_index.location_record(location)
         
         if not location_data:
             return Response({
                 'error': f'Location "{location}" not found in {file_source} data',
-                'available_locations': [
-                    item.get('location') or item.get('location_grade', '') 
-                    for item in pricing_file.extracted_data.get('data', [])
-                ]
+                'available_locations': list(pricing_index.locations)
             }, status=status.HTTP_404_NOT_FOUND)
         
         # Step 4: Build response with competitor grades and their prices
         competitors_with_pricing = []
         
-        for ref in cross_references:
-            competitor_grade = ref.competitor_grade.strip()
+        for competitor_name, competitor_grade in cross_references:
+            competitor_grade = competitor_grade.strip()
             
-            # Find the price of this competitor grade at the location
-            competitor_price = None
-            for product in location_data.get('products', []):
-                if product.get('product_code', '').strip().lower() == competitor_grade.lower():
-                    competitor_price = product.get('price')
-                    break
+            # The price of this competitor grade at the location
+            competitor_price = pricing_index.price(location, competitor_grade)
             
             competitor_info = {
-                'competitor_name': ref.competitor_name,
+                'competitor_name': competitor_name,
                 'competitor_grade': competitor_grade,
                 'competitor_price': competitor_price,
                 'competitor_price_formatted': f'₹{competitor_price:,}' if competitor_price else 'Price not available',
                 'price_available': competitor_price is not None,
-                'gail_grade': ref.gail_grade
+                'gail_grade': snapshot.grade_names[gail_grade_key]
             }
             
             competitors_with_pricing.append(competitor_info)
@@ -1083,9 +1097,9 @@ def cross_reference_with_competitor_pricing(request):
             'competitors': competitors_with_pricing,
             'summary': summary,
             'location_info': {
-                'sap_code': location_data.get('sap_code'),
-                'freight_amount': location_data.get('freight_amount'),
-                'total_products_at_location': len(location_data.get('products', []))
+                'sap_code': location_data['sap_code'],
+                'freight_amount': location_data['freight_amount'],
+                'total_products_at_location': len(location_data['products'])
             }
         }
         
@@ -1095,6 +1109,7 @@ def cross_reference_with_competitor_pricing(request):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
+@condition_on_datasets(FREIGHT_DATASETS)
 @api_view(['GET'])
 def debug_freight_matching(request):
     """
@@ -1146,93 +1161,73 @@ def debug_freight_matching(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@condition_on_datasets(CURRENT_UPLOAD_FILE_TYPES)
 @api_view(['GET'])
 def get_freight_coverage_report(request):
     """
-    Generate a coverage report showing which locations have freight data.
+    Coverage report showing which locations have freight data.
+    Served from the report materialized when freight is merged for the period.
+    
+    Query parameters:
+    - month, year: Period (required)
+    - status: 'matched' or 'unmatched' to return only those locations (optional)
+    - include_freight_locations: Include every destination of the freight file (default: false)
     """
     month = request.query_params.get('month')
     year = request.query_params.get('year')
+    coverage_status = request.query_params.get('status')
+    include_freight_locations = request.query_params.get('include_freight_locations', 'false').lower() == 'true'
     
     if not month or not year:
         return Response({
             'error': 'month and year are required parameters'
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    if coverage_status and coverage_status not in ('matched', 'unmatched'):
+        return Response({
+            'error': "status must be 'matched' or 'unmatched'"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
     try:
-        # Get all files for the month/year
-        stock_point_file = PDFUpload.objects.filter(
-            file_type='stock_point_file',
-            month=month,
-            year=year,
-            extracted_data__isnull=False
-        ).first()
-        
-        ex_work_file = PDFUpload.objects.filter(
-            file_type='ex_work_file',
-            month=month,
-            year=year,
-            extracted_data__isnull=False
-        ).first()
+        report = FreightCoverageReport.objects.filter(month=month, year=year).first()
+        if not report:
+            # Periods merged before reports were materialized are built on first request
+            report = save_freight_coverage_report(month, year)
         
-        freight_file = PDFUpload.objects.filter(
-            file_type='freight_file',
-            month=month,
-            year=year,
-            extracted_data__isnull=False
-        ).first()
-        
-        if not freight_file:
+        if not report:
             return Response({
                 'error': 'No freight file found',
                 'message': f'No freight file found for {month}/{year}'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Collect all locations from pricing files
-        all_locations = set()
-        
-        if stock_point_file and stock_point_file.extracted_data:
-            for item in stock_point_file.extracted_data.get('data', []):
-                if item.get('location'):
-                    all_locations.add(item['location'])
-        
-        if ex_work_file and ex_work_file.extracted_data:
-            for item in ex_work_file.extracted_data.get('data', []):
-                location = item.get('location') or item.get('location_grade')
-                if location:
-                    all_locations.add(location)
-        
-        # Check freight coverage
-        coverage_report = []
-        from .utils import enhanced_freight_matching
-        
-        for location in all_locations:
-            freight_match = enhanced_freight_matching(location, freight_file.extracted_data)
-            coverage_report.append({
-                'location': location,
-                'has_freight': freight_match is not None,
-                'freight_amount': freight_match.get('Amount') if freight_match else None,
-                'freight_details': freight_match if freight_match else None
-            })
-        
-        # Calculate statistics
-        total_locations = len(coverage_report)
-        locations_with_freight = sum(1 for item in coverage_report if item['has_freight'])
-        coverage_percentage = (locations_with_freight / total_locations * 100) if total_locations > 0 else 0
+        coverage_locations = report.locations.all()
+        if coverage_status:
+            coverage_locations = coverage_locations.filter(has_freight=coverage_status == 'matched')
         
         response_data = {
             'month': month,
             'year': year,
             'summary': {
-                'total_locations': total_locations,
-                'locations_with_freight': locations_with_freight,
-                'locations_without_freight': total_locations - locations_with_freight,
-                'coverage_percentage': round(coverage_percentage, 2)
+                'total_locations': report.total_locations,
+                'locations_with_freight': report.locations_with_freight,
+                'locations_without_freight': report.locations_without_freight,
+                'coverage_percentage': report.coverage_percentage
             },
-            'coverage_details': coverage_report,
-            'freight_locations_available': list(freight_file.extracted_data.keys())
+            'status_filter': coverage_status,
+            'coverage_details': list(coverage_locations.values('location', 'has_freight', 'freight_amount', 'freight_details')),
+            'generated_at': report.generated_at.isoformat()
         }
         
+        if include_freight_locations:
+            freight_locations = list(
+                FreightRate.objects.filter(pdf_upload_id=report.freight_upload_id).order_by('id').values_list('destination', flat=True)
+            )
+            if not freight_locations:
+                # Freight files uploaded before the rate history have no FreightRate rows
+                freight_data = PDFUpload.objects.filter(pk=report.freight_upload_id).values_list('extracted_data', flat=True).first()
+                freight_locations = list(freight_data) if isinstance(freight_data, dict) else []
+            response_data['freight_locations_available'] = freight_locations
+        
         return Response(response_data, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -1267,7 +1262,13 @@ def test_freight_extraction(request):
             
             # Test extraction
             from .utils import extract_freight
-            freight_data = extract_freight(temp_file_path)
+            workers = request.data.get('workers')
+            page_timings = []
+            freight_data = extract_freight(
+                temp_file_path,
+                workers=workers or None,
+                page_timings=page_timings
+            )
             
             # Clean up temporary file
             os.unlink(temp_file_path)
@@ -1301,7 +1302,8 @@ def test_freight_extraction(request):
                     'max_amount': max(amounts) if amounts else None,
                     'avg_amount': round(sum(amounts) / len(amounts), 2) if amounts else None
                 },
-                'freight_data_sample': {k: v for i, (k, v) in enumerate(freight_data.items()) if i < 5}  # First 5 entries
+                'freight_data_sample': {k: v for i, (k, v) in enumerate(freight_data.items()) if i < 5},  # First 5 entries
+                'page_timings': page_timings
             }
             
             return Response(response_data, status=status.HTTP_200_OK)
@@ -1314,7 +1316,9 @@ def test_freight_extraction(request):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
+@condition_on_datasets(CROSS_REFERENCE_PRICING_DATASETS)
 @api_view(['GET'])
+@resolves_as_of
 def enhanced_cross_reference_with_competitor_pricing(request):
     """
     Enhanced version that fetches competitor grades with their actual prices 
@@ -1325,6 +1329,7 @@ def enhanced_cross_reference_with_competitor_pricing(request):
     - gail_grade: GAIL product code (required)
     - include_both_sources: Include both stock_point and ex_work data (default: true)
     - competitor: Specific competitor (optional)
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
     """
     location = request.query_params.get('location')
     gail_grade = request.query_params.get('gail_grade')
@@ -1338,64 +1343,31 @@ def enhanced_cross_reference_with_competitor_pricing(request):
     
     try:
         # Step 1: Get cross-reference data
-        cross_references = CrossReference.objects.filter(
-            gail_grade__iexact=gail_grade.strip(),
-            excel_upload__is_active=True
-        ).exclude(
-            competitor_grade__iexact='No equivalent'
-        ).exclude(
-            competitor_grade__isnull=True
-        ).exclude(
-            competitor_grade__exact=''
-        ).exclude(
-            competitor_grade__iexact='(blank)'
-        )
-        
-        if competitor_filter:
-            cross_references = cross_references.filter(competitor_name__iexact=competitor_filter.strip())
-        
-        if not cross_references.exists():
+        # (from the snapshot, which also reads uploads whose rows were compacted into an archive)
+        snapshot = cross_reference_snapshot_as_of(request)
+        gail_grade_key = normalize_key(gail_grade)
+        cross_references = [
+            (competitor_name, competitor_grade)
+            for competitor_name, grades in snapshot.competitor_grades([gail_grade_key], competitor_filter).items()
+            for competitor_grade in grades
+        ]
+        
+        if not cross_references:
             return Response({
                 'error': 'No cross-reference data found',
                 'message': f'No competitor grades found for GAIL grade {gail_grade}'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Step 2: Get pricing data from both stock point and ex-work files
-        stock_point_file = PDFUpload.objects.filter(
-            file_type='stock_point_file',
-            extracted_data__isnull=False
-        ).order_by('-uploaded_at').first()
-        
-        ex_work_file = PDFUpload.objects.filter(
-            file_type='ex_work_file',
-            extracted_data__isnull=False
-        ).order_by('-uploaded_at').first()
-        
-        # Step 3: Find location data in both files
-        def find_location_data(pricing_file, location):
-            if not pricing_file or 'error' in pricing_file.extracted_data:
-                return None
-                
-            for item in pricing_file.extracted_data.get('data', []):
-                item_location = item.get('location') or item.get('location_grade', '')
-                if item_location.strip().lower() == location.strip().lower():
-                    return item
-            return None
+        # Step 2: Location indexes of the current stock point and ex-work files
+        stock_point_index = get_pricing_index('stock_point_file')
+        ex_work_index = get_pricing_index('ex_work_file')
         
-        stock_point_data = find_location_data(stock_point_file, location) if stock_point_file else None
-        ex_work_data = find_location_data(ex_work_file, location) if ex_work_file else None
+        # Step 3: Find location data (the first item at the location) in both files
+        stock_point_data = stock_point_index.location_record(location)
+        ex_work_data = ex_work_index.location_record(location)
         
         if not stock_point_data and not ex_work_data:
-            available_locations = []
-            if stock_point_file:
-                available_locations.extend([
-                    item.get('location', '') for item in stock_point_file.extracted_data.get('data', [])
-                ])
-            if ex_work_file:
-                available_locations.extend([
-                    item.get('location') or item.get('location_grade', '') 
-                    for item in ex_work_file.extracted_data.get('data', [])
-                ])
+            available_locations = stock_point_index.locations + ex_work_index.locations
             
             return Response({
                 'error': f'Location "{location}" not found in any pricing data',
@@ -1405,24 +1377,12 @@ def enhanced_cross_reference_with_competitor_pricing(request):
         # Step 4: Build enhanced response with competitor grades and their prices
         competitors_with_pricing = []
         
-        for ref in cross_references:
-            competitor_grade = ref.competitor_grade.strip()
-            
-            # Find prices in both stock point and ex-work data
-            stock_point_price = None
-            ex_work_price = None
+        for competitor_name, competitor_grade in cross_references:
+            competitor_grade = competitor_grade.strip()
             
-            if stock_point_data:
-                for product in stock_point_data.get('products', []):
-                    if product.get('product_code', '').strip().lower() == competitor_grade.lower():
-                        stock_point_price = product.get('price')
-                        break
-            
-            if ex_work_data:
-                for product in ex_work_data.get('products', []):
-                    if product.get('product_code', '').strip().lower() == competitor_grade.lower():
-                        ex_work_price = product.get('price')
-                        break
+            # Prices in both stock point and ex-work data
+            stock_point_price = stock_point_index.price(location, competitor_grade)
+            ex_work_price = ex_work_index.price(location, competitor_grade)
             
             # Calculate landed costs if freight is available
             stock_point_landed_cost = None
@@ -1435,9 +1395,9 @@ def enhanced_cross_reference_with_competitor_pricing(request):
                 ex_work_landed_cost = ex_work_price + ex_work_data['freight_amount']
             
             competitor_info = {
-                'competitor_name': ref.competitor_name,
+                'competitor_name': competitor_name,
                 'competitor_grade': competitor_grade,
-                'gail_grade': ref.gail_grade,
+                'gail_grade': snapshot.grade_names[gail_grade_key],
                 'pricing_data': {
                     'stock_point': {
                         'price': stock_point_price,
@@ -1504,13 +1464,13 @@ def enhanced_cross_reference_with_competitor_pricing(request):
             'data_sources': {
                 'stock_point_file': {
                     'available': stock_point_data is not None,
-                    'file_id': stock_point_file.id if stock_point_file else None,
+                    'file_id': stock_point_index.upload_id,
                     'sap_code': stock_point_data.get('sap_code') if stock_point_data else None,
                     'freight_amount': stock_point_data.get('freight_amount') if stock_point_data else None
                 },
                 'ex_work_file': {
                     'available': ex_work_data is not None,
-                    'file_id': ex_work_file.id if ex_work_file else None,
+                    'file_id': ex_work_index.upload_id,
                     'sap_code': ex_work_data.get('sap_code') if ex_work_data else None,
                     'freight_amount': ex_work_data.get('freight_amount') if ex_work_data else None
                 }
@@ -1523,7 +1483,9 @@ def enhanced_cross_reference_with_competitor_pricing(request):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@condition_on_datasets(CROSS_REFERENCE_PRICING_DATASETS)
 @api_view(['GET'])
+@resolves_as_of
 def enhanced_get_competitors_for_grade(request):
     """
     Enhanced version that includes pricing availability for each competitor.
@@ -1532,6 +1494,7 @@ def enhanced_get_competitors_for_grade(request):
     - grade: Product code (required)
     - location: Location to check pricing availability (optional)
     - include_pricing_summary: Include pricing summary (default: true)
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
     """
     grade = request.query_params.get('grade')
     location = request.query_params.get('location')
@@ -1541,77 +1504,18 @@ def enhanced_get_competitors_for_grade(request):
         return Response({'error': 'grade parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        # Get competitors that have valid mappings for this grade
-        competitors_query = CrossReference.objects.filter(
-            gail_grade__iexact=grade.strip(),
-            excel_upload__is_active=True
-        ).exclude(
-            competitor_grade__iexact='No equivalent'
-        ).exclude(
-            competitor_grade__isnull=True
-        ).exclude(
-            competitor_grade__exact=''
-        ).exclude(
-            competitor_grade__iexact='(blank)'
-        ).values('competitor_name', 'competitor_grade').distinct()
-        
-        if not competitors_query:
-            # Try fuzzy matching
-            competitors_query = CrossReference.objects.filter(
-                gail_grade__icontains=grade.strip(),
-                excel_upload__is_active=True
-            ).exclude(
-                competitor_grade__iexact='No equivalent'
-            ).exclude(
-                competitor_grade__isnull=True
-            ).exclude(
-                competitor_grade__exact=''
-            ).exclude(
-                competitor_grade__iexact='(blank)'
-            ).values('competitor_name', 'competitor_grade').distinct()
-        
-        # Group by competitor
-        competitors_data = {}
-        for item in competitors_query:
-            competitor = item['competitor_name']
-            grade_mapping = item['competitor_grade']
-            
-            if competitor not in competitors_data:
-                competitors_data[competitor] = []
-            competitors_data[competitor].append(grade_mapping)
+        # Competitors that have valid mappings for this grade (resolved exactly or fuzzily), grouped by competitor
+        snapshot = cross_reference_snapshot_as_of(request)
+        resolution = snapshot.resolve_grade(grade)
+        competitors_data = snapshot.competitor_grades(resolution.grade_keys)
         
         # Enhanced response with pricing availability
         enhanced_competitors = []
         
         if include_pricing_summary and location:
-            # Get pricing files
-            stock_point_file = PDFUpload.objects.filter(
-                file_type='stock_point_file',
-                extracted_data__isnull=False
-            ).order_by('-uploaded_at').first()
-            
-            ex_work_file = PDFUpload.objects.filter(
-                file_type='ex_work_file',
-                extracted_data__isnull=False
-            ).order_by('-uploaded_at').first()
-            
-            # Find location data
-            def find_location_products(pricing_file, location):
-                if not pricing_file or 'error' in pricing_file.extracted_data:
-                    return []
-                    
-                for item in pricing_file.extracted_data.get('data', []):
-                    item_location = item.get('location') or item.get('location_grade', '')
-                    if item_location.strip().lower() == location.strip().lower():
-                        return item.get('products', [])
-                return []
-            
-            stock_point_products = find_location_products(stock_point_file, location) if stock_point_file else []
-            ex_work_products = find_location_products(ex_work_file, location) if ex_work_file else []
-            
-            # Create product code lookup for faster access
-            stock_point_codes = {p.get('product_code', '').strip().lower(): p.get('price') for p in stock_point_products}
-            ex_work_codes = {p.get('product_code', '').strip().lower(): p.get('price') for p in ex_work_products}
+            # Location indexes of the current pricing files
+            stock_point_index = get_pricing_index('stock_point_file')
+            ex_work_index = get_pricing_index('ex_work_file')
             
             for competitor, grades in competitors_data.items():
                 pricing_info = {
@@ -1622,9 +1526,8 @@ def enhanced_get_competitors_for_grade(request):
                 }
                 
                 for competitor_grade in grades:
-                    grade_lower = competitor_grade.strip().lower()
-                    stock_price = stock_point_codes.get(grade_lower)
-                    ex_work_price = ex_work_codes.get(grade_lower)
+                    stock_price = stock_point_index.price(location, competitor_grade)
+                    ex_work_price = ex_work_index.price(location, competitor_grade)
                     
                     if stock_price:
                         pricing_info['stock_point_available'] += 1
@@ -1662,6 +1565,7 @@ def enhanced_get_competitors_for_grade(request):
             'location': location,
             'competitors': enhanced_competitors,
             'total_competitors': len(enhanced_competitors),
+            **grade_resolution_fields(resolution),
             'summary': {
                 'total_unique_grades': sum(len(comp['competitor_grades']) for comp in enhanced_competitors),
                 'location_specified': location is not None,
@@ -1689,4 +1593,237 @@ def enhanced_get_competitors_for_grade(request):
         return Response(response_data, status=status.HTTP_200_OK)
         
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@condition_on_datasets(CROSS_REFERENCE_PRICING_DATASETS)
+@api_view(['GET'])
+@resolves_as_of
+def gail_equivalents_for_competitor_grade(request):
+    """
+    Reverse cross-reference lookup: the GAIL grades equivalent to a competitor's grade,
+    with their current prices at a location.
+    
+    Query parameters:
+    - competitor_grade: Competitor's grade, e.g. H110MA (required)
+    - competitor: Competitor company name (optional)
+    - location: Location to price the GAIL grades at (optional)
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
+    """
+    competitor_grade = request.query_params.get('competitor_grade')
+    competitor = request.query_params.get('competitor')
+    location = request.query_params.get('location')
+    
+    if not competitor_grade:
+        return Response({'error': 'competitor_grade parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # One lookup in the reverse index of the active cross-reference snapshot
+        equivalents = cross_reference_snapshot_as_of(request).gail_equivalents(competitor_grade, competitor)
+        
+        if not equivalents:
+            return Response({
+                'message': 'No GAIL equivalents found for this competitor grade',
+                'competitor_grade': competitor_grade,
+                'competitor': competitor,
+                'gail_equivalents': [],
+                'total_matches': 0
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # Location indexes of the current pricing files, and the location's item in each
+        pricing_indexes = {}
+        location_pricing = {}
+        if location:
+            for file_type in ['stock_point_file', 'ex_work_file']:
+                pricing_indexes[file_type] = get_pricing_index(file_type)
+                location_pricing[file_type] = pricing_indexes[file_type].location_record(location)
+        
+        gail_equivalents = []
+        for competitor_name, mapped_competitor_grade, gail_grade in equivalents:
+            equivalent = {
+                'gail_grade': gail_grade,
+                'competitor_name': competitor_name,
+                'competitor_grade': mapped_competitor_grade
+            }
+            if location:
+                pricing_data = {}
+                for source, file_type in [('stock_point', 'stock_point_file'), ('ex_work', 'ex_work_file')]:
+                    location_data = location_pricing[file_type]
+                    price = pricing_indexes[file_type].price(location, gail_grade)
+                    freight_amount = location_data['freight_amount'] if location_data else None
+                    pricing_data[source] = {
+                        'price': price,
+                        'freight_amount': freight_amount,
+                        'landed_cost': price + freight_amount if price and freight_amount else None,
+                        'sap_code': location_data['sap_code'] if location_data else None,
+                        'available': price is not None
+                    }
+                equivalent['pricing_data'] = pricing_data
+            gail_equivalents.append(equivalent)
+        
+        response_data = {
+            'competitor_grade': competitor_grade,
+            'competitor': competitor,
+            'gail_equivalents': gail_equivalents,
+            'total_matches': len(gail_equivalents)
+        }
+        
+        if location:
+            response_data['location'] = location
+            response_data['location_found'] = any(location_pricing.values())
+        
+        return Response(response_data, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Most (gail_grade, competitor, location) items accepted by one batch request
+CROSS_REFERENCE_BATCH_LIMIT = 1000
+
+@api_view(['POST'])
+@resolves_as_of
+def cross_reference_batch(request):
+    """
+    Resolve many cross-reference queries in one request, e.g. every cell of a comparison table.
+    
+    Request body (JSON):
+    - queries: List of {"gail_grade": ..., "competitor": ..., "location": ... (optional)}
+    - as_of: Cross-reference upload id, or YYYY-MM-DD date, to query a past version (optional)
+    
+    Results are keyed by "gail_grade|competitor|location" (location empty when not given);
+    items with no equivalent grades are marked "found": false.
+    """
+    queries = request.data.get('queries')
+    
+    if not isinstance(queries, list) or not queries:
+        return Response({'error': 'queries must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(queries) > CROSS_REFERENCE_BATCH_LIMIT:
+        return Response({
+            'error': f'At most {CROSS_REFERENCE_BATCH_LIMIT} queries per batch'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        snapshot = cross_reference_snapshot_as_of(request)
+        
+        # Location indexes of the current pricing files, shared by the whole batch
+        pricing_indexes = {file_type: get_pricing_index(file_type) for file_type in ['stock_point_file', 'ex_work_file']}
+        
+        results = {}
+        for query in queries:
+            if not isinstance(query, dict) or not query.get('gail_grade') or not query.get('competitor'):
+                results[str(query)] = {'found': False, 'error': 'gail_grade and competitor are required'}
+                continue
+            
+            grade = str(query['gail_grade'])
+            competitor = str(query['competitor'])
+            location = query.get('location')
+            key = f"{grade}|{competitor}|{location or ''}"
+            if key in results:
+                continue
+            
+            resolution, equivalent_grades = resolve_equivalent_grades(snapshot, grade, competitor)
+            result = {
+                'gail_grade': grade,
+                'competitor_name': competitor,
+                'location': location,
+                'found': bool(equivalent_grades),
+                'equivalent_grades': equivalent_grades,
+                'total_matches': len(equivalent_grades),
+                **grade_resolution_fields(resolution)
+            }
+            
+            if location:
+                # Same shape as get_location_info_internal(), from the location indexes
+                location_info = {}
+                for file_type, info_key in [('stock_point_file', 'stock_point_data'), ('ex_work_file', 'ex_work_data')]:
+                    location_info[info_key] = [
+                        {
+                            'sap_code': item['sap_code'],
+                            'price': product.get('price'),
+                            'freight_amount': item['freight_amount']
+                        }
+                        for item in pricing_indexes[file_type].items_at(str(location))
+                        for product in item['products']
+                        if product.get('product_code') == grade
+                    ]
+                result['location_available'] = bool(location_info['stock_point_data'] or location_info['ex_work_data'])
+                result['location_info'] = location_info
+            
+            results[key] = result
+        
+        total_found = sum(1 for result in results.values() if result['found'])
+        return Response({
+            'results': results,
+            'total_queries': len(queries),
+            'total_found': total_found,
+            'total_not_found': len(results) - total_found
+        }, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@condition_on_datasets(CROSS_REFERENCE_DATASETS)
+@api_view(['GET'])
+def cross_reference_diff(request):
+    """
+    What changed between two cross-reference uploads, per GAIL grade and competitor.
+    
+    Query parameters:
+    - to_upload_id: The newer upload (default: the active one)
+    - from_upload_id: The older upload (default: the upload before to_upload_id)
+    - gail_grade: Only this GAIL grade (optional)
+    - competitor: Only this competitor (optional)
+    """
+    to_upload_id = request.query_params.get('to_upload_id') or get_active_version_id(CROSS_REFERENCE)
+    from_upload_id = request.query_params.get('from_upload_id')
+    gail_grade_filter = normalize_key(request.query_params.get('gail_grade'))
+    competitor_filter = normalize_key(request.query_params.get('competitor'))
+    
+    try:
+        if not to_upload_id:
+            return Response({'error': 'No active cross-reference data found'}, status=status.HTTP_404_NOT_FOUND)
+        to_upload = ExcelUpload.objects.only('id', 'uploaded_at').get(id=to_upload_id, file_type='cross_reference')
+        
+        if from_upload_id:
+            from_upload = ExcelUpload.objects.only('id', 'uploaded_at').get(id=from_upload_id, file_type='cross_reference')
+        else:
+            from_upload = ExcelUpload.objects.only('id', 'uploaded_at').filter(
+                file_type='cross_reference',
+                uploaded_at__lt=to_upload.uploaded_at
+            ).order_by('-uploaded_at').first()
+            if not from_upload:
+                return Response({
+                    'error': 'No earlier cross-reference upload to compare with',
+                    'to_upload_id': to_upload.id
+                }, status=status.HTTP_404_NOT_FOUND)
+    except (ExcelUpload.DoesNotExist, ValueError):
+        return Response({'error': 'Cross-reference upload not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        changes, counts = diff_cross_reference_uploads(from_upload.id, to_upload.id)
+        
+        # Group by GAIL grade, then competitor (the changes come sorted)
+        grouped_changes = {}
+        for (gail_grade, competitor_name), change in changes.items():
+            if gail_grade_filter and normalize_key(gail_grade) != gail_grade_filter:
+                continue
+            if competitor_filter and normalize_key(competitor_name) != competitor_filter:
+                continue
+            grouped_changes.setdefault(gail_grade, {})[competitor_name] = change
+        
+        return Response({
+            'from_upload': {'id': from_upload.id, 'uploaded_at': from_upload.uploaded_at},
+            'to_upload': {'id': to_upload.id, 'uploaded_at': to_upload.uploaded_at},
+            'summary': {
+                'added_mappings': counts['added'],
+                'removed_mappings': counts['removed'],
+                'changed_mappings': counts['changed'],
+                'unchanged_mappings': counts['unchanged'],
+                'grades_with_changes': len(grouped_changes)
+            },
+            'changes': grouped_changes
+        }, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
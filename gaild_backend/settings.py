@@ -168,6 +168,21 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Worker processes used to extract multi-page freight rate PDFs (1 = no process pool)
+FREIGHT_PDF_WORKERS = os.environ.get('FREIGHT_PDF_WORKERS', min(4, os.cpu_count() or 1))
+
+# Seconds a worker trusts its cached dataset versions before re-checking the database
+DATASET_VERSION_TTL = float(os.environ.get('DATASET_VERSION_TTL', 1.0))
+
+# Cross-reference snapshots (active and as_of uploads) each worker keeps in memory
+CROSS_REFERENCE_SNAPSHOT_CACHE_SIZE = int(os.environ.get('CROSS_REFERENCE_SNAPSHOT_CACHE_SIZE', 8))
+
+# Megabytes of rendered file-data, freight-data, excel-data and locations responses each worker keeps
+RENDERED_PAYLOAD_CACHE_MB = int(os.environ.get('RENDERED_PAYLOAD_CACHE_MB', 64))
+
+# Inactive cross-reference uploads kept hot by compact_cross_references; older ones are archived
+CROSS_REFERENCE_HOT_VERSIONS = int(os.environ.get('CROSS_REFERENCE_HOT_VERSIONS', 2))
+
 # Static files moved here on collectstatic command
 # STATIC_ROOT = "/var/www/gail-backend/static"
 MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')